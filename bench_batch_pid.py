@@ -0,0 +1,84 @@
+"""
+Benchmark the scalar `modules.PID.PID` against the vectorised `BatchPID`.
+
+For each channel count the script times one control step for all channels:
+- scalar: one `PID.__call__` per channel (one `time.monotonic` each),
+- batch: a single `BatchPID.__call__` over all channels.
+
+Usage
+-----
+    python bench_batch_pid.py --steps 2000 --channels 4 8 16 32 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Dict
+
+import numpy as np
+
+from modules.PID import PID
+from modules.batch_pid import BatchPID
+
+
+def _build(n_channels: int):
+    rng = random.Random(n_channels)
+    cfgs = [
+        dict(Kp=rng.uniform(-5, 5), Ki=rng.uniform(-50, 50), Kd=0.0,
+             setpoint=rng.uniform(400, 700), offset=rng.uniform(0, 2),
+             output_limits=(0.0, 10.0))
+        for _ in range(n_channels)
+    ]
+    scalars = [PID(sample_time=None, **cfg) for cfg in cfgs]
+    batch = BatchPID()
+    for cfg in cfgs:
+        batch.add(**cfg)
+    inputs = np.array([cfg["setpoint"] for cfg in cfgs])
+    return scalars, batch, inputs
+
+
+def time_step(n_channels: int, steps: int) -> Dict[str, float]:
+    """Return the mean time per full control step (all channels) in seconds."""
+    scalars, batch, inputs = _build(n_channels)
+    noise = np.random.default_rng(0).normal(0.0, 1e-5, size=(steps, n_channels))
+    samples = inputs + noise
+    samples_list = samples.tolist()
+
+    t0 = time.perf_counter()
+    for row in samples_list:
+        for pid, x in zip(scalars, row):
+            pid(x)
+    t_scalar = (time.perf_counter() - t0) / steps
+
+    t0 = time.perf_counter()
+    for row in samples:
+        batch(row)
+    t_batch = (time.perf_counter() - t0) / steps
+
+    return {"scalar_s": t_scalar, "batch_s": t_batch}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Scalar PID vs BatchPID step time.")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--channels", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    print(f"{'channels':>8} | {'scalar (us)':>11} | {'batch (us)':>10} | {'speed-up':>8}")
+    for n in args.channels:
+        res = time_step(n, args.steps)
+        print(
+            f"{n:8d} | {res['scalar_s']*1e6:11.1f} | {res['batch_s']*1e6:10.1f} | "
+            f"{res['scalar_s']/res['batch_s']:8.2f}"
+        )
+
+
+if __name__ == "__main__":  # pragma: no cover - manual execution
+    main()
+
+
+## AGENT_UPDATE
+# - Added `bench_batch_pid.py` to show how scalar PID and `BatchPID` step times scale
+#   from 4 to 64 channels.
@@ -0,0 +1,111 @@
+"""
+JSON throughput of the API responses: `lock_json` backends and the response cache.
+
+Part 1 serialises typical payloads (a trace as Python lists, the same trace as
+NumPy arrays, the config of all channels, the status) with every available
+`lock_json` backend. Part 2 calls /get/config, /get/status and /get/trace
+through the Flask test client of a local web_lock with simulated channels,
+with and without the response cache of `endpoint_action`.
+
+Usage
+-----
+    python bench_json.py --channels 8 --tracelen 2000 --repeat 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+from modules import lock_json
+
+
+def rate(func: Callable[[], Any], repeat: int) -> float:
+    """Calls per second of func."""
+    func()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return repeat/(time.perf_counter() - t0)
+
+
+def start_local_server(n_channels: int, tracelen: int):
+    """web_lock with n simulated channels and filled traces; the control thread is not started."""
+    import modules.lock_server as lock_server
+
+    lock_server.WavelengthMeter = lambda *args, **kwargs: None  # the benchmark never talks to the wavemeter
+    lck = lock_server.web_lock(sampling=0.01, file_config=os.path.abspath('config.json'))
+    for i in range(n_channels):
+        value = 400. + i
+        lck.cntrl.add('SIM%d' % i, lambda value=value: value + 1e-6*np.random.randn(),
+                      lambda new, last: new, active=True, lock_type=1, tracelen=tracelen)
+    for pid in lck.cntrl.pid_dict.values():
+        for _ in range(tracelen):
+            pid()
+    tc = lck.flsk.test_client()
+    with tc.session_transaction() as sess:
+        sess['logged_in'] = True
+    return lck, tc
+
+
+def bench_payloads(args, lck) -> None:
+    name = next(iter(lck.cntrl.pid_dict))
+    trace = lck.cntrl.get_trace(name)
+    payloads: Dict[str, Any] = {
+        'trace (lists)': trace,
+        'trace (numpy)': [np.asarray(v, dtype=float) for v in trace],
+        'config': lck.cntrl.get_config(),
+        'status': lck.cntrl.get_status(),
+    }
+    backends = list(lock_json.BACKENDS)
+    print('%-16s %10s  ' % ('payload', 'bytes') + '  '.join('%14s' % ('%s [1/s]' % b) for b in backends))
+    for label, payload in payloads.items():
+        size = len(lock_json.BACKENDS[backends[0]](payload))
+        rates = [rate(lambda f=lock_json.BACKENDS[b]: f(payload), args.repeat) for b in backends]
+        print('%-16s %10d  ' % (label, size) + '  '.join('%14.0f' % r for r in rates))
+
+
+def bench_endpoints(args, lck, tc) -> None:
+    name = next(iter(lck.cntrl.pid_dict))
+    requests = {'/get/config': None, '/get/status': None, '/get/trace': {'name': name}}
+    views = {rule.rule: lck.flsk.view_functions[rule.endpoint] for rule in lck.flsk.url_map.iter_rules()}
+    print('\nendpoints (%s)\n%-16s %14s %14s' % (lock_json.backend, 'endpoint', 'uncached [1/s]', 'cached [1/s]'))
+    for path, data in requests.items():
+        view = views[path]
+        cache_key = view.cache_key
+        view.cache_key = None
+        uncached = rate(lambda: tc.get(path, json=data), args.repeat)
+        view.cache_key = cache_key
+        cached = rate(lambda: tc.get(path, json=data), args.repeat) if cache_key is not None else float('nan')
+        print('%-16s %14.0f %14.0f' % (path, uncached, cached))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--channels', type=int, default=8)
+    parser.add_argument('--tracelen', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--backend', choices=list(lock_json.BACKENDS), default=lock_json.backend, help='backend of the endpoint benchmark')
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    lck, tc = start_local_server(args.channels, args.tracelen)
+    print('JSON backends: %s (default %s)\n' % (', '.join(lock_json.BACKENDS), lock_json.backend))
+    bench_payloads(args, lck)
+    lock_json.use(args.backend)
+    bench_endpoints(args, lck, tc)
+    lck.cntrl.stop()
+
+
+if __name__ == '__main__':
+    main()
+
+
+## AGENT_UPDATE
+# - Added a JSON throughput benchmark for the `lock_json` backends and the cached read-only endpoints.
+# - Reason: measure the effect of orjson and of the response cache on the API.
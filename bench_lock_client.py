@@ -0,0 +1,131 @@
+"""
+Benchmark the blocking `web_lock_client` against `async_lock_client`.
+
+Each round reads the status of every channel and writes every setpoint:
+- blocking: one request after the other on the pooled keep-alive session,
+- async: `get_channels` + `set_channels`, all requests of a round in flight at once.
+A third line counts /stream/values events received through `async_lock_client.sse_values`.
+
+By default a local server instance (waitress, like `flask_server.start`) with
+simulated channels is started in a temporary directory; --port benchmarks a
+running server instead (read-only channels are fine, setpoints are written back
+unchanged).
+
+Usage
+-----
+    python bench_lock_client.py --channels 8 --rounds 50
+    python bench_lock_client.py --port 8000 --password ... --names WMCH2 WMCH3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from modules.lock_client import web_lock_client
+from modules.lock_client_async import async_lock_client
+
+PASSWORD = 'balibali24'
+
+
+def start_local_server(n_channels: int, port: int, threads: int):
+    """web_lock with n simulated channels served by waitress; returns (web_lock, server, names)."""
+    from waitress import create_server
+
+    import modules.lock_server as lock_server
+
+    lock_server.WavelengthMeter = lambda *args, **kwargs: None  # the benchmark never talks to the wavemeter
+    lck = lock_server.web_lock(sampling=0.01)
+    names = ['SIM%d' % i for i in range(n_channels)]
+    for i, name in enumerate(names):
+        value = 400. + i
+        lck.cntrl.add(name, lambda value=value: value, lambda new, last: new, active=True, lock_type=1, tracelen=100)
+    threading.Thread(target=lck.cntrl.run, daemon=True).start()
+    server = create_server(lck.flsk, host='127.0.0.1', port=port, threads=threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    time.sleep(0.5)
+    return lck, server, names
+
+
+def bench_blocking(args, names: List[str], setpoints: Dict[str, float]) -> float:
+    c = web_lock_client(args.host, args.port, password=args.password, pool_size=len(names))
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for name in names:
+            c.get_status(name)
+        for name in names:
+            c.set_setpoint(name, setpoints[name])
+    dt = (time.perf_counter() - t0) / args.rounds
+    c.close()
+    return dt
+
+
+async def bench_async(args, names: List[str], setpoints: Dict[str, float]) -> float:
+    async with async_lock_client(args.host, args.port, password=args.password, pool_size=len(names)) as c:
+        t0 = time.perf_counter()
+        for _ in range(args.rounds):
+            await c.get_channels('status', names)
+            await c.set_channels('setpoint', setpoints)
+        return (time.perf_counter() - t0) / args.rounds
+
+
+async def bench_sse(args, seconds: float) -> int:
+    n = 0
+    async with async_lock_client(args.host, args.port, password=args.password) as c:
+        stream = c.sse_values()
+        t_end = time.perf_counter() + seconds
+        async for _ in stream:
+            n += 1
+            if time.perf_counter() > t_end:
+                break
+        await stream.aclose()
+    return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Blocking vs asyncio lock server client.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None, help='running server, default: start a local one')
+    parser.add_argument('--password', default=PASSWORD)
+    parser.add_argument('--names', nargs='+', default=None, help='channels of a running server')
+    parser.add_argument('--channels', type=int, default=8, help='simulated channels of the local server')
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        server, names = None, args.names
+        if args.port is None:
+            os.chdir(tmp)  # the local instance keeps its config, journal and archive in the cwd
+            args.port = 8765
+            lck, server, names = start_local_server(args.channels, args.port, threads=2*args.channels)
+        try:
+            c = web_lock_client(args.host, args.port, password=args.password)
+            names = names or list(c.get_list()[1])
+            setpoints = {name: c.get_parameter(name)[1].get('setpoint') or 0. for name in names}
+            c.close()
+
+            t_block = bench_blocking(args, names, setpoints)
+            t_async = asyncio.run(bench_async(args, names, setpoints))
+            print('%d channels, %d requests per round' % (len(names), 2*len(names)))
+            print('blocking: %8.2f ms per round' % (t_block*1e3))
+            print('async:    %8.2f ms per round  (%.1fx)' % (t_async*1e3, t_block/t_async))
+            print('sse:      %8d /stream/values events in 2 s' % asyncio.run(bench_sse(args, 2.)))
+        finally:
+            if server is not None:
+                lck.cntrl.stop()  # the waitress threads are daemons and end with the process
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':  # pragma: no cover - manual execution
+    main()
+
+
+## AGENT_UPDATE
+# - Added `bench_lock_client.py`: per-round latency of reading and setting all channels with the
+#   blocking client vs `async_lock_client`, against a local simulated server or a running one.
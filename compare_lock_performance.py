@@ -306,6 +306,105 @@ def compare_simulated(n_cycles: int = 100) -> Dict[str, Dict[str, float]]:
     }
 
 
+# ---------------------------------------------------------------------------
+# Restart benchmark (Controller + simulated laser)
+# ---------------------------------------------------------------------------
+
+
+class SimulatedLaser:
+    """
+    Free-running laser tuned by a piezo voltage: f = f_free + tuning * V + noise (THz).
+
+    `func_read` / `func_write` have the signatures expected by `Controller.add`.
+    """
+
+    def __init__(
+        self,
+        free_frequency_thz: float = 461.31247 + 50e-6,
+        tuning_thz_per_v: float = -10e-6,
+        noise_std_thz: float = 0.3e-6,
+    ) -> None:
+        self.free_frequency_thz = free_frequency_thz
+        self.tuning_thz_per_v = tuning_thz_per_v
+        self.noise_std_thz = noise_std_thz
+        self.voltage = 0.0
+
+    def func_read(self) -> float:
+        return self.free_frequency_thz + self.tuning_thz_per_v * self.voltage + random.gauss(0.0, self.noise_std_thz)
+
+    def func_write(self, new: float, last: float | None) -> float:
+        self.voltage = new
+        return new
+
+
+def run_restart_benchmark(
+    warm: bool, sampling_s: float = 0.01, timeout_s: float = 10.0, unlock: bool = False
+) -> float | None:
+    """
+    Lock a simulated laser with `Controller`, restart the controller and return the time (s)
+    until it reports the lock as re-acquired.
+
+    warm=True keeps the state journal of the first run (integrator and last output are
+    restored); warm=False deletes it, which is the old cold start from a zero integrator.
+    unlock=True unlocks the channel before the restart (integrator reset, like /post/lock
+    or Controller.stop), so the relock seeds the integrator from the resumed output.
+    The piezo drops to 0 V across the restart, like a DAC losing its output.
+    """
+    import os
+    import tempfile
+    import threading
+
+    from modules.lock_controller import Controller
+
+    setpoint = 461.31247
+    with tempfile.TemporaryDirectory() as tmp:
+        file_config = os.path.join(tmp, "config.json")
+        journal = os.path.join(tmp, "config.journal")
+        with open(file_config, "w") as f:
+            f.write(
+                '{"SIM": {"P": -20000, "I": -500000, "D": 0, "setpoint": %r, "offset": 0, '
+                '"limits": [-10, 10], "type": 1}}' % setpoint
+            )
+        laser = SimulatedLaser()
+        result = None
+        for attempt in range(2):
+            laser.voltage = 0.0
+            if attempt == 1 and not warm and os.path.exists(journal):
+                os.remove(journal)
+            cntrl = Controller(
+                sampling=sampling_s,
+                csv_dir=os.path.join(tmp, "csv"),
+                file_config=file_config,
+                file_config_default=os.path.join(tmp, "config_default.json"),
+            )
+            cntrl.add("SIM", laser.func_read, laser.func_write, active=True, lock_type=1, tracelen=100)
+            thread = threading.Thread(target=cntrl.run, daemon=True)
+            thread.start()
+            cntrl.lock("SIM", True)
+            t_end = time.time() + timeout_s
+            while cntrl.get_acquire_time("SIM") is None and time.time() < t_end:
+                time.sleep(sampling_s)
+            time.sleep(0.2)  # let the integrator settle before the "crash"
+            result = cntrl.get_acquire_time("SIM")
+            if unlock:
+                cntrl.lock("SIM", False)
+                time.sleep(5 * sampling_s)  # journal a few unlocked samples
+            cntrl.runit = False  # crash-like exit unless unlocked above
+            cntrl.pause_event.set()
+            thread.join()
+            cntrl.journal.close()
+        return result
+
+
+def compare_restart_simulated() -> Dict[str, float | None]:
+    """Re-acquisition time after a controller restart, cold (no journal) vs warm, locked or unlocked before."""
+    return {
+        "cold": run_restart_benchmark(warm=False),
+        "warm": run_restart_benchmark(warm=True),
+        "warm_unlocked": run_restart_benchmark(warm=True, unlock=True),
+    }
+
+
 # ---------------------------------------------------------------------------
 # Hardware benchmarking
 # ---------------------------------------------------------------------------
@@ -511,9 +610,10 @@ def main() -> None:
     )
     parser.add_argument(
         "--mode",
-        choices=["sim", "hardware"],
+        choices=["sim", "hardware", "restart"],
         default="sim",
-        help="Benchmark mode: 'sim' (no hardware) or 'hardware' (real devices).",
+        help="Benchmark mode: 'sim' (no hardware), 'hardware' (real devices) or "
+        "'restart' (lock re-acquisition after a simulated controller restart).",
     )
     parser.add_argument(
         "--cycles",
@@ -523,6 +623,12 @@ def main() -> None:
     )
     args = parser.parse_args()
 
+    if args.mode == "restart":
+        restart = compare_restart_simulated()
+        print("=== Lock re-acquisition after restart (Simulation) ===")
+        for kind, t_acq in restart.items():
+            print(f"  {kind:4s} start: " + ("not acquired" if t_acq is None else f"{t_acq * 1e3:.0f} ms"))
+        return
     if args.mode == "sim":
         results = compare_simulated(n_cycles=args.cycles)
     elif args.mode == "hardware":  # pragma: no cover - requires lab hardware
@@ -585,4 +691,6 @@ def test_optimized_stability_reasonable_sim():
 #   cycle-time telemetry against the 230 ms baseline.
 # - Kept a simulation-only path and pytest checks so performance comparisons and
 #   stability/accuracy metrics can still be evaluated without lab hardware.
-
+# - Added a restart benchmark (`--mode restart`): a simulated piezo-tuned laser locked by the
+#   real `Controller`, comparing lock re-acquisition after a restart with and without the
+#   state journal (warm vs cold start).
@@ -0,0 +1,107 @@
+"""
+Shared fixtures: a `web_lock` without wavemeter hardware, driven through Flask's test client.
+"""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+import modules.lock_server as lock_server
+from modules.orchestrator import orchestrated_controller
+
+
+@pytest.fixture
+def make_server(tmp_path, monkeypatch):
+    """
+    Factory of logged-in servers, stopped after the test.
+
+    make_server(channels=('A',), read=lambda: 461.3, sampling=0.05, run=True) -> (web_lock, test client);
+    every channel reads `read` and writes its output back unchanged, `run` starts the control thread.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lock_server, 'WavelengthMeter', lambda *args, **kwargs: None)
+    started = []
+
+    def make(channels=('A',), read=lambda: 461.3, sampling=0.05, run=True):
+        # absolute path: web_lock.__del__ saves the config again after the cwd is restored
+        lck = lock_server.web_lock(sampling=sampling, file_config=str(tmp_path / 'config.json'))
+        for name in channels:
+            lck.cntrl.add(name, read, lambda v, l: v, active=True, lock_type=1, tracelen=10)
+        thread = threading.Thread(target=lck.cntrl.run, daemon=True) if run else None
+        if thread is not None:
+            thread.start()
+        started.append((lck, thread))
+        tc = lck.flsk.test_client()
+        with tc.session_transaction() as sess:
+            sess['logged_in'] = True
+        return lck, tc
+
+    yield make
+    for lck, thread in started:
+        lck.cntrl.stop()
+        if thread is not None:
+            thread.join()
+
+
+@pytest.fixture
+def server(make_server):
+    """One running channel 'A' reading 461.3."""
+    return make_server()
+
+
+class stub_orchestrator(object):
+    """Orchestrator without workers or channels, enough for the orchestrated_controller facade."""
+
+    rpc_timeout = 1.
+    channels = {}
+    workers = {}
+
+    def owner(self, channel):
+        return None
+
+    def call(self, worker, method, *args):
+        raise KeyError(worker)
+
+    def call_all(self, method, *args):
+        return {}
+
+    def live(self, name=None):
+        return {}
+
+    def status(self):
+        return {'host_pid': None, 'workers': {}, 'channels': {}}
+
+
+class wlm_spy(object):
+    """WavelengthMeter stand-in recording its construction and every DLL method called on it (`calls`)."""
+
+    calls = []
+
+    def __init__(self, *args, **kwargs):
+        self.calls.append('__init__')
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append(name)
+        return call
+
+
+@pytest.fixture
+def facade_server(tmp_path, monkeypatch):
+    """Logged-in web_lock serving an orchestrated_controller (no scheduler slots, no Controller attributes)."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(wlm_spy, 'calls', [])
+    monkeypatch.setattr(lock_server, 'WavelengthMeter', wlm_spy)
+    lck = lock_server.web_lock(controller=orchestrated_controller(stub_orchestrator()))
+    tc = lck.flsk.test_client()
+    with tc.session_transaction() as sess:
+        sess['logged_in'] = True
+    return lck, tc
+
+
+## AGENT_UPDATE
+# - Added the shared `make_server` / `server` fixtures and `facade_server` on a stub orchestrator.
+# - Reason: the same web_lock fixture was copied into six test files.
+# - `facade_server` installs `wlm_spy` to check that the parent never touches the wavemeter.
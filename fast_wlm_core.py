@@ -248,22 +248,22 @@ class OptimizedLock:
     # Public API
     # ------------------------------------------------------------------
 
-    def run_cycle_once(self, logical_channel_id: int) -> Tuple[float, float]:
-        """
-        Execute a single lock cycle for the given logical channel.
+    def add_channel(self, cfg: ChannelConfig) -> None:
+        """Register (or replace) a logical channel at runtime."""
+        self._channels[cfg.logical_id] = cfg
 
-        Steps:
-        1. Route the laser via the Sercalo switch (if provided).
-        2. Set the WLM internal switcher channel.
-        3. Wait for the WLM to signal readiness (event-based when available).
-        4. Perform the buffer trick (dummy measurements).
-        5. Take a fresh frequency reading.
-        6. Pass the reading into the PID to obtain a requested DAC voltage.
-        7. Clamp the voltage to the configured DAC limits and write it.
+    def remove_channel(self, logical_channel_id: int) -> bool:
+        """Forget a logical channel. Returns False if it was not registered."""
+        return self._channels.pop(logical_channel_id, None) is not None
 
-        Returns
-        -------
-        (frequency_hz, voltage_v)
+    def read_frequency(self, logical_channel_id: int) -> float:
+        """
+        Route the given logical channel to the WLM and take a fresh reading.
+
+        This covers steps 1-5 of `run_cycle_once` and leaves the feedback
+        calculation to the caller, so that existing controllers (e.g. the
+        `pid_container` objects of `modules.lock_controller.Controller`) can
+        use the event-driven readout without giving up their own PID state.
         """
         if logical_channel_id not in self._channels:
             raise KeyError(f"Unknown logical channel id: {logical_channel_id}")
@@ -293,16 +293,41 @@ class OptimizedLock:
 
         # 5) Fresh frequency reading for control.
         try:
-            frequency_hz = float(self._wlm.GetFrequencyNum(cfg.wlm_channel))
+            return float(self._wlm.GetFrequencyNum(cfg.wlm_channel))
         except Exception as exc:
             raise RuntimeError(f"GetFrequencyNum failed for channel {cfg.wlm_channel}: {exc}") from exc
 
+    def write_voltage(self, logical_channel_id: int, requested_voltage: float) -> float:
+        """Clamp a requested voltage to the channel's DAC limits and write it."""
+        cfg = self._channels[logical_channel_id]
+        voltage = self._clamp_voltage(float(requested_voltage), cfg.dac_limits)
+        self._dac_writer(cfg.logical_id, voltage)
+        return voltage
+
+    def run_cycle_once(self, logical_channel_id: int) -> Tuple[float, float]:
+        """
+        Execute a single lock cycle for the given logical channel.
+
+        Steps:
+        1. Route the laser via the Sercalo switch (if provided).
+        2. Set the WLM internal switcher channel.
+        3. Wait for the WLM to signal readiness (event-based when available).
+        4. Perform the buffer trick (dummy measurements).
+        5. Take a fresh frequency reading.
+        6. Pass the reading into the PID to obtain a requested DAC voltage.
+        7. Clamp the voltage to the configured DAC limits and write it.
+
+        Returns
+        -------
+        (frequency_hz, voltage_v)
+        """
+        frequency_hz = self.read_frequency(logical_channel_id)
+
         # 6) PID mapping: frequency -> requested DAC voltage.
-        requested_voltage = float(self._pid(cfg.logical_id, frequency_hz))
+        requested_voltage = float(self._pid(logical_channel_id, frequency_hz))
 
         # 7) Clamp to DAC limits and write.
-        voltage = self._clamp_voltage(requested_voltage, cfg.dac_limits)
-        self._dac_writer(cfg.logical_id, voltage)
+        voltage = self.write_voltage(logical_channel_id, requested_voltage)
 
         return frequency_hz, voltage
 
@@ -465,6 +490,15 @@ def build_hardware_optimized_lock(
         # USB_DAO expects the analog-output channel index and the target voltage.
         daq.aout(physical_ch, voltage)
 
+    return OptimizedLock(
+        wlm=wlm,
+        channels=channels,
+        pid=_HardwarePID(),
+        dac_writer=_dac_writer,
+        switch=switch,
+        event_adapter=event_adapter,
+    )
+
 
 ## AGENT_UPDATE
 # - Implemented `OptimizedLock` as an event-driven WLM locking core, using an `_EventAdapter`
@@ -474,3 +508,9 @@ def build_hardware_optimized_lock(
 #   by the caller, keeping PID logic modular and voltage safety explicit.
 
 
+
+## AGENT_UPDATE
+# - Split `run_cycle_once` into `read_frequency` / `write_voltage` and added runtime
+#   `add_channel` / `remove_channel`, so `modules.lock_controller.Controller` can run
+#   individual channels through the event-driven readout (engine "optimized").
+# - `build_hardware_optimized_lock` now returns the wired `OptimizedLock`.
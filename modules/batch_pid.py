@@ -0,0 +1,233 @@
+"""
+Vectorised PID engine for many channels.
+
+`BatchPID` keeps gains, setpoints, limits, integrators and ramp state of all
+channels in NumPy arrays and updates any subset of channels in one step. For
+every channel it reproduces `modules.PID.PID` exactly (anti-windup clamping of
+the integral, offset, proportional-on-measurement, sample_time gating, manual
+mode), and `apply_ramp` reproduces the output ramp of
+`modules.pid_wrapper.pid_container`.
+
+Missing values (no output yet, no limit, no ramp) are stored as NaN / +-inf so
+the hot path needs no per-channel branches.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .PID import _current_time
+
+Index = Union[None, int, Sequence[int], np.ndarray]
+
+
+class BatchPID(object):
+    """A bank of independent PID controllers updated together."""
+
+    _FLOAT_FIELDS = ('Kp', 'Ki', 'Kd', 'setpoint', 'offset', 'lower', 'upper',
+                     'proportional', 'integral', 'derivative',
+                     'last_time', 'last_output', 'last_input',
+                     'ramp_rate', 'ramp_time', 'ramp_output')
+    _BOOL_FIELDS = ('auto_mode', 'proportional_on_measurement')
+
+    def __init__(self, sample_time: Optional[float] = None) -> None:
+        """
+        :param sample_time: Shared minimal time between updates, see `PID.__init__`. None updates on every call.
+        """
+        self.sample_time = sample_time
+        for f in self._FLOAT_FIELDS:
+            setattr(self, f, np.zeros(0))
+        for f in self._BOOL_FIELDS:
+            setattr(self, f, np.zeros(0, dtype=bool))
+
+    def __len__(self) -> int:
+        return len(self.Kp)
+
+    # ------------------------------------------------------------------
+    # Channel management
+    # ------------------------------------------------------------------
+
+    def add(self,
+            Kp: float = 1.0, Ki: float = 0.0, Kd: float = 0.0,
+            setpoint: float = 0,
+            offset: Optional[float] = 0.,
+            output_limits: Tuple[Optional[float], Optional[float]] = (None, None),
+            auto_mode: bool = True,
+            proportional_on_measurement: bool = False,
+            ramp_rate: Optional[float] = None,
+            now: Optional[float] = None) -> int:
+        """Append a channel with the same parameters as `PID.__init__` and return its index."""
+        lower, upper = output_limits
+        row = {
+            'Kp': Kp, 'Ki': Ki, 'Kd': Kd, 'setpoint': setpoint,
+            'offset': 0. if offset is None else offset,
+            'lower': -np.inf if lower is None else lower,
+            'upper': np.inf if upper is None else upper,
+            'proportional': 0., 'integral': 0., 'derivative': 0.,
+            'last_time': _current_time() if now is None else now,
+            'last_output': np.nan, 'last_input': np.nan,
+            'ramp_rate': np.nan, 'ramp_time': np.nan, 'ramp_output': np.nan,
+        }
+        for f in self._FLOAT_FIELDS:
+            setattr(self, f, np.append(getattr(self, f), float(row[f])))
+        self.auto_mode = np.append(self.auto_mode, bool(auto_mode))
+        self.proportional_on_measurement = np.append(self.proportional_on_measurement,
+                                                     bool(proportional_on_measurement))
+        index = len(self) - 1
+        self.set_ramp_rate(index, ramp_rate)
+        return index
+
+    def remove(self, index: int) -> None:
+        """Drop a channel; indices of the following channels shift down by one."""
+        for f in self._FLOAT_FIELDS + self._BOOL_FIELDS:
+            setattr(self, f, np.delete(getattr(self, f), index))
+
+    # ------------------------------------------------------------------
+    # Parameters
+    # ------------------------------------------------------------------
+
+    def set_tunings(self, index: int, tunings: Tuple[float, float, float]) -> None:
+        self.Kp[index], self.Ki[index], self.Kd[index] = tunings
+
+    def set_setpoint(self, index: int, setpoint: float) -> None:
+        self.setpoint[index] = setpoint
+
+    def set_offset(self, index: int, offset: Optional[float]) -> None:
+        self.offset[index] = 0. if offset is None else offset
+
+    def set_ramp_rate(self, index: int, ramp_rate: Optional[float]) -> None:
+        self.ramp_rate[index] = np.nan if (ramp_rate is None or ramp_rate <= 0) else float(ramp_rate)
+
+    def set_limits(self, index: int, limits: Optional[Tuple[Optional[float], Optional[float]]]) -> bool:
+        """Same validation and clamping as `PID.set_limits`."""
+        if limits is None:
+            self.lower[index], self.upper[index] = -np.inf, np.inf
+            return True
+        lower, upper = limits
+        if None not in limits and upper < lower:
+            print('Limit error: lower limit must be less than upper limit! [', limits, ']')
+            return False
+        self.lower[index] = -np.inf if lower is None else lower
+        self.upper[index] = np.inf if upper is None else upper
+        self.integral[index] = self._clamp(self.integral[index], index)
+        self.last_output[index] = self._clamp(self.last_output[index], index)
+        return True
+
+    def set_auto_mode(self, index: int, enabled: bool, last_output: Optional[float] = None,
+                      now: Optional[float] = None) -> None:
+        """Same bumpless manual -> auto transfer as `PID.set_auto_mode`."""
+        if enabled and not self.auto_mode[index]:
+            self.last_output[index] = np.nan if last_output is None else last_output
+            self.last_input[index] = np.nan
+            self.last_time[index] = _current_time() if now is None else now
+            self.proportional[index] = 0.
+            self.integral[index] = self._clamp(0. if last_output is None else last_output, index)
+        self.auto_mode[index] = enabled
+
+    def reset(self, index: Index = None) -> None:
+        """Clear the integrator, like `pid_container.reset`."""
+        self.integral[self._index(index)] = 0.
+
+    def components(self, index: int) -> Tuple[float, float, float]:
+        return self.proportional[index], self.integral[index], self.derivative[index]
+
+    # ------------------------------------------------------------------
+    # Hot path
+    # ------------------------------------------------------------------
+
+    def __call__(self, inputs: Union[float, Iterable[float]], index: Index = None,
+                 now: Optional[float] = None) -> np.ndarray:
+        """
+        Update the channels in `index` (all if None) with `inputs` and return
+        their outputs; NaN marks "no output yet". Channels in manual mode, or
+        gated by sample_time, return their previous output unchanged.
+        """
+        idx = self._index(index)
+        inputs = np.broadcast_to(np.asarray(inputs, dtype=float), idx.shape)
+        now = _current_time() if now is None else now
+
+        dt = now - self.last_time[idx]
+        dt[dt == 0] = 1e-16
+
+        update = self.auto_mode[idx].copy()
+        if self.sample_time is not None:
+            update &= ~((dt < self.sample_time) & ~np.isnan(self.last_output[idx]))
+        if not update.all():
+            idx, inputs, dt = idx[update], inputs[update], dt[update]
+
+        if len(idx):
+            error = self.setpoint[idx] - inputs
+            last_input = self.last_input[idx]
+            d_input = inputs - np.where(np.isnan(last_input), inputs, last_input)
+
+            pom = self.proportional_on_measurement[idx]
+            Kp = self.Kp[idx]
+            proportional = np.where(pom, self.proportional[idx] - Kp * d_input, Kp * error)
+
+            integral = self.integral[idx] + self.Ki[idx] * error * dt
+            integral = np.minimum(np.maximum(integral, self.lower[idx]), self.upper[idx])
+
+            derivative = -self.Kd[idx] * d_input / dt
+
+            output = proportional + integral + derivative
+            output = output + self.offset[idx]
+            output = np.minimum(np.maximum(output, self.lower[idx]), self.upper[idx])
+
+            self.proportional[idx] = proportional
+            self.integral[idx] = integral
+            self.derivative[idx] = derivative
+            self.last_output[idx] = output
+            self.last_input[idx] = inputs
+            self.last_time[idx] = now
+
+        return self.last_output[self._index(index)]
+
+    def apply_ramp(self, targets: Union[float, Iterable[float]], index: Index = None,
+                   now: Optional[float] = None) -> np.ndarray:
+        """Limit the slew rate of `targets` per channel, like `pid_container.__apply_ramp`."""
+        idx = self._index(index)
+        targets = np.broadcast_to(np.asarray(targets, dtype=float), idx.shape).copy()
+        now = _current_time() if now is None else now
+
+        rate = self.ramp_rate[idx]
+        last_time = self.ramp_time[idx]
+        last_output = self.ramp_output[idx]
+
+        free = np.isnan(rate) | np.isnan(last_time)
+        dt = now - last_time
+        hold = ~free & (dt <= 0)
+        max_delta = rate * dt
+        delta = targets - last_output
+        limited = ~free & ~hold & (np.abs(delta) > max_delta)
+
+        result = targets
+        result[hold] = last_output[hold]
+        result[limited] = last_output[limited] + np.where(delta[limited] > 0, max_delta[limited], -max_delta[limited])
+
+        moved = ~hold
+        self.ramp_time[idx[moved]] = now
+        self.ramp_output[idx[moved]] = result[moved]
+        return result
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _index(self, index: Index) -> np.ndarray:
+        if index is None:
+            return np.arange(len(self))
+        return np.atleast_1d(np.asarray(index, dtype=np.intp))
+
+    def _clamp(self, value: float, index: int) -> float:
+        if np.isnan(value):
+            return value
+        return min(max(value, self.lower[index]), self.upper[index])
+
+
+## AGENT_UPDATE
+# - Added `BatchPID`, an array-based bank of PID controllers (plus the pid_container output
+#   ramp) that updates any subset of channels in one vectorised step with output identical
+#   to the scalar `modules.PID.PID`.
+# - Reason: per-channel pure-Python PID calls do not scale to cavity / temperature loops.
@@ -0,0 +1,326 @@
+"""
+Wavemeter reference check and calibration as a step machine for the controller scheduler.
+
+`WavemeterCalibration` paused the controller, busy-waited for the WLM to switch
+to the reference port and slept a fixed second, all inside the HTTP request.
+`calibration_slot` splits the same work into steps that `Controller.run` executes
+between two channel slots (see `Controller.add_slot`):
+
+    measure    switch to the reference port, wait for a fresh reading, switch back
+    calibrate  only if |deviation| > threshold (or forced): the same visit, with
+               `Calibration` on the reference reading
+    verify     measure again to confirm the calibration
+
+Every step leaves the WLM on the lock port again, confirmed by GetActiveChannel,
+so each one costs the other channels one slot. That slot holds the control
+thread (and the WLM) for the whole visit: `settle` (0.2 s) in one sleep, the
+wait for the first valid reference reading (polled every `poll`, usually one
+WLM update) and the confirmed switch back, typically 0.25 - 0.3 s and at most
+2 * `timeout` (2 s). A visit that gets no valid reading within `timeout` is
+retried in the next cycle, up to `retries` times; a WLM that does not return
+to the lock port within `timeout` fails the step with an error.
+
+    slot = calibration_slot(wvm, reference_frequency=461.312470)
+    cntrl.add_slot(slot)
+    slot.start()            # check, calibrate on deviation
+    slot.start(force=True)  # always calibrate
+    slot.status()
+
+`reference_slot` samples the reference laser through the same visit, at most
+once per `period` seconds and never more often than keeps the time the visits
+hold the control thread below `max_duty` (a 0.25 s visit with max_duty=0.01
+waits at least 25 s), keeps the readings in a ring buffer and starts the
+calibration when the reference drifts. `status()['duty']` is the measured
+fraction of the time spent in visits:
+
+    ref = reference_slot(slot, period=30., on_sample=...)
+    cntrl.add_slot(ref)
+"""
+
+from __future__ import annotations
+
+import collections
+import contextlib
+import time
+from threading import RLock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+THRESHOLD = 0.000005  # 5 MHz in THz, the band of CheckReferenceLock in the notebook
+TIMEOUT = 1.          # s a single visit of the reference port may take, and again the switch back
+SETTLE = 0.2          # s after the switch before a reading counts as fresh
+POLL = 0.02           # s between two GetActiveChannel / GetFrequency2 calls after `settle`
+PERIOD = 30.          # s between two reference samples
+MAX_DUTY = 0.01       # fraction of the time the reference visits may hold the control thread
+DRIFT_SAMPLES = 3     # consecutive samples beyond the threshold that count as drift
+
+
+class calibration_slot(object):
+    """WLM reference check / calibration, advanced one bounded step per scheduler slot."""
+
+    IDLE, MEASURE, CALIBRATE, VERIFY = 'idle', 'measure', 'calibrate', 'verify'
+
+    def __init__(self, wvm: Any, reference_frequency: float = 461.312470,
+                 threshold: float = THRESHOLD, reference_port: Tuple[int, int] = (2, 1),
+                 lock_port: Tuple[int, int] = (1, 1), timeout: float = TIMEOUT,
+                 settle: float = SETTLE, poll: float = POLL, retries: int = 3,
+                 on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        """
+        :param wvm: WavelengthMeter (SetActiveChannel, GetActiveChannel, GetFrequency2, Calibration)
+        :param reference_frequency: THz of the reference laser
+        :param threshold: THz, deviations beyond this trigger a calibration
+        :param reference_port: (channel, port) of the reference laser
+        :param lock_port: (channel, port) the lock channels are read on
+        :param on_result: called with the result dict when a check finishes
+        """
+        self.wvm = wvm
+        self.reference_frequency = reference_frequency
+        self.threshold = threshold
+        self.reference_port = tuple(reference_port)
+        self.lock_port = tuple(lock_port)
+        self.timeout = timeout
+        self.settle = settle
+        self.poll = poll
+        self.retries = retries
+        self.on_result = on_result
+        self.mutex = RLock() ### on_result may request the next check
+        self.state = self.IDLE
+        self.force = False
+        self.attempts = 0
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_frequency: Optional[float] = None
+        self.last_calibration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.__start: Optional[Dict[str, Any]] = None
+
+    # ------------------------------------------------------------------ requests (any thread)
+    def start(self, force: bool = False) -> bool:
+        """Request a reference check; False if one is already running."""
+        with self.mutex:
+            if self.state != self.IDLE or self.__start is not None:
+                return False
+            self.__start = {'force': force, 'time': time.time()}
+            return True
+
+    def abort(self) -> bool:
+        """Drop a requested or running check; the WLM is already back on the lock port between steps."""
+        with self.mutex:
+            running = self.state != self.IDLE or self.__start is not None
+            self.__start = None
+            if running:
+                self.__finish('aborted')
+            return running
+
+    def running(self) -> bool:
+        return self.state != self.IDLE or self.__start is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {'state': self.state if self.__start is None else self.MEASURE, 'attempts': self.attempts,
+                'reference_frequency': self.reference_frequency, 'threshold': self.threshold,
+                'last_frequency': self.last_frequency, 'last_calibration': self.last_calibration,
+                'last_result': self.last_result, 'error': self.error}
+
+    # ------------------------------------------------------------------ scheduler (control thread)
+    def pending(self) -> bool:
+        return self.running()
+
+    def step(self) -> None:
+        """Run the next step; returns with the WLM on the lock port."""
+        with self.mutex:
+            if self.__start is not None:
+                self.force = self.__start['force']
+                self.__start = None
+                self.state = self.MEASURE
+                self.attempts = 0
+                self.error = None
+            state = self.state
+        if state == self.IDLE:
+            return
+        calibrate = state == self.CALIBRATE
+        try:
+            freq = self.visit(calibrate)
+        except Exception as e:
+            freq = None
+            self.error = str(e)
+        with self.mutex:
+            if self.state != state: ### aborted meanwhile
+                return
+            if freq is None:
+                self.attempts += 1
+                if self.attempts > self.retries:
+                    self.error = self.error or 'no valid reference reading within %g s' % self.timeout
+                    self.__finish('failed')
+                return
+            self.attempts = 0
+            self.error = None
+            self.last_frequency = freq
+            deviation = freq - self.reference_frequency
+            if state == self.MEASURE:
+                if self.force or abs(deviation) > self.threshold:
+                    self.state = self.CALIBRATE
+                else:
+                    self.__finish('in_lock', deviation)
+            elif state == self.CALIBRATE:
+                self.last_calibration = time.time()
+                self.state = self.VERIFY
+            else:
+                self.__finish('calibrated' if abs(deviation) <= self.threshold else 'deviation_after_calibration', deviation)
+
+    def visit(self, calibrate: bool = False) -> Optional[float]:
+        """
+        Read the reference port (and calibrate on it); None without a valid reading. Control thread only.
+        Returns once GetActiveChannel reports the lock port again, raises RuntimeError if it does not within `timeout`.
+        """
+        session = getattr(self.wvm, 'session', None) ### lock_wlm.wlm_broker: nobody else reads the WLM meanwhile
+        with session('reference') if session is not None else contextlib.nullcontext():
+            channel, port = self.reference_port
+            self.wvm.SetActiveChannel(channel=channel, port=port)
+            self.wvm.SetExposureMode(True)
+            try:
+                freq = self.__wait_reading()
+                if freq is not None and calibrate:
+                    self.wvm.Calibration(Type=2, unit=2, value=self.reference_frequency, channel=channel)
+            finally:
+                self.__switch_back()
+            return freq
+
+    def __wait_reading(self) -> Optional[float]:
+        ### the WLM reports the switch through GetActiveChannel, readings before `settle` may be from the lock port
+        t0 = time.monotonic()
+        time.sleep(self.settle)
+        while True:
+            if tuple(self.wvm.GetActiveChannel()) == self.reference_port:
+                freq = self.wvm.GetFrequency2()
+                if freq > 0: ### <= 0: under- / overexposed or no signal
+                    return freq
+            if time.monotonic() - t0 >= self.timeout:
+                return None
+            time.sleep(self.poll)
+
+    def __switch_back(self) -> None:
+        channel, port = self.lock_port
+        self.wvm.SetActiveChannel(channel=channel, port=port)
+        self.wvm.SetExposureMode(False)
+        t0 = time.monotonic()
+        while tuple(self.wvm.GetActiveChannel()) != self.lock_port:
+            if time.monotonic() - t0 >= self.timeout:
+                raise RuntimeError('WLM did not return to the lock port %s within %g s' % (self.lock_port, self.timeout))
+            time.sleep(self.poll)
+
+    def __finish(self, result: str, deviation: Optional[float] = None) -> None:
+        self.state = self.IDLE
+        self.force = False
+        self.last_result = {'result': result, 'deviation': deviation, 'frequency': self.last_frequency,
+                            'time': time.time()}
+        if self.on_result is not None:
+            try:
+                self.on_result(self.last_result)
+            except Exception as e:
+                print('Calibration result callback failed: %s' % e)
+
+
+class reference_slot(object):
+    """Low-duty reference laser monitor: one visit of the reference port per `period`, bounded by `max_duty`."""
+
+    def __init__(self, calibration: calibration_slot, period: float = PERIOD, max_duty: float = MAX_DUTY,
+                 tracelen: int = 1000, drift_samples: int = DRIFT_SAMPLES, auto_calibrate: bool = True,
+                 min_interval: float = 600., on_sample: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param calibration: slot whose visit / threshold / reference frequency are used, started on drift
+        :param period: s between the starts of two samples
+        :param max_duty: fraction of the time spent in visits, stretches the period when a visit takes longer
+        :param tracelen: samples kept in the ring buffer
+        :param drift_samples: consecutive samples beyond the threshold that start the calibration
+        :param min_interval: s between two automatic calibrations
+        :param on_sample: called with every sample dict (time, frequency, deviation, in_lock)
+        :param clock: monotonic time source of the schedule
+        """
+        self.calibration = calibration
+        self.period = period
+        self.max_duty = max_duty
+        self.clock = clock
+        self.trace: collections.deque = collections.deque(maxlen=tracelen)
+        self.drift_samples = drift_samples
+        self.auto_calibrate = auto_calibrate
+        self.min_interval = min_interval
+        self.on_sample = on_sample
+        self.started: Optional[float] = None  # clock of the first pending call
+        self.next = 0.       # clock of the next sample
+        self.busy = 0.       # s spent in visits since `started`
+        self.last_cost: Optional[float] = None  # s of the last visit
+        self.in_lock: Optional[bool] = None
+        self.drift = 0       # consecutive samples beyond the threshold
+        self.errors = 0      # visits without a valid reading
+        self.last_auto_calibration: Optional[float] = None
+
+    def pending(self) -> bool:
+        """Called once per cycle by Controller.run."""
+        if self.calibration.running(): ### the calibration owns the reference port meanwhile
+            return False
+        now = self.clock()
+        if self.started is None:
+            self.started = now
+        return now >= self.next
+
+    def duty(self) -> Optional[float]:
+        """Measured fraction of the time spent in visits, None before the first one."""
+        if self.started is None or self.last_cost is None:
+            return None
+        elapsed = self.clock() - self.started
+        return self.busy / elapsed if elapsed > 0 else None
+
+    def step(self) -> None:
+        t0 = self.clock()
+        try:
+            freq = self.calibration.visit()
+        except Exception as e:
+            print('Reference sample failed: %s' % e)
+            freq = None
+        self.last_cost = self.clock() - t0
+        self.busy += self.last_cost
+        self.next = t0 + max(self.period, self.last_cost / self.max_duty if self.max_duty > 0 else 0.)
+        if freq is None:
+            self.errors += 1
+            return
+        deviation = freq - self.calibration.reference_frequency
+        self.in_lock = abs(deviation) <= self.calibration.threshold
+        self.drift = 0 if self.in_lock else self.drift + 1
+        sample = {'time': time.time(), 'frequency': freq, 'deviation': deviation, 'in_lock': self.in_lock}
+        self.trace.append(sample)
+        if self.on_sample is not None:
+            try:
+                self.on_sample(sample)
+            except Exception as e:
+                print('Reference sample callback failed: %s' % e)
+        if self.auto_calibrate and self.drift >= self.drift_samples:
+            now = time.time()
+            if self.last_auto_calibration is None or now - self.last_auto_calibration >= self.min_interval:
+                if self.calibration.start():
+                    self.last_auto_calibration = now
+                    self.drift = 0
+
+    def get_trace(self) -> Dict[str, List[Any]]:
+        samples = list(self.trace)
+        return {key: [sample[key] for sample in samples] for key in ('time', 'frequency', 'deviation', 'in_lock')}
+
+    def status(self) -> Dict[str, Any]:
+        last = self.trace[-1] if self.trace else None
+        return {'period': self.period, 'max_duty': self.max_duty, 'duty': self.duty(), 'last_cost': self.last_cost,
+                'in_lock': self.in_lock, 'drift': self.drift, 'errors': self.errors,
+                'samples': len(self.trace), 'last': last, 'auto_calibrate': self.auto_calibrate,
+                'min_interval': self.min_interval, 'last_auto_calibration': self.last_auto_calibration}
+
+
+## AGENT_UPDATE
+# - Added `calibration_slot`, the WLM reference check / calibration split into bounded steps
+#   that the controller runs in its own scheduler slot (`Controller.add_slot`).
+# - Reason: the calibration endpoints paused the lock and slept inside the HTTP request.
+# - Added `reference_slot`, a reference laser sample every N cycles with a ring buffer and
+#   automatic calibration on drift.
+# - Reason: the notebook's CheckReferenceLock paused the lock for > 7 s every 10 minutes.
+# - The reference visit holds the `lock_wlm.wlm_broker` session when the wavemeter is brokered.
+# - The visit confirms the switch back to the lock port and sleeps through `settle` instead of polling it.
+# - Reason: a lost switch back left the lock channels reading the reference port unnoticed.
+# - `reference_slot` is scheduled by `period` (s) and `max_duty` instead of a cycle count and reports the
+#   measured duty.
+# - Reason: every=20 cycles visited the reference port every ~1.5 s, ~10 % of the control thread's time.
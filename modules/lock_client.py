@@ -1,24 +1,74 @@
+import socket
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import matplotlib.pyplot as plt
 import numpy as np
 
 #print(ret.content)
 #print(dir(ret))
 
+class keepalive_adapter(HTTPAdapter):
+    '''HTTPAdapter that enables TCP keep-alive probes on its pooled sockets.'''
+    def __init__(self, keepalive_idle=None, **kwargs):
+        self.keepalive_idle = keepalive_idle
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keepalive_idle:
+            options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, int(self.keepalive_idle)))
+            kwargs['socket_options'] = options
+        super().init_poolmanager(*args, **kwargs)
+
 class http_api(object):
-    def __init__(self, host='127.0.0.1', port=8000, protocol='http', password=''):
+    '''
+    Persistent, pooled HTTP session to the lock server.
+    timeout: seconds or (connect, read) tuple for every request
+    retries: reconnect attempts on connection errors (requests are not resent after they reached the server)
+    pool_size: kept-alive connections, i.e. threads that can talk to the server at once
+    keepalive_idle: seconds before TCP keep-alive probes on idle connections, None for the OS default
+    keep_alive: False closes the connection after every request, like the old client
+    '''
+    def __init__(self, host='127.0.0.1', port=8000, protocol='http', password='', username='bali',
+                 timeout=(3.05, 10.), retries=3, backoff=0.1, pool_size=10, keepalive_idle=None, keep_alive=True):
         self.host = host
         self.port = port
         self.protocol = protocol
         self.baseurl = '%s://%s:%i'%(self.protocol, self.host, self.port)
+        self.timeout = timeout
+        
+        self.session = requests.Session()
+        retry = Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=backoff)
+        adapter = keepalive_adapter(keepalive_idle, pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('%s://'%self.protocol, adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        if password:
+            self.login(username, password)
+        
+    def login(self, username, password):
+        ret = self.session.post('%s/login'%self.baseurl, data={'username':username, 'password':password},
+                                timeout=self.timeout, allow_redirects=False)
+        return ret.status_code in (200, 302) and 'session' in self.session.cookies
+        
+    def close(self):
+        self.session.close()
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
         
     def get(self, path, data):
         url = '%s/%s'%(self.baseurl, path)
-        return requests.get(url,json=data)
+        return self.session.get(url, json=data, timeout=self.timeout)
         
     def post(self, path, data):
         url = '%s/%s'%(self.baseurl, path)
-        return requests.post(url,json=data)
+        return self.session.post(url, json=data, timeout=self.timeout)
         
     def parse(self, ret):
         status = ret.status_code
@@ -33,25 +83,8 @@ class http_api(object):
             pass
         return status, data
 
-class web_lock_client(http_api):
-    def get(self, cmd, data):
-        ret, msg = super().parse(super().get('get/%s'%cmd, data))
-        if ret==200:
-            stat = msg['status']
-            data = msg['data']
-            return stat, data
-        else:
-            return False, {}
-
-    def post(self, cmd, data):
-        ret, msg = super().parse(super().post('post/%s'%cmd, data))
-        if ret==200:
-            stat = msg['status']
-            data = msg['data']
-            return stat, data
-        else:
-            return False, {}
-    
+class lock_commands(object):
+    '''Server commands, on top of get(cmd, data) and post(cmd, data) of the transport.'''
     def index(self):
          return self.get('', {})
     
@@ -81,6 +114,27 @@ class web_lock_client(http_api):
         
     def get_graph(self, name):
         return self.get('graph', {'name':name})
+
+    def get_stats(self, name=None):
+        return self.get('stats', {'name':name})
+    
+    def get_psd(self, name=None):
+        return self.get('psd', {'name':name})
+
+    def set_archive(self, name, enable=True):
+        return self.post('archive', {'name':name, 'enable':enable})
+
+    def get_archive(self, name, t0=None, t1=None, columns=None):
+        return self.get('archive', {'name':name, 't0':t0, 't1':t1, 'columns':columns})
+
+    def get_history(self, name, t0=None, t1=None, max_points=1000):
+        return self.get('history', {'name':name, 't0':t0, 't1':t1, 'max_points':max_points})
+
+    def get_rollup(self, name, level=None, t0=None, t1=None, max_points=1000):
+        return self.get('rollup', {'name':name, 'level':level, 't0':t0, 't1':t1, 'max_points':max_points})
+
+    def reset_stats(self, name=None):
+        return self.post('stats/reset', {'name':name})
     
     def set_trace(self, name, tracelen):
         return self.post('trace', {'name':name, 'data':tracelen})
@@ -110,6 +164,9 @@ class web_lock_client(http_api):
     def set_range(self, name, center, span):
         return self.post('range', {'name':name, 'data':[center, span]})
 
+    def set_engine(self, name, engine):
+        return self.post('engine', {'name':name, 'data':engine})
+
     def activate(self, name):
         return self.post('activate', {'name':name})
     
@@ -127,3 +184,33 @@ class web_lock_client(http_api):
     
     def reset(self, name):
         return self.post('reset', {'name':name})
+
+class web_lock_client(http_api, lock_commands):
+    def get(self, cmd, data):
+        ret, msg = super().parse(super().get('get/%s'%cmd, data))
+        if ret==200:
+            stat = msg['status']
+            data = msg['data']
+            return stat, data
+        else:
+            return False, {}
+
+    def post(self, cmd, data):
+        ret, msg = super().parse(super().post('post/%s'%cmd, data))
+        if ret==200:
+            stat = msg['status']
+            data = msg['data']
+            return stat, data
+        else:
+            return False, {}
+    
+    def batch(self, ops):
+        '''
+        Send several commands in one request, e.g.
+        batch([('post/setpoint', {'name':'WMCH2', 'data':461.3}), ('get/status', {'name':'WMCH2'})])
+        returns (status, [(status, data), ...]) in the order of ops.
+        '''
+        stat, data = self.post('batch', {'ops':[{'path':path, 'data':args} for path, args in ops]})
+        if isinstance(data, list):
+            data = [(r['status'], r['data']) for r in data]
+        return stat, data
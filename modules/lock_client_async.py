@@ -0,0 +1,281 @@
+"""
+Asyncio client for the lock server.
+
+`async_lock_client` offers the command surface of `web_lock_client`
+(`get_status`, `set_setpoint`, `lock`, ...) as coroutines, so experiment
+scripts can watch and steer all channels concurrently:
+
+    async with async_lock_client(password='...') as c:
+        status = await c.get_channels('status', ['WMCH2', 'WMCH3'])
+        await c.set_channels('setpoint', {'WMCH2': 487.99008, 'WMCH3': 607.426044})
+        async for values in c.sse_values():
+            ...
+
+It is written on `asyncio.open_connection` only: HTTP/1.1 requests go over
+a small pool of kept-alive connections (at most `pool_size` in flight), the
+login cookie is shared by all of them, and every SSE stream gets a
+connection of its own.
+
+    python bench_lock_client.py   compares it with the blocking client
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import ssl as ssl_module
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlencode
+
+from .lock_client import lock_commands
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+class http_connection_pool(object):
+    """Kept-alive HTTP/1.1 connections to one server."""
+
+    def __init__(self, host: str, port: int, use_ssl: bool = False, size: int = 10,
+                 timeout: float = 10.) -> None:
+        """
+        :param size: Connections kept open, i.e. requests in flight at once.
+        :param timeout: Seconds for a whole request (connect, send and read the response).
+        """
+        self.host = host
+        self.port = port
+        self.ssl = ssl_module.create_default_context() if use_ssl else None
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(size)
+        self.idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.cookies: Dict[str, str] = {}
+
+    async def open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+    def headers(self, body: bytes, content_type: str, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        headers = {'Host': '%s:%i' % (self.host, self.port), 'Content-Length': str(len(body))}
+        if body:
+            headers['Content-Type'] = content_type
+        if self.cookies:
+            headers['Cookie'] = '; '.join('%s=%s' % kv for kv in self.cookies.items())
+        headers.update(extra or {})
+        return headers
+
+    async def request(self, method: str, path: str, body: bytes = b'',
+                      content_type: str = 'application/json') -> Response:
+        """Send one request on a pooled connection; returns (status, headers, body)."""
+        async with self.slots:
+            return await asyncio.wait_for(self.__request(method, path, body, content_type), self.timeout)
+
+    async def __request(self, method: str, path: str, body: bytes, content_type: str) -> Response:
+        while True:
+            reused = bool(self.idle)
+            reader, writer = self.idle.pop() if reused else await self.open()
+            try:
+                writer.write(_request_bytes(method, path, self.headers(body, content_type), body))
+                await writer.drain()
+                status, headers, data = await _read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:  # the server dropped an idle connection, try a fresh one
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            self.__cookies(headers)
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+            else:
+                self.idle.append((reader, writer))
+            return status, headers, data
+
+    def __cookies(self, headers: Dict[str, str]) -> None:
+        for cookie in headers.get('set-cookie', '').split('\n'):
+            if '=' in cookie:
+                key, value = cookie.split(';', 1)[0].split('=', 1)
+                self.cookies[key.strip()] = value.strip()
+
+    async def stream(self, path: str) -> AsyncIterator[bytes]:
+        """Lines of a streamed (e.g. text/event-stream) response, on a connection of its own."""
+        reader, writer = await self.open()
+        try:
+            writer.write(_request_bytes('GET', path, self.headers(b'', '', {'Accept': 'text/event-stream'}), b''))
+            await writer.drain()
+            status, headers = await _read_head(reader)
+            if status != 200:
+                raise ConnectionError('%s returned HTTP %i' % (path, status))
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                lines = _chunked_lines(reader)
+            else:
+                lines = _lines(reader)
+            async for line in lines:
+                yield line
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        idle, self.idle = self.idle, []
+        for _, writer in idle:
+            writer.close()
+
+
+def _request_bytes(method: str, path: str, headers: Dict[str, str], body: bytes) -> bytes:
+    head = '%s %s HTTP/1.1\r\n' % (method, path) + ''.join('%s: %s\r\n' % kv for kv in headers.items())
+    return head.encode('latin-1') + b'\r\n' + body
+
+
+async def _read_head(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    version, status = lines[0].split(' ', 2)[:2]
+    headers: Dict[str, str] = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            key = key.strip().lower()
+            headers[key] = headers[key] + '\n' + value.strip() if key in headers else value.strip()
+    if version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive':
+        headers['connection'] = 'close'
+    return int(status), headers
+
+
+async def _read_response(reader: asyncio.StreamReader) -> Response:
+    status, headers = await _read_head(reader)
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        parts = []
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if size == 0:
+                while await reader.readuntil(b'\r\n') != b'\r\n':  # trailers
+                    pass
+                return status, headers, b''.join(parts)
+            parts.append((await reader.readexactly(size + 2))[:-2])
+    if 'content-length' in headers:
+        return status, headers, await reader.readexactly(int(headers['content-length']))
+    headers['connection'] = 'close'  # body delimited by the end of the connection
+    return status, headers, await reader.read()
+
+
+async def _lines(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        yield line.rstrip(b'\r\n')
+
+
+async def _chunked_lines(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    buffer = b''
+    while True:
+        size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+        if size == 0:
+            return
+        buffer += (await reader.readexactly(size + 2))[:-2]
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.rstrip(b'\r')
+
+
+class async_lock_client(lock_commands):
+    """Coroutine version of `web_lock_client`; every command returns an awaitable (status, data)."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8000, protocol: str = 'http',
+                 password: str = '', username: str = 'bali', timeout: float = 10., pool_size: int = 10) -> None:
+        """
+        :param password: Logs in before the first request if given.
+        :param timeout: Seconds per request.
+        :param pool_size: Kept-alive connections, i.e. requests in flight at once.
+        """
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.username = username
+        self.password = password
+        self.pool = http_connection_pool(host, port, protocol == 'https', pool_size, timeout)
+        self.logged_in = not password
+        self.login_lock: Optional[asyncio.Lock] = None
+
+    async def login(self, username: str, password: str) -> bool:
+        body = urlencode({'username': username, 'password': password}).encode()
+        status, _, _ = await self.pool.request('POST', '/login', body, 'application/x-www-form-urlencoded')
+        self.logged_in = status in (200, 302) and 'session' in self.pool.cookies
+        return self.logged_in
+
+    async def __ensure_login(self) -> None:
+        if self.logged_in:
+            return
+        if self.login_lock is None:
+            self.login_lock = asyncio.Lock()
+        async with self.login_lock:
+            if not self.logged_in:
+                await self.login(self.username, self.password)
+
+    async def request(self, method: str, path: str, data: Any) -> Tuple[Any, Any]:
+        await self.__ensure_login()
+        status, headers, body = await self.pool.request(method, '/' + path, json.dumps(data).encode())
+        if status != 200 or not headers.get('content-type', '').startswith('application/json'):
+            return False, {}
+        msg = json.loads(body)
+        return msg['status'], msg['data']
+
+    async def get(self, cmd: str, data: Any) -> Tuple[Any, Any]:
+        return await self.request('GET', 'get/%s' % cmd, data)
+
+    async def post(self, cmd: str, data: Any) -> Tuple[Any, Any]:
+        return await self.request('POST', 'post/%s' % cmd, data)
+
+    async def batch(self, ops: Iterable[Tuple[str, Any]]) -> Tuple[Any, Any]:
+        """Several commands in one request, see `web_lock_client.batch`."""
+        stat, data = await self.post('batch', {'ops': [{'path': path, 'data': args} for path, args in ops]})
+        if isinstance(data, list):
+            data = [(r['status'], r['data']) for r in data]
+        return stat, data
+
+    async def get_channels(self, cmd: str, names: Sequence[str], data: Optional[Dict[str, Any]] = None
+                           ) -> Dict[str, Tuple[Any, Any]]:
+        """`get/<cmd>` for all names concurrently, e.g. get_channels('status', names); returns name -> (status, data)."""
+        rets = await asyncio.gather(*[self.get(cmd, dict(data or {}, name=name)) for name in names])
+        return dict(zip(names, rets))
+
+    async def set_channels(self, cmd: str, values: Dict[str, Any]) -> Dict[str, Tuple[Any, Any]]:
+        """`post/<cmd>` of one value per channel concurrently, e.g. set_channels('setpoint', {name: value})."""
+        names = list(values)
+        rets = await asyncio.gather(*[self.post(cmd, {'name': name, 'data': values[name]}) for name in names])
+        return dict(zip(names, rets))
+
+    async def sse(self, path: str) -> AsyncIterator[Any]:
+        """Decoded `data:` events of a server-sent event stream."""
+        await self.__ensure_login()
+        data: List[bytes] = []
+        async for line in self.pool.stream('/' + path):
+            if line.startswith(b'data:'):
+                data.append(line[5:].lstrip())
+            elif not line and data:
+                yield json.loads(b'\n'.join(data))
+                data = []
+
+    def sse_values(self) -> AsyncIterator[Any]:
+        """Events of /stream/values: active values, piezo values and reference lock state."""
+        return self.sse('stream/values')
+
+    def sse_piezo_values(self) -> AsyncIterator[Any]:
+        """Events of /stream/piezo: name -> piezo output."""
+        return self.sse('stream/piezo')
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def __aenter__(self) -> 'async_lock_client':
+        await self.__ensure_login()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+
+## AGENT_UPDATE
+# - Added `async_lock_client`, the `web_lock_client` commands as coroutines over a pooled
+#   keep-alive asyncio HTTP/1.1 transport, with concurrent `get_channels` / `set_channels` and
+#   async iterators over /stream/values and /stream/piezo.
+# - Reason: experiment scripts watch and set several channels in parallel during field ramps.
@@ -3,15 +3,61 @@ import time
 import os
 import csv
 import datetime
+import queue
+import threading
+import functools
+import contextlib
 import numpy as np
-from threading import Lock, Event
+from types import MappingProxyType
+from threading import Lock, RLock, Event
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from .pid_wrapper import pid_container
+from .wavelengthmeter import ErrNoSignal
+from .lock_stats import lock_analytics, TOLERANCE
+from .lock_psd import lock_spectra
+from .lock_archive import lock_archive
+from .lock_rollup import lock_rollups
+from .lock_journal import MAX_NAME, state_journal
+from .lock_metrics import lock_metrics
+
+ENGINES = ('legacy', 'optimized')
+ACQUIRE_SAMPLES = 5 ### consecutive samples inside the tolerance band that count as (re-)acquired lock
+
+def control_command(func):
+    '''
+    Run a Controller method on the control thread at the next slot boundary.
+    Callers from other threads block until it has been applied (see Controller.submit),
+    calls from the control thread itself run directly.
+    '''
+    @functools.wraps(func)
+    def wrapper(self, *args):
+        if threading.get_ident() == self.control_thread_id:
+            return func(self, *args)
+        ret, _ = wait_command(self.submit(func, self, *args), self.command_timeout)
+        return ret
+    return wrapper
+
+def wait_command(future, timeout):
+    '''
+    (ret, version) of a submitted command. A command still queued after timeout is cancelled,
+    so it is never applied after its caller was told it failed; a running one is waited for.
+    '''
+    try:
+        return future.result(timeout)
+    except FutureTimeout:
+        if future.cancel():
+            raise
+        return future.result()
 
 class config_helper(object):
     def __init__(self, file_config = 'config.json', file_config_default = 'config_default.json'):
         self.file_config = file_config
         self.file_config_default = file_config_default
+        self.config_mutex = RLock()
+        self._save_deferred = 0
+        self._save_pending = False
         self.config = self.load_config(self.file_config)
+        self.state_version = 0 ### bumped on every config change, keys the cached API responses
         
     def load_config(self, cfile):
         try:
@@ -27,7 +73,25 @@ class config_helper(object):
             json.dump(cfg, json_file)
         
     def save(self):
-        self.save_config(self.config, self.file_config)
+        with self.config_mutex:
+            if self._save_deferred:
+                self._save_pending = True
+                return
+            self.save_config(self.config, self.file_config)
+    
+    @contextlib.contextmanager
+    def deferred_save(self):
+        '''Collect all saves inside the block into a single config file write.'''
+        with self.config_mutex:
+            self._save_deferred += 1
+        try:
+            yield
+        finally:
+            with self.config_mutex:
+                self._save_deferred -= 1
+                if not self._save_deferred and self._save_pending:
+                    self._save_pending = False
+                    self.save()
         
     def get_config(self):
         return self.config
@@ -43,7 +107,9 @@ class config_helper(object):
         return self.load_config(self.file_config_default)
         
     def set_config(self, config):
-        self.config = config
+        with self.config_mutex:
+            self.config = config
+            self.state_version += 1
         self.save()
         
     def set_config_default(self):
@@ -55,21 +121,34 @@ class config_helper(object):
         self.save_config(temp_default, self.file_config_default)
         
     def set(self, name, key, value):
-        if not name in self.config:
-            self.config[name] = {}
-        self.config[name][key] = value
-        self.save()
+        with self.config_mutex:
+            if not name in self.config:
+                self.config[name] = {}
+            ### rewriting an equal value (e.g. the WM reading state every sample) keeps the cached responses;
+            ### lists and dicts may have been changed in place by the caller
+            changed = self.config[name].get(key, self) != value or isinstance(value, (list, dict))
+            self.config[name][key] = value
+            if changed:
+                self.state_version += 1 ### after the write, a reader that sees the new version sees the new value
+            self.save()
     
     def get(self, name, key):
-        if not name in self.config:
-            self.config[name] = {}
-            self.save()
-            
-        if not key in self.config[name]:
-            self.config[name][key] = 0
-            self.save()
-            
-        return self.config[name][key]
+        try:
+            return self.config[name][key] ### fast path, no lock needed for plain reads
+        except KeyError:
+            pass
+        with self.config_mutex:
+            if not name in self.config:
+                self.config[name] = {}
+                self.state_version += 1
+                self.save()
+                
+            if not key in self.config[name]:
+                self.config[name][key] = 0
+                self.state_version += 1
+                self.save()
+                
+            return self.config[name][key]
     
     def get_all(self, s_key):
         lst = []
@@ -85,9 +164,17 @@ class config_helper(object):
         self.set('.', key, value)
         
 class Controller(config_helper):
-    def __init__(self, sampling=None, **kwargs):
+    def __init__(self, sampling=None, optimized_lock=None, csv_dir=None, **kwargs):
         super().__init__(**kwargs)
-        self.pid_dict = {}
+        ###################### copy-on-write channel registry
+        # self.pid_dict is an immutable snapshot, replaced as a whole by add/remove.
+        # self.mutex only serializes those writers; readers never take it.
+        self.pid_dict = MappingProxyType({})
+        
+        ###################### fast_wlm_core.OptimizedLock used by the 'optimized' engine
+        self.optimized_lock = optimized_lock
+        self.channel_configs = {}
+        ######################
         
         sampling = self.get('.', 'sampling') if (sampling is None) else sampling;
         sampling = 1 if (sampling==0) else sampling;
@@ -95,6 +182,19 @@ class Controller(config_helper):
         
         self.mutex = Lock()
         self.undersampling = False
+        
+        ###################### parameter updates, applied by the control thread at slot boundaries
+        self.commands = queue.SimpleQueue()
+        self.command_timeout = 5.
+        self.control_thread_id = None
+        self.version = 0
+        self.slot_count = 0 ### PID samples taken by run, keys the cached /get/status
+        self.slots = () ### extra scheduler slots (e.g. lock_calibration.calibration_slot), see add_slot
+        self.cycle_start = None ### perf_counter at the start of the current cycle of run
+        self.cycle_period = None ### s, duration of the last complete cycle over all channels
+        self.metrics = lock_metrics() ### written by the control thread only, served by /metrics
+        self._wakeup = Event()
+        ######################
 
         ###################### Pausing Mechanism Change
         self.runit = True
@@ -102,21 +202,30 @@ class Controller(config_helper):
         self.pause_event.set()
         #######################
         self.csv_logging = False
-        self.csv_dir = r"C:\Users\bali\WM-CSV-Files"
+        self.csv_dir = r"C:\Users\bali\WM-CSV-Files" if csv_dir is None else csv_dir
         os.makedirs(self.csv_dir, exist_ok=True)
         self.csv_files = {}
+        self.archive_dir = os.path.join(self.csv_dir, 'archive')
+        self.archive = None ### created on first use, see __get_archive
+        self.archive_channels = set()
+        self.rollups = lock_rollups(self.archive_dir)
+        ###################### last output / integrator per channel, replayed by add after a restart
+        self.journal = state_journal(os.path.splitext(self.file_config)[0] + '.journal')
+        self.acquire = {} ### lock acquisition timing per channel, see __acquire_sample
 
         self.latest_values = {}
         self.LastWMValue = None
         self.latest_piezo_values = {}
         self.ReferenceLockState = None
+        self.stats = lock_analytics()
+        self.spectra = lock_spectra()
         
     def add(self, name, func_read, func_write, active=None, 
             lock_type=None, tracelen=None, 
             unit_input=None, unit_output=None, 
             accuracy_input=None, accuracy_output=None, 
-            unlock_set_offset=False):
-        if (name in self.pid_dict) or name == '.':
+            unlock_set_offset=False, engine=None, channel_config=None):
+        if (name in self.pid_dict) or name == '.' or len(name.encode('utf-8')) > MAX_NAME: ### the journal keys records by the full name
             return False
         else:
             self.undersampling = False
@@ -172,37 +281,95 @@ class Controller(config_helper):
             WM_Reading_State = self.get(name, 'WM_Reading_State')
             self.set(name, 'WM_Reading_State', WM_Reading_State)
             ################################################# WM Change
+            pid = pid_container(func_read, func_write, lock, 
+                                offset, P, I, D, setpoint, limits, 
+                                tracelen, unlock_set_offset)
+            pid.set_ramp_rate(ramp_rate)
+            pid.add_sink(functools.partial(self.rollups.add, name))
+            self.__resume(name, pid)
+            pid.add_sink(functools.partial(self.__journal_sample, name, pid))
+            pid.add_sink(functools.partial(self.__acquire_sample, name))
+            
+            ################################################# Engine Change
+            if channel_config is not None and self.optimized_lock is not None:
+                self.optimized_lock.add_channel(channel_config)
+                self.channel_configs[name] = channel_config
+                pid.add_engine('optimized', self.__optimized_reader(channel_config.logical_id))
+            engine = self.get(name, 'engine') if (engine is None) else engine
+            engine = 'legacy' if (engine == 0) else engine
+            if not pid.set_engine(engine):
+                engine = 'legacy'
+            self.set(name, 'engine', engine)
+            ################################################# Engine Change
             with self.mutex:
-                self.pid_dict[name] = pid_container(func_read, func_write, lock, 
-                                                    offset, P, I, D, setpoint, limits, 
-                                                    tracelen, unlock_set_offset)
-                self.pid_dict[name].set_ramp_rate(ramp_rate)
+                pid_dict = dict(self.pid_dict)
+                pid_dict[name] = pid
+                self.pid_dict = MappingProxyType(pid_dict)
+                with self.config_mutex:
+                    self.state_version += 1
             return True
             
     def remove(self,name):
         if name in self.pid_dict:
             with self.mutex:
-                del self.pid_dict[name]
+                pid_dict = dict(self.pid_dict)
+                if pid_dict.pop(name, None) is None:
+                    return False
+                self.pid_dict = MappingProxyType(pid_dict)
+                with self.config_mutex:
+                    self.state_version += 1
+            if name in self.channel_configs:
+                self.optimized_lock.remove_channel(self.channel_configs.pop(name).logical_id)
+            self.stats.remove(name)
+            self.spectra.remove(name)
+            self.rollups.remove(name)
             return True
         else:
             return False
             
     def get_list(self):
         return list(self.pid_dict.keys())
+
+    def add_slot(self, slot):
+        '''
+        Give slot a turn in every cycle of run, before the channels.
+        slot.pending() tells whether it has work, slot.step() does one bounded piece of it.
+        '''
+        with self.mutex:
+            self.slots = self.slots + (slot,)
+
+    def remove_slot(self, slot):
+        with self.mutex:
+            self.slots = tuple(s for s in self.slots if s is not slot)
+
+    def __run_slots(self):
+        for slot in self.slots:
+            if not slot.pending():
+                continue
+            self.apply_commands() ################# slot boundary
+            try:
+                slot.step()
+            except Exception as e:
+                self.metrics.error('slot')
+                print('Scheduler slot %s failed: %s' % (type(slot).__name__, e))
         
+    @control_command
     def set_sampling(self, sampling):
         self.set('.', 'sampling',sampling)
         self.undersampling = False
+        return True
         
     def get_status(self, name=None):
         ret = {}
-        if name in self.pid_dict:
-            ret[name] = {'active':self.get(name,'active'), 'lock':self.get(name,'lock')}
-        else:
-            for name in self.pid_dict:
-                ret[name] = {'active':self.get(name,'active'), 'lock':self.get(name,'lock')}
+        names = [name] if name in self.pid_dict else list(self.pid_dict.keys())
+        for name in names:
+            pid = self.pid_dict[name]
+            ret[name] = {'active':self.get(name,'active'), 'lock':self.get(name,'lock'),
+                         'engine':pid.engine, 'cycle_time':pid.cycle_time, 'sink_errors':pid.sink_errors,
+                         'acquire_time':self.acquire.get(name, {}).get('time')}
         return ret
 
+    @control_command
     def set_trace(self, name, tracelen):
         if name in self.pid_dict:
             self.set(name, 'trace', tracelen)
@@ -212,6 +379,7 @@ class Controller(config_helper):
         else:
             return False
         
+    @control_command
     def clear_trace(self, name):
         if name in self.pid_dict:
             pid = self.pid_dict[name]
@@ -242,6 +410,16 @@ class Controller(config_helper):
         else:
             return [], []        
         
+    def get_stats(self, name=None):
+        return self.stats.get(name)
+    
+    def reset_stats(self, name=None):
+        self.spectra.reset(name)
+        return self.stats.reset(name)
+
+    def get_psd(self, name=None):
+        return self.spectra.get(name)
+        
     def get_trace_last(self, name):
         if name in self.pid_dict:
             pid = self.pid_dict[name]
@@ -249,11 +427,17 @@ class Controller(config_helper):
         else:
             return None, None, None, None
 
+    @control_command
     def lock(self, name, state):
         if name in self.pid_dict:
             if self.get(name, 'type') > 0:
                 self.set(name, 'lock', state)
                 pid = self.pid_dict[name]
+                if bool(state) != bool(pid.lock):
+                    self.metrics.transition(name, bool(state))
+                if state and not pid.lock:
+                    self.acquire[name] = {'start':time.time(), 'warm':pid.last_out is not None,
+                                          'time':None, 'inside':0, 'since':None}
                 pid.set_lock(state)
                 if not state:
                     self.set(name, 'last_output', list(pid.get_trace_last()))
@@ -264,6 +448,7 @@ class Controller(config_helper):
         else:
             return False
         
+    @control_command
     def activate(self, name, state):
         if name in self.pid_dict:
             self.set(name, 'active', state)
@@ -272,6 +457,7 @@ class Controller(config_helper):
         else:
             return False
             
+    @control_command
     def reset(self, name):
         if name in self.pid_dict:
             pid = self.pid_dict[name]
@@ -280,6 +466,7 @@ class Controller(config_helper):
         else:
             return False
     
+    @control_command
     def set_offset(self, name, offset):
         if name in self.pid_dict:
             self.set(name, 'offset', offset)
@@ -289,6 +476,7 @@ class Controller(config_helper):
         else:
             return False
             
+    @control_command
     def set_pid(self, name, P, I, D):
         if name in self.pid_dict:
             pid = self.pid_dict[name]
@@ -306,6 +494,7 @@ class Controller(config_helper):
         except:
             return False
             
+    @control_command
     def set_setpoint(self, name, sp):
         if name in self.pid_dict:
             self.set(name, 'setpoint', sp)
@@ -315,6 +504,7 @@ class Controller(config_helper):
         else:
             return False
         
+    @control_command
     def set_limits(self, name, lms):
         if name in self.pid_dict:
             pid = self.pid_dict[name]
@@ -327,6 +517,7 @@ class Controller(config_helper):
             return False 
 
 
+    @control_command
     def set_ramp_rate(self, name, ramp_rate):
         if name in self.pid_dict:
             self.set(name, 'ramp_rate', ramp_rate)
@@ -337,6 +528,7 @@ class Controller(config_helper):
             return False
             
     
+    @control_command
     def set_input_range(self, name, center, span):
         if name in self.pid_dict:
             if span is None or span>0:
@@ -346,7 +538,32 @@ class Controller(config_helper):
         return False
 
 
+    @control_command
+    def set_engine(self, name, engine):
+        if name in self.pid_dict and engine in ENGINES:
+            pid = self.pid_dict[name]
+            if pid.set_engine(engine):
+                self.set(name, 'engine', engine)
+                return True
+        return False
+    
+    def get_engine(self, name):
+        if name in self.pid_dict:
+            return self.pid_dict[name].engine
+        return None
+    
+    def __optimized_reader(self, logical_id):
+        def func_read():
+            try:
+                return self.optimized_lock.read_frequency(logical_id)
+            except Exception as e:
+                # negative values are treated like a WLM readout error by pid_container
+                print('Optimized readout failed:', e)
+                return ErrNoSignal
+        return func_read
+
      ########################################################## WM exposure Change   
+    @control_command
     def set_wm_exposure(self, name, value):
         if name in self.pid_dict:
             self.set(name, 'WM_Exposure', value)
@@ -365,46 +582,173 @@ class Controller(config_helper):
        ########################################################## WM exposure Change
 
 
+    def __resume(self, name, pid):
+        '''Restore integrator and output of a channel from the journal and drive the output there.'''
+        state = self.journal.get(name)
+        if state is None and self.config.get(name, {}).get('last_piezo_output') is not None:
+            state = {'output': self.config[name]['last_piezo_output'], 'integral': None} ### kept in config.json before the journal
+        if state is None:
+            return
+        if state['integral'] is not None and state.get('locked'):
+            ### only a running lock's integrator: an unlock resets it, the relock then seeds it from the output
+            pid.pid._integral = state['integral']
+            pid.pid._last_input = state.get('last_input')
+            pid.resumed = True ### set_lock keeps them instead of seeding from the output
+        if state['output'] is not None:
+            print(f"Resuming {name} at output {state['output']}")
+            try:
+                pid.last_out = pid.func_write(state['output'], None) if callable(pid.func_write) else state['output']
+            except Exception as e:
+                print(f"Could not resume output of {name}: {e}")
+                return
+            self.latest_piezo_values[name] = pid.last_out
+
+    def __journal_sample(self, name, pid, t, value, error, output, locked):
+        if output is not None:
+            try:
+                self.journal.append(name, t, output, pid.pid._integral, pid.pid._last_input, locked)
+            except OSError as e: ### a full / lost disk must not stop the lock
+                self.metrics.error('journal')
+                if self.metrics.errors['journal'] == 1:
+                    print(f"Could not journal {name}: {e}")
+
+    def __acquire_sample(self, name, t, value, error, output, locked):
+        acq = self.acquire.get(name)
+        if acq is None or acq['time'] is not None or not locked:
+            return
+        tolerance = self.get(name, 'acquire_tolerance') or TOLERANCE
+        if value is not None and value > 0 and abs(error) <= tolerance:
+            acq['since'] = t if acq['inside'] == 0 else acq['since']
+            acq['inside'] += 1
+        else:
+            acq['inside'] = 0
+        if acq['inside'] >= ACQUIRE_SAMPLES:
+            acq['time'] = max(0., acq['since'] - acq['start'])
+            print(f"{name} acquired lock in {acq['time']:.2f} s ({'warm' if acq['warm'] else 'cold'} start)")
+
+    def get_acquire_time(self, name):
+        return self.acquire.get(name, {}).get('time')
+
+    def get_journal(self, name):
+        return self.journal.get(name)
+
     def set_last_piezo_output(self, name, value):
         if name in self.pid_dict:
             self.set(name, 'last_piezo_voltage', value)
             return True
         return False
         
+    def submit(self, func, *args):
+        '''
+        Queue func(*args) for the control thread and return a Future resolving to (ret, version).
+        Without a running control thread the call is applied immediately, on the control thread
+        (i.e. from inside another command) it runs directly as part of that command.
+        '''
+        future = Future()
+        if threading.get_ident() == self.control_thread_id:
+            try:
+                future.set_result((func(*args), self.version))
+            except Exception as e:
+                future.set_exception(e)
+        elif self.control_thread_id is None:
+            self.__execute([(func, args, future)])
+        else:
+            self.commands.put((func, args, future))
+            self._wakeup.set()
+            if self.control_thread_id is None: ### the control thread ended in between, nobody else drains the queue
+                self.apply_commands()
+        return future
+    
+    def request(self, method, *args):
+        '''Like submit, but for a Controller method given by name.'''
+        func = getattr(self, method)
+        func = getattr(func, '__wrapped__', None) or getattr(type(self), method)
+        return self.submit(func, self, *args)
+    
+    def apply_commands(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.commands.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.__execute(batch)
+        return len(batch)
+    
+    def __execute(self, batch):
+        results = []
+        with self.deferred_save(): ### one config write per batch
+            self.version += 1
+            for func, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    results.append((future, func(*args), None))
+                except Exception as e:
+                    self.metrics.error('command')
+                    results.append((future, None, e))
+        for future, ret, exc in results:
+            if exc is None:
+                future.set_result((ret, self.version))
+            else:
+                future.set_exception(exc)
+    
+    def __idle(self, duration):
+        self._wakeup.wait(duration)
+        self._wakeup.clear()
+        self.apply_commands()
+
     def count(self):
         i = 0
-        with self.mutex:
-            for name, pid in self.pid_dict.items():
-                if self.get(name,'active'):
-                    i+=1
+        for name in self.pid_dict:
+            if self.get(name,'active'):
+                i+=1
         return i
     ################################################### Function for Running PID Controller
      ##########################################################################################
     def run(self):
         starttime = time.time()
         self.runit = True
+        self.control_thread_id = threading.get_ident()
+        self.rollups.start()
         last_out = 0
         print("Controller Running, ",starttime)
        # print ("PIDDict:  ",self.pid_dict)
-        while self.runit:
-            self.pause_event.wait()
-            N = len(self.pid_dict)
-            ActiveChannels = self.count()
-            #print("ActiveChannels: ", ActiveChannels)
-            if N>0:
-                sampling = float(self.get('.','sampling'))
-                wait_dur = sampling/N
-                #print("Wait-Dur",wait_dur)
-                with self.mutex:
-                    for name, pid in self.pid_dict.items():
+        try:
+            while self.runit:
+                while not self.pause_event.is_set():
+                    self.__idle(.05)
+                self.apply_commands()
+                t_cycle = time.perf_counter()
+                if self.cycle_start is not None:
+                    self.cycle_period = t_cycle - self.cycle_start
+                self.cycle_start = t_cycle
+                self.__run_slots()
+                pid_dict = self.pid_dict ### snapshot, add/remove swap in a new one
+                N = len(pid_dict)
+                ActiveChannels = self.count()
+                #print("ActiveChannels: ", ActiveChannels)
+                if N>0:
+                    sampling = float(self.get('.','sampling'))
+                    wait_dur = sampling/N
+                    #print("Wait-Dur",wait_dur)
+                    for name, pid in pid_dict.items():
+                        self.apply_commands() ################# slot boundary
                         active = self.get(name, 'active')
                         if active:
                             pid.SingleChannelMode = (ActiveChannels == 1)
                             _, val, out = pid() ################# PID Function
+                            self.slot_count += 1
+                            self.metrics.sample(name, val, pid.cycle_time, pid.write_time)
+                            if pid.cycle_time > wait_dur:
+                                self.metrics.error('overrun') ### this sample alone took longer than its share of sampling
                             self.latest_values[name] = val
                             #print("Controller Latest Values ", self.latest_values)
                             self.__check_input_range(name, val)#### unlock laser, when wavelength is out of specific range
                             t, y, e, o = pid.get_trace_last()
+                            self.stats.add(name, t, y, e, pid.lock)
+                            self.spectra.add(name, t, y, e, sampling) ### each channel is served once per sampling period
                             ################################ Save CSV new Code
                             if name in self.csv_files:
                                 filename = self.csv_files[name]
@@ -423,6 +767,10 @@ class Controller(config_helper):
                                         e,
                                         o
                                     ])
+                            if name in self.archive_channels:
+                                self.archive.append(name, (t, self.get(name, 'setpoint'),
+                                    self.get(name, 'P'), self.get(name, 'I'), self.get(name, 'D'),
+                                    self.get(name, 'WM_Exposure'), y, e, o))
                             ##################################################
                         t_wait =  wait_dur - float(time.time()-starttime)%wait_dur
                         if t_wait<0 and not self.undersampling:
@@ -430,8 +778,16 @@ class Controller(config_helper):
                             print('Warning: sampling rate can not be achieved!', t_wait)
                             t_wait = max(0,t_wait)
                         time.sleep(t_wait)
-            else:
-                time.sleep(.5)
+                else:
+                    self.__idle(.5)
+        finally:
+            ### also when a channel raised: later commands must not be queued to a dead thread
+            self.control_thread_id = None
+            self.apply_commands()
+            if self.archive is not None:
+                self.archive.close()
+            self.rollups.stop()
+            self.journal.compact()
             ####################################################################################################################################################################################      
     def __in_range(self, name, val):
         center = self.get(name, 'range_center')
@@ -444,17 +800,18 @@ class Controller(config_helper):
     
     def __check_input_range(self, name, val):
         if self.get(name, 'lock') and not self.__in_range(name, val) :
+            self.metrics.error('out_of_range')
             self.lock(name, False)
     def pause(self):
         self.pause_event.clear()
     def resume(self):
         self.pause_event.set()
     def stop(self):
+        for name in self.pid_dict:
+            self.lock(name, False)
         self.runit = False
         self.pause_event.set()
-        with self.mutex:
-            for name, pid in self.pid_dict.items():
-                self.lock(name, False)
+        self._wakeup.set()
 
     def set_piezo_manual(self, name, value):
         if name not in self.pid_dict:
@@ -500,3 +857,32 @@ class Controller(config_helper):
                 print(f"CSV-Logging deactivated for {name}")
                 del self.csv_files[name]
 
+    def __get_archive(self):
+        if self.archive is None:
+            self.archive = lock_archive(self.archive_dir)
+        return self.archive
+
+    def enable_archive(self, name, enable=True):
+        if enable:
+            self.__get_archive().start()
+            self.archive_channels.add(name)
+            print(f"Archive activated for {name} → {self.archive.root}")
+        else:
+            self.archive_channels.discard(name)
+        return True
+
+    def get_archive(self, name, t0=None, t1=None, columns=None):
+        data = self.__get_archive().read(name, t0, t1, columns)
+        return {c: v.tolist() for c, v in data.items()}
+
+    def get_history(self, name, t0=None, t1=None, max_points=1000):
+        t1 = time.time() if t1 is None else t1
+        t0 = t1-3600 if t0 is None else t0
+        raw = None
+        if name in self.archive_channels or os.path.isfile(os.path.join(self.archive_dir, name, 'index.json')):
+            raw = lambda t0, t1: self.__get_archive().read(name, t0, t1, ['time', 'input', 'error', 'output'])
+        return self.rollups.history(name, t0, t1, max_points, raw)
+
+    def get_rollup(self, name, level=None, t0=None, t1=None, max_points=1000):
+        return self.rollups.get(name, level, t0, t1, max_points)
+
@@ -0,0 +1,272 @@
+"""
+Host and control-loop health, sampled in the background.
+
+`PC_health.get_cpu` blocked its caller for a second (`cpu_percent(interval=1)`)
+and the network counters were only read at start-up. `health_sampler` runs its
+own thread and records, every `period` seconds, into ring buffers:
+
+    cpu, ram, disk               percent (cpu since the previous sample, non-blocking)
+    net_sent, net_recv           bytes/s since the previous sample
+    rss, threads                 of this process
+    gc_count, gc_pause_total,    collections and their pauses (s) since the previous
+    gc_pause_max                 sample, timed through gc.callbacks
+    <sources>                    any extra callables, e.g. the control-loop timing of web_lock
+
+Samples can also be handed to a `telemetry_writer`, which collects points and
+writes them in batches from a background thread (e.g. to InfluxDB via
+`influx_sink`) instead of one client connection per value.
+
+    writer = telemetry_writer(influx_sink(url, token, org='BaLi', bucket='server'))
+    sampler = health_sampler(period=1., writer=writer)
+    sampler.start()
+    sampler.get_trace(['cpu', 'gc_pause_max'], last=60)
+"""
+
+from __future__ import annotations
+
+import collections
+import gc
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import psutil
+
+PERIOD = 1.          # s between two samples
+TRACELEN = 3600      # samples per ring buffer (1 h at the default period)
+FLUSH_INTERVAL = 5.  # s between two batches of the telemetry writer
+MAX_POINTS = 10000   # points the telemetry writer keeps while the sink is unreachable
+
+Point = Tuple[str, Dict[str, float], float]  # (measurement, fields, time)
+
+
+class telemetry_writer(object):
+    """Collects points and passes them to `sink` in batches, from its own thread."""
+
+    def __init__(self, sink: Callable[[List[Point]], None], flush_interval: float = FLUSH_INTERVAL,
+                 max_points: int = MAX_POINTS) -> None:
+        """
+        :param sink: writes a list of (measurement, fields, time) points, may raise
+        :param flush_interval: s between two batches
+        :param max_points: oldest points are dropped beyond this while the sink fails
+        """
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.points: collections.deque = collections.deque(maxlen=max_points)
+        self.mutex = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def write(self, measurement: str, fields: Dict[str, float], t: Optional[float] = None) -> None:
+        """Queue one point; never blocks on the sink."""
+        with self.mutex:
+            if len(self.points) == self.points.maxlen:
+                self.dropped += 1
+            self.points.append((measurement, fields, time.time() if t is None else t))
+
+    def flush(self) -> int:
+        with self.mutex:
+            batch = list(self.points)
+            self.points.clear()
+        if not batch:
+            return 0
+        try:
+            self.sink(batch)
+        except Exception as e:
+            self.errors += 1
+            print('Telemetry write failed: %s' % e)
+            with self.mutex: ### keep them for the next batch, the oldest go if the buffer overflows
+                points = batch + list(self.points)
+                self.dropped += max(0, len(points) - self.points.maxlen)
+                self.points.clear()
+                self.points.extend(points)
+            return 0
+        self.written += len(batch)
+        return len(batch)
+
+    def start(self) -> None:
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+
+        def loop():
+            while not self.__stop.wait(self.flush_interval):
+                self.flush()
+            self.flush()
+        self.__thread = threading.Thread(target=loop, name='telemetry_writer', daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
+
+
+def influx_sink(url: str, token: str, org: str, bucket: str, tags: Optional[Dict[str, str]] = None
+                ) -> Callable[[List[Point]], None]:
+    """Sink for `telemetry_writer` writing each batch with one InfluxDB request."""
+    from influxdb_client import InfluxDBClient, Point as InfluxPoint, WritePrecision
+    from influxdb_client.client.write_api import SYNCHRONOUS
+
+    client = InfluxDBClient(url=url, token=token, org=org)
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+
+    def sink(points: List[Point]) -> None:
+        records = []
+        for measurement, fields, t in points:
+            p = InfluxPoint(measurement).time(int(t*1e9), WritePrecision.NS)
+            for key, value in (tags or {}).items():
+                p = p.tag(key, value)
+            for key, value in fields.items():
+                if value is not None:
+                    p = p.field(key, value)
+            records.append(p)
+        write_api.write(bucket=bucket, record=records)
+    return sink
+
+
+class gc_timer(object):
+    """Collections and pause times of the garbage collector, via gc.callbacks."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.__t0 = 0.
+
+    def __call__(self, phase: str, info: Dict[str, Any]) -> None:
+        if phase == 'start':
+            self.__t0 = time.perf_counter()
+        else:
+            pause = time.perf_counter() - self.__t0
+            self.count += 1
+            self.total += pause
+            if pause > self.max:
+                self.max = pause
+
+    def take(self) -> Tuple[int, float, float]:
+        """(count, total pause, max pause) since the previous call."""
+        ret = (self.count, self.total, self.max)
+        self.count, self.total, self.max = 0, 0., 0.
+        return ret
+
+
+class health_sampler(object):
+    """Background sampler of host, process and control-loop metrics into ring buffers."""
+
+    def __init__(self, period: float = PERIOD, tracelen: int = TRACELEN,
+                 sources: Optional[Dict[str, Callable[[], Optional[float]]]] = None,
+                 writer: Optional[telemetry_writer] = None, measurement: str = 'server_status',
+                 disk: str = '/') -> None:
+        """
+        :param period: s between two samples, may be changed while running
+        :param sources: extra metrics, name -> callable returning a number (or None)
+        :param writer: every sample is also queued there as one point of `measurement`
+        :param disk: path whose disk usage is reported
+        """
+        self.period = period
+        self.sources = dict(sources or {})
+        self.writer = writer
+        self.measurement = measurement
+        self.disk = disk
+        self.process = psutil.Process()
+        self.gc = gc_timer()
+        self.times: collections.deque = collections.deque(maxlen=tracelen)
+        self.traces: Dict[str, collections.deque] = collections.defaultdict(lambda: collections.deque(maxlen=tracelen))
+        self.mutex = threading.Lock()
+        self.__net = None
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+        psutil.cpu_percent(interval=None) ### the first call only sets the reference point
+
+    def sample(self) -> Dict[str, Optional[float]]:
+        """Take one sample (non-blocking) and store it."""
+        now = time.time()
+        net = psutil.net_io_counters()
+        ret: Dict[str, Optional[float]] = {
+            'cpu': psutil.cpu_percent(interval=None),
+            'ram': psutil.virtual_memory().percent,
+            'disk': psutil.disk_usage(self.disk).percent,
+            'net_sent': None, 'net_recv': None,
+            'rss': self.process.memory_info().rss,
+            'threads': threading.active_count(),
+        }
+        if self.__net is not None:
+            dt = now - self.__net[0]
+            ret['net_sent'] = (net.bytes_sent - self.__net[1].bytes_sent)/dt
+            ret['net_recv'] = (net.bytes_recv - self.__net[1].bytes_recv)/dt
+        self.__net = (now, net)
+        ret['gc_count'], ret['gc_pause_total'], ret['gc_pause_max'] = self.gc.take()
+        for name, source in self.sources.items():
+            try:
+                ret[name] = source()
+            except Exception:
+                ret[name] = None
+        with self.mutex:
+            n = len(self.times)
+            self.times.append(now)
+            for name, value in ret.items():
+                trace = self.traces[name]
+                if len(trace) < n: ### a source added later: pad, so all traces line up with self.times
+                    trace.extend([None]*(n - len(trace)))
+                trace.append(value)
+        if self.writer is not None:
+            self.writer.write(self.measurement, {k: v for k, v in ret.items() if v is not None}, now)
+        return ret
+
+    def latest(self) -> Dict[str, Any]:
+        with self.mutex:
+            if not self.times:
+                return {}
+            ret = {name: trace[-1] for name, trace in self.traces.items()}
+            ret['time'] = self.times[-1]
+        return ret
+
+    def get_trace(self, names: Optional[Sequence[str]] = None, last: Optional[int] = None) -> Dict[str, List[Any]]:
+        """{'time': [...], name: [...]} of the ring buffers, the last `last` samples only if given."""
+        with self.mutex:
+            names = list(self.traces) if names is None else [name for name in names if name in self.traces]
+            start = 0 if last is None else max(0, len(self.times) - int(last))
+            ret = {'time': list(self.times)[start:]}
+            for name in names:
+                ret[name] = list(self.traces[name])[start:]
+        return ret
+
+    def start(self) -> None:
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        gc.callbacks.append(self.gc)
+        if self.writer is not None:
+            self.writer.start()
+
+        def loop():
+            while not self.__stop.wait(self.period):
+                try:
+                    self.sample()
+                except Exception as e:
+                    print('Health sample failed: %s' % e)
+        self.__thread = threading.Thread(target=loop, name='health_sampler', daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+        if self.gc in gc.callbacks:
+            gc.callbacks.remove(self.gc)
+        if self.writer is not None:
+            self.writer.stop()
+
+
+## AGENT_UPDATE
+# - Added `health_sampler` (host / process / GC / control-loop metrics into ring buffers from a
+#   background thread) and `telemetry_writer` (batched, non-blocking point writer, `influx_sink`).
+# - Reason: PC_health blocked its caller for 1 s per CPU reading and wrote one InfluxDB
+#   connection per value.
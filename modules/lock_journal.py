@@ -0,0 +1,227 @@
+"""
+Append-only binary journal of the last output and PID state per channel.
+
+The file starts with `MAGIC`; every sample appends one record
+
+    name length (uint16), channel name (utf-8), time, output, integrator, last input, locked, crc32
+
+with a single `os.write`, replacing the two full config.json rewrites per
+output. The full name is stored, so channels sharing a prefix never share a
+record. The file is opened with O_APPEND, so a crashed process leaves at most
+one torn record at the end; `recover` drops it (crc mismatch or short read)
+and keeps the newest record of every channel. When `compact_records`
+records have been written a background thread rewrites the journal
+atomically with just the newest record per channel: the bulk is written and
+fsynced without the lock, only the records appended meanwhile and the file
+swap hold it, so the appending control thread never waits for the disk.
+
+`locked` tells whether the integrator belongs to a running lock: an unlock
+resets it, so after a restart only a locked channel resumes its integrator.
+Journals of older formats (`MAGIC_V2` without `locked`, or no header at all:
+fixed-size records, names truncated to 16 bytes) are read once and rewritten
+in the current one, with the lock state unknown.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Optional
+
+MAGIC = b'WMJ3'
+MAGIC_V2 = b'WMJ2'
+HEAD = struct.Struct('<H')
+MAX_NAME = 0xffff  # bytes of a utf-8 channel name, limited by HEAD
+VALUES = struct.Struct('<ddddb')  # locked: 1, 0 or -1 (unknown)
+VALUES_V2 = struct.Struct('<dddd')
+CRC = struct.Struct('<I')
+LEGACY = struct.Struct('<16sdddd')  # records of journals without MAGIC
+COMPACT_RECORDS = 10000
+FIELDS = ('time', 'output', 'integral', 'last_input', 'locked')
+
+
+def record_size(name: str) -> int:
+    """Bytes of one record of channel `name`."""
+    return HEAD.size + len(name.encode('utf-8')) + VALUES.size + CRC.size
+
+
+def _pack(name: str, t: float, output: Optional[float], integral: Optional[float],
+          last_input: Optional[float], locked: Optional[bool] = None) -> bytes:
+    key = name.encode('utf-8')
+    rec = HEAD.pack(len(key)) + key + VALUES.pack(
+        t, float('nan') if output is None else output,
+        float('nan') if integral is None else integral,
+        float('nan') if last_input is None else last_input,
+        -1 if locked is None else int(bool(locked)))
+    return rec + CRC.pack(zlib.crc32(rec))
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if value != value else value
+
+
+class state_journal(object):
+    """Write-ahead journal of (channel, time, output, integrator, last input)."""
+
+    def __init__(self, path: str, compact_records: int = COMPACT_RECORDS) -> None:
+        """
+        :param path: Journal file, created if missing.
+        :param compact_records: Records appended before the journal is compacted.
+        """
+        self.path = path
+        self.compact_records = compact_records
+        self.mutex = threading.Lock()
+        self.latest: Dict[str, bytes] = {}  # newest packed record per channel
+        self.recover()
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'wb') as f:
+                f.write(MAGIC)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | getattr(os, 'O_BINARY', 0))
+        self.records = len(self.latest)
+        self.__due = threading.Event()  # set by append when `compact_records` is reached
+        self.__thread = threading.Thread(target=self.__compact_loop, name='journal-compact', daemon=True)
+        self.__thread.start()
+
+    def recover(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Replay the journal file, truncating a torn tail; returns the state per channel."""
+        self.latest = {}
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if data and not data.startswith((MAGIC, MAGIC_V2)):
+            self.__recover_legacy(data)
+            return {name: self.get(name) for name in self.latest}
+        values = VALUES_V2 if data.startswith(MAGIC_V2) else VALUES
+        pos = valid = len(MAGIC) if data else 0
+        while pos + HEAD.size <= len(data):
+            n, = HEAD.unpack_from(data, pos)
+            end = pos + HEAD.size + n + values.size + CRC.size
+            if end > len(data):
+                break
+            crc, = CRC.unpack_from(data, end - CRC.size)
+            if zlib.crc32(data[pos:end - CRC.size]) != crc:
+                break
+            name = data[pos + HEAD.size:pos + HEAD.size + n].decode('utf-8', 'replace')
+            if values is VALUES:
+                self.latest[name] = data[pos:end]
+            else:
+                self.latest[name] = _pack(name, *(_nan_to_none(v) for v in values.unpack_from(data, pos + HEAD.size + n)))
+            pos = valid = end
+        if values is not VALUES:
+            print('Journal', self.path, 'converted from records without lock state')
+            self.__rewrite()
+        elif valid != len(data):
+            print('Journal', self.path, 'truncated at byte', valid, 'of', len(data))
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid)
+        return {name: self.get(name) for name in self.latest}
+
+    def __recover_legacy(self, data: bytes) -> None:
+        size = LEGACY.size + CRC.size
+        for pos in range(0, len(data) - size + 1, size):
+            rec = data[pos:pos + LEGACY.size]
+            crc, = CRC.unpack_from(data, pos + LEGACY.size)
+            if zlib.crc32(rec) != crc:
+                break
+            key, *values = LEGACY.unpack(rec)
+            name = key.rstrip(b'\0').decode('utf-8', 'replace')
+            self.latest[name] = _pack(name, *(_nan_to_none(v) for v in values))
+        print('Journal', self.path, 'converted from fixed-size records')
+        self.__rewrite()
+
+    def append(self, name: str, t: float, output: Optional[float], integral: Optional[float] = None,
+               last_input: Optional[float] = None, locked: Optional[bool] = None) -> None:
+        """Journal one sample; None is stored as NaN (locked: as unknown)."""
+        rec = _pack(name, t, output, integral, last_input, locked)
+        with self.mutex:
+            if self.fd is None:
+                return
+            os.write(self.fd, rec)
+            self.latest[name] = rec
+            self.records += 1
+            if self.records >= self.compact_records:
+                self.__due.set()
+
+    def get(self, name: str) -> Optional[Dict[str, Optional[float]]]:
+        """Newest journaled state of `name`, None if there is none."""
+        rec = self.latest.get(name)
+        if rec is None:
+            return None
+        n, = HEAD.unpack_from(rec)
+        *values, locked = VALUES.unpack_from(rec, HEAD.size + n)
+        ret = {k: _nan_to_none(v) for k, v in zip(FIELDS, values)}
+        ret['locked'] = None if locked < 0 else bool(locked)
+        return ret
+
+    def compact(self) -> None:
+        """Rewrite the journal with the newest record per channel, on the calling thread."""
+        self.__compact()
+
+    def __compact_loop(self) -> None:
+        while True:
+            self.__due.wait()
+            if self.fd is None:
+                return
+            try:
+                self.__compact()
+            except OSError as e:
+                print('Journal', self.path, 'not compacted:', e)
+
+    def __rewrite(self) -> None:
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC + b''.join(self.latest.values()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def __compact(self) -> None:
+        with self.mutex:
+            if self.fd is None:
+                return
+            self.__due.clear()
+            snapshot = dict(self.latest)
+            self.records = len(snapshot)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC + b''.join(snapshot.values()))
+            f.flush()
+            os.fsync(f.fileno())
+        with self.mutex:
+            if self.fd is None: ### closed meanwhile, the journal stays as it is
+                os.remove(tmp)
+                return
+            tail = b''.join(rec for name, rec in self.latest.items() if snapshot.get(name) is not rec)
+            if tail: ### appended while the bulk was written
+                with open(tmp, 'ab') as f:
+                    f.write(tail)
+            os.close(self.fd) ### an open file cannot be replaced on Windows
+            os.replace(tmp, self.path)
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | getattr(os, 'O_BINARY', 0))
+            self.records = len(self.latest)
+
+    def close(self) -> None:
+        with self.mutex:
+            if self.fd is not None:
+                os.fsync(self.fd)
+                os.close(self.fd)
+                self.fd = None
+        self.__due.set() ### ends __compact_loop
+        if self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+
+## AGENT_UPDATE
+# - Added `state_journal`, an append-only journal of variable-length records (crc32 each,
+#   torn-tail recovery, periodic compaction) of each channel's last output, integrator and input.
+# - Reason: persisting the last piezo output rewrote config.json twice per sample.
+# - Records carry the full channel name (length-prefixed) behind a file header; journals of
+#   the fixed-size format are converted on open.
+# - Reason: names were truncated to 16 bytes, so channels sharing a prefix overwrote each other.
+# - Records carry the lock state of the channel; older journals are converted with it unknown.
+# - Reason: after an unlock the journaled integrator is reset, resuming it made the relock jump.
+# - Compaction runs on a background thread, the control thread only appends.
+# - Reason: the rewrite and fsync every `compact_records` samples stalled the lock loop.
@@ -0,0 +1,76 @@
+"""
+JSON serialiser used for the HTTP API and the push streams.
+
+`dumps` returns bytes and uses orjson when it is installed (several times
+faster for the long float lists of traces, NumPy arrays are written
+natively), otherwise the standard library. Both backends accept NumPy
+arrays and scalars, read-only mappings and sets.
+
+The backends differ in one detail: orjson writes NaN / Infinity as null,
+the standard library as the (non-standard) tokens NaN / Infinity.
+
+    from modules import lock_json
+    lock_json.use('json')   # force the standard library, e.g. for comparisons
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Mapping
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+
+def _default(obj: Any) -> Any:
+    """Types neither backend handles by itself."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError('Object of type %s is not JSON serializable' % type(obj).__name__)
+
+
+def dumps_json(obj: Any) -> bytes:
+    return json.dumps(obj, default=_default).encode()
+
+
+def dumps_orjson(obj: Any) -> bytes:
+    try:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    except TypeError:  # e.g. integers beyond 64 bit
+        return dumps_json(obj)
+
+
+BACKENDS: Dict[str, Callable[[Any], bytes]] = {'json': dumps_json}
+if orjson is not None:
+    BACKENDS['orjson'] = dumps_orjson
+
+backend = 'orjson' if orjson is not None else 'json'
+dumps = BACKENDS[backend]
+
+
+def use(name: str) -> None:
+    """Select the backend of `dumps` ('orjson' or 'json')."""
+    global backend, dumps
+    if name not in BACKENDS:
+        raise ValueError('JSON backend %s is not available, choose from %s' % (name, ', '.join(BACKENDS)))
+    backend = name
+    dumps = BACKENDS[name]
+
+
+## AGENT_UPDATE
+# - Added `lock_json.dumps`, a bytes-returning serialiser that uses orjson when available and
+#   the standard library otherwise, both handling NumPy arrays / scalars.
+# - Reason: large trace and config responses were serialised with plain json.dumps.
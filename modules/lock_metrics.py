@@ -0,0 +1,167 @@
+"""
+Counters and histograms of the control loop, rendered in the Prometheus text format.
+
+The control thread is the only writer: every update is a plain increment of an
+int / float (a dict entry or a list element), no lock is taken in the hot loop.
+Readers (`render`, served by /metrics) copy the values without locking either,
+so a scrape may see a sample counted in a histogram bucket but not yet in its
+sum; Prometheus tolerates that.
+
+    wavemeter_cycle_seconds{channel}            histogram, one channel sample (read, PID, write)
+    wavemeter_write_seconds{channel}            histogram, func_write (DAC / laser controller)
+    wavemeter_readout_total{channel,state}      ok / underexposed / overexposed / error
+    wavemeter_lock_transitions_total{channel,direction}
+    wavemeter_errors_total{kind}                undersampling, command, slot, ...
+
+Values owned by other objects (queue depths, loop period, lock state) are read
+when rendering and passed to `render` by the caller.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+CYCLE_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5.)  # s
+WRITE_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25)  # s
+PREFIX = 'wavemeter_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[Tuple[str, str], ...]
+Extra = Tuple[str, str, str, Labels, Optional[float]]  # (name, type, help, labels, value)
+
+
+def readout_state(value: Optional[float]) -> str:
+    """WLM reading -> state, the classification of WM_SELCTOR (see wavelengthmeter error codes)."""
+    if value is None or value != value:
+        return 'error'
+    if value > 0:
+        return 'ok'
+    if value == -4: ### ErrBigSignal
+        return 'overexposed'
+    if value >= -3: ### ErrNoValue, ErrNoSignal, ErrBadSignal, ErrLowSignal
+        return 'underexposed'
+    return 'error'
+
+
+class histogram(object):
+    """Fixed-bucket histogram, single writer."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0]*(len(self.buckets) + 1)  # per bucket, the last one is +Inf
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in labels)
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        value = int(value)
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class lock_metrics(object):
+    """Hot-loop metrics of a Controller."""
+
+    def __init__(self, cycle_buckets: Sequence[float] = CYCLE_BUCKETS,
+                 write_buckets: Sequence[float] = WRITE_BUCKETS) -> None:
+        self.cycle_buckets = tuple(cycle_buckets)
+        self.write_buckets = tuple(write_buckets)
+        self.cycle: Dict[str, histogram] = {}
+        self.write: Dict[str, histogram] = {}
+        self.readout: Dict[Tuple[str, str], int] = {}
+        self.transitions: Dict[Tuple[str, str], int] = {}
+        self.errors: Dict[str, int] = {}
+
+    # ------------------------------------------------------------------ control thread
+    def sample(self, name: str, value: Optional[float], cycle_time: Optional[float],
+               write_time: Optional[float]) -> None:
+        """One channel sample."""
+        key = (name, readout_state(value))
+        self.readout[key] = self.readout.get(key, 0) + 1
+        if cycle_time is not None:
+            hist = self.cycle.get(name)
+            if hist is None:
+                hist = self.cycle[name] = histogram(self.cycle_buckets)
+            hist.observe(cycle_time)
+        if write_time is not None:
+            hist = self.write.get(name)
+            if hist is None:
+                hist = self.write[name] = histogram(self.write_buckets)
+            hist.observe(write_time)
+
+    def transition(self, name: str, locked: bool) -> None:
+        key = (name, 'lock' if locked else 'unlock')
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    # ------------------------------------------------------------------ readers
+    def render(self, extra: Iterable[Extra] = ()) -> str:
+        """
+        Text exposition of all metrics.
+        :param extra: (name, 'gauge' | 'counter', help, labels, value) of further metrics, None values are left out
+        """
+        lines: List[str] = []
+        for name, doc, hists in (('cycle_seconds', 'Duration of one channel sample (read, PID, write).', self.cycle),
+                                 ('write_seconds', 'Duration of the output write (func_write).', self.write)):
+            metric = PREFIX + name
+            lines += ['# HELP %s %s' % (metric, doc), '# TYPE %s histogram' % metric]
+            for channel, hist in list(hists.items()):
+                counts = list(hist.counts)
+                cumulative = 0
+                for le, n in zip(hist.buckets + (math.inf,), counts):
+                    cumulative += n
+                    lines.append('%s_bucket%s %d' % (metric, _labels((('channel', channel), ('le', _number(le)))), cumulative))
+                lines.append('%s_sum%s %s' % (metric, _labels((('channel', channel),)), _number(hist.sum)))
+                lines.append('%s_count%s %d' % (metric, _labels((('channel', channel),)), cumulative))
+        for name, doc, values, keys in (
+                ('readout_total', 'Wavemeter readings per channel and state.', self.readout, ('channel', 'state')),
+                ('lock_transitions_total', 'Lock / unlock transitions per channel.', self.transitions, ('channel', 'direction')),
+                ('errors_total', 'Errors of the control loop by kind.', self.errors, ('kind',))):
+            metric = PREFIX + name
+            lines += ['# HELP %s %s' % (metric, doc), '# TYPE %s counter' % metric]
+            for key, n in sorted(list(values.items())):
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append('%s%s %d' % (metric, _labels(tuple(zip(keys, key))), n))
+        seen = set()
+        for name, kind, doc, labels, value in extra:
+            if value is None:
+                continue
+            metric = PREFIX + name
+            if metric not in seen:
+                seen.add(metric)
+                lines += ['# HELP %s %s' % (metric, doc), '# TYPE %s %s' % (metric, kind)]
+            lines.append('%s%s %s' % (metric, _labels(labels), _number(value)))
+        return '\n'.join(lines) + '\n'
+
+
+## AGENT_UPDATE
+# - Added `lock_metrics`: lock-free counters / histograms updated by the control thread and a
+#   Prometheus text exposition renderer, served by /metrics.
+# - Reason: the lock state was only visible through print calls and config writes.
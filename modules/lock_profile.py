@@ -0,0 +1,261 @@
+"""
+Profiling of the running control loop, switched on and off at runtime.
+
+Two modes, each for a limited number of seconds and without restarting the lock:
+
+- 'stack': a sampling thread reads the stack of the control thread every
+  `interval` seconds (`sys._current_frames`) and counts the collapsed stacks.
+  The result is written as `<directory>/profile_<time>.folded`, one
+  `root;...;leaf count` line per stack, the input format of flamegraph.pl,
+  speedscope and inferno.
+- 'timing': only `pid_container.__call__`, `func_read` and `func_write` of every
+  channel are wrapped with timers (installed and removed at a slot boundary, on
+  the channel instances only), giving count / mean / p95 / max per channel and
+  function. `uninstalled` is False (with `uninstall_error`) if the timers could
+  not be removed in time; the removal stays queued.
+
+Both report their own overhead: the sampling time spent holding the GIL in
+'stack' mode, the measured cost of the timing wrappers in 'timing' mode, as a
+fraction of the profiled duration.
+
+    prof = lock_profiler(cntrl, directory='profiles')
+    prof.start(mode='stack', seconds=10, interval=0.005)
+    prof.status()     # running / result
+"""
+
+from __future__ import annotations
+
+import collections
+import functools
+import math
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .lock_controller import wait_command
+
+MODES = ('stack', 'timing')
+INTERVAL = 0.005     # s between two stack samples
+MAX_SECONDS = 300.   # longest profile run
+MAX_TIMES = 100000   # durations kept per timed function (for the percentiles)
+TOP = 20             # stacks / leaf functions listed in the result
+
+
+def frame_label(code: Any) -> str:
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def collapse(frame: Any) -> str:
+    """Stack of frame as 'root;...;leaf'."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code).replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class call_timer(object):
+    """Durations of one function."""
+
+    def __init__(self) -> None:
+        self.times: collections.deque = collections.deque(maxlen=MAX_TIMES)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, dt: float) -> None:
+        self.times.append(dt)
+        self.count += 1
+        self.total += dt
+        if dt > self.max:
+            self.max = dt
+
+    def summary(self) -> Dict[str, Any]:
+        times = sorted(self.times)
+        p95 = times[min(len(times) - 1, int(math.ceil(0.95*len(times))) - 1)] if times else None
+        return {'count': self.count, 'total': self.total, 'mean': self.total/self.count if self.count else None,
+                'p95': p95, 'max': self.max}
+
+
+def timed(func: Callable, timer: call_timer) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timer.add(time.perf_counter() - t0)
+    wrapper.__profiled__ = func
+    return wrapper
+
+
+class lock_profiler(object):
+    """One profile run at a time of the controller's control thread."""
+
+    def __init__(self, cntrl: Any, directory: str = 'profiles') -> None:
+        """
+        :param cntrl: lock_controller.Controller (control_thread_id, pid_dict, submit)
+        :param directory: where the collapsed stacks of 'stack' runs are written
+        """
+        self.cntrl = cntrl
+        self.directory = directory
+        self.mutex = threading.Lock()
+        self.running: Optional[Dict[str, Any]] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self, mode: str = 'stack', seconds: float = 10., interval: float = INTERVAL) -> Dict[str, Any]:
+        """Start a run in the background; raises ValueError for bad arguments or a running profile."""
+        if mode not in MODES:
+            raise ValueError('mode must be one of %s' % ', '.join(MODES))
+        seconds = float(seconds)
+        interval = float(interval)
+        if not 0 < seconds <= MAX_SECONDS:
+            raise ValueError('seconds must be in (0, %g]' % MAX_SECONDS)
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        thread_id = self.cntrl.control_thread_id
+        if thread_id is None:
+            raise ValueError('controller is not running')
+        with self.mutex:
+            if self.running is not None:
+                raise ValueError('a profile is already running')
+            self.running = {'mode': mode, 'seconds': seconds, 'interval': interval, 'start': time.time()}
+        self.__stop.clear()
+        target = self.__sample_stacks if mode == 'stack' else self.__time_calls
+        self.__thread = threading.Thread(target=self.__run, args=(target, thread_id, seconds, interval),
+                                         name='lock_profiler', daemon=True)
+        self.__thread.start()
+        return dict(self.running)
+
+    def stop(self) -> None:
+        """End a running profile early; its result is still recorded."""
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def status(self) -> Dict[str, Any]:
+        return {'running': self.running, 'result': self.result}
+
+    def __run(self, target: Callable, thread_id: int, seconds: float, interval: float) -> None:
+        try:
+            result = target(thread_id, seconds, interval)
+        except Exception as e:
+            result = {'error': str(e)}
+        result.update(self.running)
+        with self.mutex:
+            self.result = result
+            self.running = None
+
+    # ------------------------------------------------------------------ modes
+    def __sample_stacks(self, thread_id: int, seconds: float, interval: float) -> Dict[str, Any]:
+        stacks: collections.Counter = collections.Counter()
+        samples = 0
+        cost = 0.
+        t_start = time.perf_counter()
+        t_end = t_start + seconds
+        while not self.__stop.is_set():
+            t0 = time.perf_counter()
+            if t0 >= t_end:
+                break
+            frame = sys._current_frames().get(thread_id)
+            if frame is None: ### the control thread has ended
+                break
+            stacks[collapse(frame)] += 1
+            del frame
+            samples += 1
+            t1 = time.perf_counter()
+            cost += t1 - t0
+            self.__stop.wait(max(0., interval - (t1 - t0)))
+        duration = time.perf_counter() - t_start
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, 'profile_%s.folded' % time.strftime('%Y%m%d-%H%M%S'))
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+        leaves: collections.Counter = collections.Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return {'file': os.path.abspath(path), 'samples': samples, 'duration': duration,
+                'overhead': cost/duration if duration > 0 else None, 'sample_cost': cost/samples if samples else None,
+                'top_stacks': [{'stack': s, 'samples': n} for s, n in stacks.most_common(TOP)],
+                'top_functions': [{'function': s, 'samples': n, 'fraction': n/samples} for s, n in leaves.most_common(TOP)]}
+
+    def __time_calls(self, thread_id: int, seconds: float, interval: float) -> Dict[str, Any]:
+        timers: Dict[str, Dict[str, call_timer]] = {}
+        installed: List[tuple] = []
+
+        def install():
+            pid_dict = self.cntrl.pid_dict
+            for name, pid in pid_dict.items():
+                timers[name] = {'__call__': call_timer(), 'func_read': call_timer(), 'func_write': call_timer()}
+                for attr in ('func_read', 'func_write'):
+                    func = getattr(pid, attr)
+                    if callable(func):
+                        wrapper = timed(func, timers[name][attr])
+                        setattr(pid, attr, wrapper)
+                        installed.append((pid, attr, func, wrapper))
+                ### pid() looks __call__ up on the type: give only this instance a timed subclass,
+                ### other channels and controllers in the process keep the plain pid_container
+                cls = type(pid)
+                profiled = type(cls.__name__, (cls,), {'__call__': timed(cls.__call__, timers[name]['__call__']),
+                                                       '__module__': cls.__module__})
+                pid.__class__ = profiled
+                installed.append((pid, '__class__', cls, profiled))
+
+        def uninstall():
+            for pid, attr, func, wrapper in installed:
+                if getattr(pid, attr) is wrapper: ### not replaced meanwhile (e.g. engine switch)
+                    setattr(pid, attr, func)
+
+        ### at a slot boundary: no channel is halfway through a sample
+        wait_command(self.cntrl.submit(install), self.cntrl.command_timeout)
+        t_start = time.perf_counter()
+        uninstall_error = None
+        try:
+            self.__stop.wait(seconds)
+        finally:
+            try:
+                wait_command(self.cntrl.submit(uninstall), self.cntrl.command_timeout)
+            except Exception as e:
+                ### a timed-out command is cancelled: queue it again, the wrappers stay until it runs
+                uninstall_error = str(e) or type(e).__name__
+                self.cntrl.submit(uninstall)
+        duration = time.perf_counter() - t_start
+        calls = sum(timer.count for channel in timers.values() for timer in channel.values())
+        per_call = self.__wrapper_cost()
+        result = {'duration': duration, 'calls': calls, 'wrapper_cost': per_call,
+                  'overhead': calls*per_call/duration if duration > 0 else None,
+                  'uninstalled': uninstall_error is None,
+                  'channels': {name: {func: timer.summary() for func, timer in channel.items()}
+                               for name, channel in timers.items()}}
+        if uninstall_error is not None:
+            result['uninstall_error'] = uninstall_error
+        return result
+
+    @staticmethod
+    def __wrapper_cost(n: int = 10000) -> float:
+        """s a timing wrapper adds to one call."""
+        def noop():
+            pass
+        wrapped = timed(noop, call_timer())
+        t0 = time.perf_counter()
+        for _ in range(n):
+            noop()
+        t1 = time.perf_counter()
+        for _ in range(n):
+            wrapped()
+        t2 = time.perf_counter()
+        return max(0., ((t2 - t1) - (t1 - t0))/n)
+
+
+## AGENT_UPDATE
+# - Added `lock_profiler`: runtime-switchable stack sampling of the control thread (collapsed
+#   stacks for flame graphs) and a timing-only mode for pid_container.__call__ / func_read /
+#   func_write, both reporting their overhead.
+# - Reason: profiling the loop required a restart under a profiler, which loses the lock.
+# - The timing mode wraps __call__ per channel instance (a subclass of its own) instead of
+#   patching pid_container for the whole process, and reports a timed-out uninstall.
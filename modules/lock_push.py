@@ -0,0 +1,419 @@
+"""
+Event-loop push server for the live values of the web UI.
+
+The Flask SSE routes hold one waitress worker thread per open tab in a
+`while True: time.sleep(...)` generator. `push_server` serves the same
+streams from a single asyncio thread next to the Flask app:
+
+    GET /stream/<name>                          server-sent events
+    GET /stream/<name>  (Upgrade: websocket)    WebSocket text frames
+
+Every stream has one ticker that calls its payload function once per
+period, serialises it once and writes the same bytes to all subscribers;
+nothing is computed while a stream has no subscribers, and unchanged
+payloads are not resent (a keep-alive comment / ping is sent instead).
+Writes go straight into the transport buffers, so a subscriber that does
+not read is detected by its buffer size and dropped once it exceeds
+`max_buffer` instead of slowing down the others.
+
+`/stream/live` multiplexes all channels into one stream with a
+subscription per client,
+
+    GET /stream/live?channels=WMCH2,WMCH3&fields=value,lock&rate=5
+
+(a WebSocket client may also send {"channels": [...], "fields": [...],
+"rate": 5} to change it). The live snapshot (name -> {field: value}) is
+taken once per tick for all due subscribers, and each message carries only
+the fields that changed since that client's previous message:
+
+    {"WMCH2": {"value": 487.990081}, "WMCH3": {"lock": false}}
+
+The first message holds the full subscribed state, a channel that
+disappears is sent as null.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from . import lock_json
+
+MAX_BUFFER = 256*1024  # bytes queued for one subscriber before it is dropped
+KEEPALIVE = 15.        # s between keep-alive messages of an unchanged stream
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_MAX_MESSAGE = 64*1024
+LIVE_RATE = 10.        # default messages per second of a /stream/live subscriber
+
+
+def ws_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Unmasked, final server frame."""
+    n = len(payload)
+    if n < 126:
+        head = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 1 << 16:
+        head = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return head + payload
+
+
+def ws_accept(key: str) -> str:
+    return base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+
+
+async def read_ws_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """(opcode, unmasked payload) of the next client frame."""
+    b0, b1 = await reader.readexactly(2)
+    n = b1 & 0x7f
+    if n == 126:
+        n, = struct.unpack('!H', await reader.readexactly(2))
+    elif n == 127:
+        n, = struct.unpack('!Q', await reader.readexactly(8))
+    if n > WS_MAX_MESSAGE:
+        raise ConnectionError('WebSocket message too large')
+    mask = await reader.readexactly(4) if b1 & 0x80 else b'\0\0\0\0'
+    data = await reader.readexactly(n)
+    return b0 & 0x0f, bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+
+def parse_head(head: bytes) -> Tuple[str, str, Dict[str, str]]:
+    lines = head.decode('latin-1').split('\r\n')
+    method, target = lines[0].split(' ')[:2]
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+class subscriber(object):
+    __slots__ = ('transport', 'websocket')
+
+    def __init__(self, transport: asyncio.BaseTransport, websocket: bool) -> None:
+        self.transport = transport
+        self.websocket = websocket
+
+
+def _changed(old: Any, new: Any) -> bool:
+    return old != new and not (old != old and new != new)  # NaN stays NaN
+
+
+class live_subscriber(subscriber):
+    """Subscriber of /stream/live with its subscription and the state it has been sent."""
+
+    __slots__ = ('channels', 'fields', 'interval', 'due', 'sent', 'last_sent')
+
+    def __init__(self, transport: asyncio.BaseTransport, websocket: bool) -> None:
+        super().__init__(transport, websocket)
+        self.subscribe({}, 0.)
+
+    def subscribe(self, request: Dict[str, Any], min_interval: float) -> None:
+        """
+        :param request: 'channels', 'fields' (lists or comma separated, missing: all) and 'rate' (1/s).
+        :param min_interval: Shortest time between two messages (the snapshot period).
+        """
+        def names(key: str) -> Optional[List[str]]:
+            value = request.get(key)
+            if value is None:
+                return None
+            return [v for v in (value.split(',') if isinstance(value, str) else value) if v]
+        self.channels = names('channels')
+        self.fields = names('fields')
+        try:
+            rate = float(request.get('rate') or LIVE_RATE)
+        except (TypeError, ValueError):
+            rate = LIVE_RATE
+        self.interval = max(1. / rate if rate > 0 else 1. / LIVE_RATE, min_interval)
+        self.due = 0.
+        self.sent: Dict[str, Dict[str, Any]] = {}  # resubscribing starts over with the full state
+        self.last_sent = 0.
+
+    def delta(self, snapshot: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Subscribed fields that differ from what was sent last, and marks them as sent."""
+        ret: Dict[str, Any] = {}
+        names = snapshot if self.channels is None else self.channels
+        for name in names:
+            row = snapshot.get(name)
+            if row is None:
+                if self.sent.pop(name, None) is not None:
+                    ret[name] = None
+                continue
+            sent = self.sent.setdefault(name, {})
+            d = {k: v for k, v in row.items()
+                 if (self.fields is None or k in self.fields) and (k not in sent or _changed(sent[k], v))}
+            if d:
+                sent.update(d)
+                ret[name] = d
+        if self.channels is None:
+            for name in [n for n in self.sent if n not in snapshot]:
+                del self.sent[name]
+                ret[name] = None
+        return ret
+
+
+class live_feed(object):
+    """Snapshot function and subscribers of /stream/live."""
+
+    def __init__(self, period: float, snapshot: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+        self.period = period
+        self.snapshot = snapshot
+        self.subscribers: Set[live_subscriber] = set()
+
+
+class push_stream(object):
+    """One named stream: payload function, period and its subscribers."""
+
+    def __init__(self, name: str, period: float, payload: Callable[[], Any]) -> None:
+        self.name = name
+        self.period = period
+        self.payload = payload
+        self.subscribers: Set[subscriber] = set()
+        self.last: Optional[Tuple[bytes, bytes]] = None  # (sse, websocket) message of the last payload
+        self.last_data: Optional[str] = None
+        self.last_sent = 0.
+
+
+class push_server(object):
+    """SSE / WebSocket fan-out of periodically sampled payloads on one asyncio thread."""
+
+    def __init__(self, streams: Dict[str, Tuple[float, Callable[[], Any]]], host: str = '127.0.0.1',
+                 port: int = 8081, authorize: Optional[Callable[[Dict[str, str]], bool]] = None,
+                 max_buffer: int = MAX_BUFFER, keepalive: float = KEEPALIVE,
+                 live: Optional[Tuple[float, Callable[[], Dict[str, Dict[str, Any]]]]] = None) -> None:
+        """
+        :param streams: name -> (period in s, function returning the JSON-serialisable payload).
+        :param live: (period in s, function returning name -> {field: value}) served as /stream/live.
+        :param port: TCP port, 0 picks a free one (see `port` after `start`).
+        :param authorize: Called with the lower-case request headers, False answers 403.
+        :param max_buffer: Bytes queued for a subscriber before it is dropped.
+        :param keepalive: Seconds between keep-alive messages while a payload does not change.
+        """
+        self.streams = {name: push_stream(name, period, func) for name, (period, func) in streams.items()}
+        self.live = live_feed(*live) if live is not None else None
+        self.host = host
+        self.port = port
+        self.authorize = authorize
+        self.max_buffer = max_buffer
+        self.keepalive = keepalive
+        self.dropped = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.started = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    # ------------------------------------------------------------------ thread
+    def start(self, timeout: float = 10.) -> None:
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.__thread, name='lock_push', daemon=True)
+        self.thread.start()
+        self.started.wait(timeout)
+        if self.error is not None:
+            raise self.error
+
+    def __thread(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.__main())
+        except BaseException as e:
+            self.error = e
+            self.started.set()
+        finally:
+            self.loop.close()
+
+    def stop(self) -> None:
+        if self.loop is not None and self.thread is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+            self.thread.join()
+            self.thread = None
+
+    async def __main(self) -> None:
+        self.stop_event = asyncio.Event()
+        server = await asyncio.start_server(self.__client, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        tickers = [asyncio.ensure_future(self.__ticker(s)) for s in self.streams.values()]
+        if self.live is not None:
+            tickers.append(asyncio.ensure_future(self.__live_ticker()))
+        self.started.set()
+        print('Push server on %s:%i, streams: %s' % (self.host, self.port, ', '.join(self.streams)))
+        try:
+            await self.stop_event.wait()
+        finally:
+            for task in tickers:
+                task.cancel()
+            server.close()
+            for subscribers in self.__groups():
+                for sub in subscribers:
+                    sub.transport.close()
+                subscribers.clear()
+            await server.wait_closed()
+
+    def __groups(self) -> List[Set[Any]]:
+        groups = [s.subscribers for s in self.streams.values()]
+        if self.live is not None:
+            groups.append(self.live.subscribers)
+        return groups
+
+    def subscribers(self) -> Dict[str, int]:
+        ret = {name: len(s.subscribers) for name, s in self.streams.items()}
+        if self.live is not None:
+            ret['live'] = len(self.live.subscribers)
+        return ret
+
+    # ------------------------------------------------------------------ fan-out
+    async def __ticker(self, stream: push_stream) -> None:
+        while True:
+            await asyncio.sleep(stream.period)
+            if not stream.subscribers:
+                stream.last = stream.last_data = None
+                continue
+            try:
+                data = lock_json.dumps(stream.payload())
+            except Exception as e:
+                print('Push stream %s failed: %s' % (stream.name, e))
+                continue
+            now = time.monotonic()
+            if data != stream.last_data:
+                stream.last_data = data
+                stream.last = msg = (b'data: ' + data + b'\n\n', ws_frame(data))
+            elif now - stream.last_sent >= self.keepalive:
+                msg = (b': keepalive\n\n', ws_frame(b'', 0x9))
+            else:
+                continue
+            stream.last_sent = now
+            for sub in list(stream.subscribers):
+                self.__send(stream.subscribers, sub, msg)
+
+    async def __live_ticker(self) -> None:
+        feed = self.live
+        while True:
+            await asyncio.sleep(feed.period)
+            now = time.monotonic()
+            due = [sub for sub in feed.subscribers if now >= sub.due]
+            if not due:
+                continue
+            try:
+                snapshot = feed.snapshot()
+            except Exception as e:
+                print('Live snapshot failed: %s' % e)
+                continue
+            for sub in due:
+                sub.due = max(sub.due + sub.interval, now)
+                delta = sub.delta(snapshot)
+                if delta:
+                    data = lock_json.dumps(delta)
+                    msg = (b'data: ' + data + b'\n\n', ws_frame(data))
+                elif now - sub.last_sent >= self.keepalive:
+                    msg = (b': keepalive\n\n', ws_frame(b'', 0x9))
+                else:
+                    continue
+                sub.last_sent = now
+                self.__send(feed.subscribers, sub, msg)
+
+    def __send(self, subscribers: Set[Any], sub: subscriber, msg: Tuple[bytes, bytes]) -> None:
+        if sub.transport.is_closing():
+            subscribers.discard(sub)
+        elif sub.transport.get_write_buffer_size() > self.max_buffer:
+            self.dropped += 1
+            subscribers.discard(sub)
+            sub.transport.abort()
+        else:
+            sub.transport.write(msg[1] if sub.websocket else msg[0])
+
+    # ------------------------------------------------------------------ connections
+    async def __client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10.)
+            method, target, headers = parse_head(head)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            writer.close()
+            return
+        url = urlsplit(target)
+        path = url.path.rstrip('/')
+        live = path == '/stream/live' and self.live is not None
+        stream = self.streams.get(path[len('/stream/'):]) if path.startswith('/stream/') else None
+        if method != 'GET' or (stream is None and not live):
+            return self.__reject(writer, '404 Not Found')
+        if self.authorize is not None and not self.authorize(headers):
+            return self.__reject(writer, '403 Forbidden')
+        websocket = headers.get('upgrade', '').lower() == 'websocket'
+        if websocket:
+            if 'sec-websocket-key' not in headers:
+                return self.__reject(writer, '400 Bad Request')
+            writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                          'Sec-WebSocket-Accept: %s\r\n\r\n' % ws_accept(headers['sec-websocket-key'])).encode())
+        else:
+            writer.write(('HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                          'Connection: keep-alive\r\n%s\r\n' % self.__cors(headers)).encode())
+        if live:
+            sub = live_subscriber(writer.transport, websocket)
+            sub.subscribe({k: v[-1] for k, v in parse_qs(url.query).items()}, self.live.period)
+            subscribers = self.live.subscribers
+        else:
+            sub = subscriber(writer.transport, websocket)
+            if stream.last is not None:
+                self.__send(stream.subscribers, sub, stream.last)
+            subscribers = stream.subscribers
+        subscribers.add(sub)
+        try:
+            if websocket:
+                await self.__ws_receive(reader, writer, sub)
+            else:
+                while await reader.read(1024):  # EventSource never sends, EOF means the tab was closed
+                    pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            subscribers.discard(sub)
+            writer.close()
+
+    async def __ws_receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                           sub: subscriber) -> None:
+        while True:
+            opcode, data = await read_ws_frame(reader)
+            if opcode == 0x8:
+                writer.write(ws_frame(data[:2], 0x8))
+                return
+            if opcode == 0x9:
+                writer.write(ws_frame(data, 0xA))
+            elif opcode == 0x1 and isinstance(sub, live_subscriber):
+                try:
+                    request = json.loads(data)
+                except ValueError:
+                    continue
+                if isinstance(request, dict):
+                    sub.subscribe(request, self.live.period)
+
+    @staticmethod
+    def __cors(headers: Dict[str, str]) -> str:
+        """Let pages of the same host (the Flask app on another port) read the stream with their cookie."""
+        origin = headers.get('origin')
+        if origin is None or urlsplit(origin).hostname != urlsplit('//' + headers.get('host', '')).hostname:
+            return ''
+        return 'Access-Control-Allow-Origin: %s\r\nAccess-Control-Allow-Credentials: true\r\n' % origin
+
+    @staticmethod
+    def __reject(writer: asyncio.StreamWriter, status: str) -> None:
+        writer.write(('HTTP/1.1 %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n' % status).encode())
+        writer.close()
+
+
+## AGENT_UPDATE
+# - Added `push_server`, an asyncio SSE / WebSocket server that samples each stream's payload once
+#   per period and fans the serialised message out to all subscribers, dropping subscribers whose
+#   send buffer exceeds `max_buffer`.
+# - Reason: every open tab held a waitress thread in an endless SSE generator.
+# - Added /stream/live: one multiplexed stream per client with a channel / field / rate
+#   subscription and delta-encoded messages (only the fields that changed).
+# - Reason: the fixed-rate streams sent every active channel to every dashboard.
+# - Serialised the stream payloads with `lock_json.dumps` (orjson when installed).
@@ -0,0 +1,473 @@
+"""
+Multi-resolution rollups of the lock traces, maintained at ingest time.
+
+Every sample of a channel (fed from `pid_container.__call__`) is folded into
+the open 1 s bin only; a completed bin is merged into the open bin of the
+next level (10 s, 1 min, 10 min, 1 h) with the parallel variance formula, so
+the per-sample cost does not grow with the number of levels. Completed bins of
+each level are stored in a fixed-size ring of NumPy arrays:
+
+    bin start time, sample count, min, max, mean, std per field, in-lock fraction
+
+This is the only downsampled copy of the traces: /get/rollup reads a level
+directly and /get/history picks the level fitting the requested number of
+points (`lock_rollups.history`). Ranges the rollups do not cover are read
+from the raw archive: returned as they are when they hold at most the
+requested number of samples, min/max binned (`decimate`) otherwise. The rings
+and the open bins are persisted as `rollup.npz` in the channel directory of
+the archive, every `SAVE_INTERVAL` seconds from a background thread
+(`lock_rollups.start`) and when it is stopped. Imported samples
+(`lock_archive.convert_csv`) are folded in with `lock_rollups.extend`.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+FIELDS = ('input', 'error', 'output')
+LEVELS = ((1, 3600), (10, 8640), (60, 10080), (600, 8784), (3600, 8784))  # (bin width in s, ring size): 1 h, 1 d, 1 w, ~2 months, 1 y
+SAVE_INTERVAL = 300.  # s between two saves of the rollups
+MAX_POINTS = 1000
+
+
+def _group_stats(keys: np.ndarray, values: np.ndarray):
+    """
+    Statistics per run of equal `keys` (sorted) of values (n, fields), NaN = invalid:
+    first index, count, and n / min / max / mean / m2 per field (min / max +-inf, mean 0 without valid values).
+    """
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    valid = ~np.isnan(values)
+    n = np.add.reduceat(valid, starts, axis=0)
+    mean = np.add.reduceat(np.where(valid, values, 0.), starts, axis=0) / np.where(n > 0, n, 1)
+    dev = np.where(valid, values - np.repeat(mean, counts, axis=0), 0.) ### two-pass: inputs near 461 THz differ by < 1e-6
+    m2 = np.add.reduceat(dev*dev, starts, axis=0)
+    vmin = np.minimum.reduceat(np.where(valid, values, np.inf), starts, axis=0)
+    vmax = np.maximum.reduceat(np.where(valid, values, -np.inf), starts, axis=0)
+    return starts, counts, n, vmin, vmax, mean, m2
+
+
+def decimate(data: Dict[str, np.ndarray], max_points: int = MAX_POINTS) -> Dict[str, Any]:
+    """
+    Min / max / mean / std of raw samples (columns 'time' and `FIELDS`, time-ordered) in at most
+    max_points equal time bins, in the format of `channel_rollup.get` without lock_fraction.
+    """
+    t = data['time']
+    if not len(t):
+        return {}
+    span = float(t[-1] - t[0])
+    width = span / max_points if span > 0 else 1.
+    keys = np.minimum(((t - t[0]) / width).astype(np.int64), max_points - 1)
+    values = np.column_stack([np.asarray(data[f], dtype=float) for f in FIELDS])
+    starts, counts, n, vmin, vmax, mean, m2 = _group_stats(keys, values)
+    ret: Dict[str, Any] = {'width': width, 'time': (t[0] + keys[starts]*width).tolist(), 'n': counts.tolist()}
+    for i, f in enumerate(FIELDS):
+        ok = n[:, i] > 0
+        ret[f + '_min'] = [float(v) if k else None for v, k in zip(vmin[:, i], ok)]
+        ret[f + '_max'] = [float(v) if k else None for v, k in zip(vmax[:, i], ok)]
+        ret[f + '_mean'] = [float(v) if k else None for v, k in zip(mean[:, i], ok)]
+        std = np.sqrt(m2[:, i] / np.where(n[:, i] > 1, n[:, i] - 1, np.nan))
+        ret[f + '_std'] = [None if v != v else float(v) for v in std]
+    return ret
+
+
+class rollup_bin(object):
+    """Accumulator of one open bin (Welford per field)."""
+
+    __slots__ = ('start', 'total', 'locked', 'n', 'min', 'max', 'mean', 'm2')
+
+    def __init__(self, start: float) -> None:
+        self.start = start
+        self.total = 0   # all samples
+        self.locked = 0  # samples taken while locked
+        self.n = [0] * len(FIELDS)  # valid samples per field
+        self.min = [math.inf] * len(FIELDS)
+        self.max = [-math.inf] * len(FIELDS)
+        self.mean = [0.] * len(FIELDS)
+        self.m2 = [0.] * len(FIELDS)
+
+    def add(self, values: Sequence[Optional[float]], locked: bool) -> None:
+        self.total += 1
+        self.locked += bool(locked)
+        for i, x in enumerate(values):
+            if x is None or x != x:
+                continue
+            self.n[i] += 1
+            if x < self.min[i]:
+                self.min[i] = x
+            if x > self.max[i]:
+                self.max[i] = x
+            d = x - self.mean[i]
+            self.mean[i] += d / self.n[i]
+            self.m2[i] += d * (x - self.mean[i])
+
+    @classmethod
+    def from_ring(cls, ring: 'rollup_ring', i: int) -> 'rollup_bin':
+        """Open bin saved in slot i of ring (see channel_rollup.save)."""
+        b = cls(float(ring.time[i]))
+        b.total = int(ring.total[i])
+        b.locked = int(ring.locked[i])
+        b.n = [int(n) for n in ring.n[i]]
+        b.min = [math.inf if x != x else float(x) for x in ring.min[i]]
+        b.max = [-math.inf if x != x else float(x) for x in ring.max[i]]
+        b.mean = [0. if x != x else float(x) for x in ring.mean[i]]
+        b.m2 = [float(x) for x in ring.m2[i]]
+        return b
+
+    def merge(self, other: 'rollup_bin') -> None:
+        self.total += other.total
+        self.locked += other.locked
+        for i in range(len(FIELDS)):
+            n = self.n[i] + other.n[i]
+            if other.n[i] == 0:
+                continue
+            d = other.mean[i] - self.mean[i]
+            self.mean[i] += d * other.n[i] / n
+            self.m2[i] += other.m2[i] + d*d * self.n[i] * other.n[i] / n
+            self.n[i] = n
+            self.min[i] = min(self.min[i], other.min[i])
+            self.max[i] = max(self.max[i], other.max[i])
+
+
+class rollup_ring(object):
+    """Fixed-size ring of the completed bins of one level."""
+
+    KEYS = ('time', 'total', 'locked', 'n', 'min', 'max', 'mean', 'm2')
+
+    def __init__(self, width: float, size: int) -> None:
+        self.width = width
+        self.size = size
+        self.time = np.full(size, np.nan)
+        self.total = np.zeros(size)
+        self.locked = np.zeros(size)
+        nf = len(FIELDS)
+        self.n = np.zeros((size, nf))
+        self.min = np.full((size, nf), np.nan)
+        self.max = np.full((size, nf), np.nan)
+        self.mean = np.full((size, nf), np.nan)
+        self.m2 = np.zeros((size, nf))
+        self.head = 0  # next slot to write
+
+    def push(self, b: rollup_bin) -> None:
+        i = self.head
+        self.time[i] = b.start
+        self.total[i] = b.total
+        self.locked[i] = b.locked
+        self.n[i] = b.n
+        valid = [n > 0 for n in b.n]
+        self.min[i] = [x if v else np.nan for x, v in zip(b.min, valid)]
+        self.max[i] = [x if v else np.nan for x, v in zip(b.max, valid)]
+        self.mean[i] = [x if v else np.nan for x, v in zip(b.mean, valid)]
+        self.m2[i] = b.m2
+        self.head = (i + 1) % self.size
+
+    def ordered(self) -> np.ndarray:
+        """Slot indices from the oldest to the newest bin."""
+        idx = np.roll(np.arange(self.size), -self.head)
+        return idx[~np.isnan(self.time[idx])]
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {k: getattr(self, k) for k in self.KEYS}
+
+    def restore(self, state: Dict[str, np.ndarray]) -> None:
+        """Load a saved ring, keeping the newest bins if the size changed."""
+        t = state['time']
+        order = np.argsort(np.where(np.isnan(t), -np.inf, t), kind='stable')
+        order = order[~np.isnan(t[order])][-self.size:]
+        for k in self.KEYS:
+            getattr(self, k)[:len(order)] = state[k][order]
+        self.head = len(order) % self.size
+
+
+class channel_rollup(object):
+    """Open bins and rings of all levels of one channel."""
+
+    def __init__(self, levels: Sequence[Sequence[float]] = LEVELS, path: Optional[str] = None) -> None:
+        """
+        :param levels: (bin width in s, ring size) per level, each width a multiple of the previous.
+        :param path: File the rings are persisted to, None to keep them in memory only.
+        """
+        self.rings = [rollup_ring(w, size) for w, size in levels]
+        self.open: List[Optional[rollup_bin]] = [None] * len(self.rings)
+        self.path = path
+        if path is not None and os.path.isfile(path):
+            self.load()
+
+    def add(self, t: float, values: Sequence[Optional[float]], locked: bool) -> None:
+        """Fold in one sample; values in `FIELDS` order, None / NaN for invalid ones."""
+        b = self.__bin(0, t)
+        b.add(values, locked)
+
+    def extend(self, t: np.ndarray, values: np.ndarray, locked: np.ndarray) -> None:
+        """
+        Fold in many time-ordered samples at once (imports), binned with NumPy;
+        values of shape (n, len(FIELDS)), NaN for invalid ones. Samples older than the open 1 s bin are dropped.
+        """
+        b = self.open[0]
+        if b is not None:
+            keep = t >= b.start
+            t, values, locked = t[keep], values[keep], locked[keep]
+        if not len(t):
+            return
+        w = self.rings[0].width
+        keys = np.floor(t / w) * w
+        starts, counts, n, vmin, vmax, mean, m2 = _group_stats(keys, values)
+        nlocked = np.add.reduceat(np.asarray(locked, dtype=np.int64), starts)
+        for j, i in enumerate(starts):
+            part = rollup_bin(float(keys[i]))
+            part.total = int(counts[j])
+            part.locked = int(nlocked[j])
+            part.n = n[j].tolist()
+            part.min = vmin[j].tolist()
+            part.max = vmax[j].tolist()
+            part.mean = mean[j].tolist()
+            part.m2 = m2[j].tolist()
+            self.__bin(0, part.start).merge(part)
+
+    def __bin(self, level: int, t: float) -> rollup_bin:
+        """Open bin of `level` containing t, closing (and cascading) the previous one."""
+        w = self.rings[level].width
+        start = math.floor(t / w) * w
+        b = self.open[level]
+        if b is None or b.start != start:
+            if b is not None:
+                self.__close(level, b)
+            b = self.open[level] = rollup_bin(start)
+        return b
+
+    def __close(self, level: int, b: rollup_bin) -> None:
+        self.rings[level].push(b)
+        if level + 1 < len(self.rings):
+            self.__bin(level + 1, b.start).merge(b)
+
+    def __open_bins(self, level: int) -> List[rollup_bin]:
+        """
+        Open bin(s) of `level` including the samples still in the open bins of the finer levels,
+        which are only merged in when those close (they may already start the next bin).
+        """
+        w = self.rings[level].width
+        bins: Dict[float, rollup_bin] = {}
+        for b in self.open[:level + 1]:
+            if b is None:
+                continue
+            start = math.floor(b.start / w) * w
+            if start not in bins:
+                bins[start] = rollup_bin(start)
+            bins[start].merge(b)
+        return [bins[start] for start in sorted(bins)]
+
+    @staticmethod
+    def __columns(ring: rollup_ring) -> Dict[str, np.ndarray]:
+        total, n = ring.total, ring.n
+        return {'time': ring.time, 'n': total,
+                'lock_fraction': ring.locked / np.where(total > 0, total, 1),
+                'min': ring.min, 'max': ring.max, 'mean': ring.mean,
+                'std': np.sqrt(ring.m2 / np.where(n > 1, n - 1, np.nan))}
+
+    def get(self, level: int, t0: float = -math.inf, t1: float = math.inf) -> Dict[str, Any]:
+        """Completed bins of `level` in [t0, t1] plus the open one, as JSON-ready lists."""
+        ring = self.rings[level]
+        idx = ring.ordered()
+        idx = idx[(ring.time[idx] >= np.floor(t0 / ring.width) * ring.width) & (ring.time[idx] <= t1)]
+        rows = {k: v[idx] for k, v in self.__columns(ring).items()}
+        for b in self.__open_bins(level):
+            if t0 - ring.width < b.start <= t1:
+                tmp = rollup_ring(ring.width, 1)
+                tmp.push(b)
+                rows = {k: np.concatenate([v, self.__columns(tmp)[k]]) for k, v in rows.items()}
+        ret: Dict[str, Any] = {'width': ring.width, 'time': rows['time'].tolist(), 'n': rows['n'].tolist(),
+                               'lock_fraction': rows['lock_fraction'].tolist()}
+        for i, f in enumerate(FIELDS):
+            for k in ('min', 'max', 'mean', 'std'):
+                ret[f + '_' + k] = [None if v != v else v for v in rows[k][:, i].tolist()]
+        return ret
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Copy of the rings and open bins as saved by `write`; the caller holds off `add` meanwhile."""
+        data = {}
+        for ring, b in zip(self.rings, self.open):
+            for k, v in ring.state().items():
+                data['%g_%s' % (ring.width, k)] = v.copy()
+            if b is not None: ### the open bins too, a restart inside a bin continues it
+                tmp = rollup_ring(ring.width, 1)
+                tmp.push(b)
+                for k, v in tmp.state().items():
+                    data['open_%g_%s' % (ring.width, k)] = v
+        return data
+
+    def write(self, data: Dict[str, np.ndarray]) -> None:
+        """Persist a `snapshot` atomically."""
+        if self.path is None:
+            return
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp, **data)
+        os.replace(tmp, self.path)
+
+    def save(self) -> None:
+        self.write(self.snapshot())
+
+    def load(self) -> None:
+        try:
+            with np.load(self.path) as npz:
+                for level, ring in enumerate(self.rings):
+                    prefix = '%g_' % ring.width
+                    if prefix + 'time' in npz:
+                        ring.restore({k: npz[prefix + k] for k in rollup_ring.KEYS})
+                    if 'open_' + prefix + 'time' in npz:
+                        tmp = rollup_ring(ring.width, 1)
+                        tmp.restore({k: npz['open_' + prefix + k] for k in rollup_ring.KEYS})
+                        self.open[level] = rollup_bin.from_ring(tmp, 0)
+        except (OSError, ValueError) as e:
+            print('Could not load rollups', self.path, e)
+
+
+class lock_rollups(object):
+    """`channel_rollup` for every channel of a Controller, persisted below `root`."""
+
+    def __init__(self, root: Optional[str] = None, levels: Sequence[Sequence[float]] = LEVELS) -> None:
+        self.root = root
+        self.levels = levels
+        self.channels: Dict[str, channel_rollup] = {}
+        self.mutex = threading.Lock()
+        self.save_mutex = threading.Lock() ### one save at a time (timer and stop), never held by add
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def __channel(self, name: str) -> channel_rollup:
+        ch = self.channels.get(name)
+        if ch is None:
+            path = None
+            if self.root is not None:
+                os.makedirs(os.path.join(self.root, name), exist_ok=True)
+                path = os.path.join(self.root, name, 'rollup.npz')
+            ch = self.channels[name] = channel_rollup(self.levels, path)
+        return ch
+
+    def add(self, name: str, t: float, value: Optional[float], error: Optional[float],
+            output: Optional[float], locked: bool) -> None:
+        """Ingest one sample; non-positive inputs are WLM readout errors and only count for the lock fraction."""
+        if value is None or value <= 0:
+            value = error = None
+        with self.mutex:
+            self.__channel(name).add(t, (value, error, output), locked)
+
+    def extend(self, name: str, t: np.ndarray, value: np.ndarray, error: np.ndarray,
+               output: np.ndarray, locked: np.ndarray) -> None:
+        """Ingest many time-ordered samples (imports), same rules as `add`."""
+        t = np.asarray(t, dtype=float)
+        values = np.column_stack([np.asarray(x, dtype=float) for x in (value, error, output)])
+        invalid = ~(values[:, 0] > 0)
+        values[invalid, :2] = np.nan
+        order = np.argsort(t, kind='stable')
+        with self.mutex:
+            self.__channel(name).extend(t[order], values[order], np.asarray(locked, dtype=bool)[order])
+
+    def has(self, name: str) -> bool:
+        """Rollups of `name` in memory or saved below the root."""
+        return name in self.channels or (self.root is not None and
+                                         os.path.isfile(os.path.join(self.root, name, 'rollup.npz')))
+
+    def widths(self) -> List[float]:
+        return [w for w, _ in self.levels]
+
+    def get(self, name: str, level: Optional[float] = None, t0: Optional[float] = None,
+            t1: Optional[float] = None, max_points: int = MAX_POINTS) -> Dict[str, Any]:
+        """
+        Rollups of `name` at bin width `level` (s); without a level the finest one with
+        at most max_points bins in [t0, t1] is used.
+        """
+        with self.mutex:
+            if not self.has(name):
+                return {}
+            ch = self.__channel(name) ### loads rollups saved by another process, e.g. convert_csv
+            t0 = -math.inf if t0 is None else t0
+            t1 = math.inf if t1 is None else t1
+            widths = self.widths()
+            if level is None:
+                span = t1 - t0
+                if not math.isfinite(span):
+                    i = len(widths) - 1
+                else:
+                    i = next((i for i, w in enumerate(widths) if span / w <= max_points), len(widths) - 1)
+            elif level in widths:
+                i = widths.index(level)
+            else:
+                return {}
+            return ch.get(i, t0, t1)
+
+    def history(self, name: str, t0: float, t1: float, max_points: int = MAX_POINTS,
+                raw: Optional[Callable[[float, float], Dict[str, np.ndarray]]] = None) -> Dict[str, Any]:
+        """
+        Envelope of `name` in [t0, t1] with at most max_points points, from the finest level that
+        fits. Without rollups of more than max_points samples in the range, raw(t0, t1) (columns
+        'time' and `FIELDS`, e.g. the archive) is read when given: at most max_points samples are
+        returned as they are (level 0), more are min/max binned to max_points (`decimate`).
+        """
+        ret = self.get(name, None, t0, t1, max_points)
+        if raw is not None and (not ret or sum(ret['n']) <= max_points):
+            data = raw(t0, t1)
+            if len(data['time']) > max_points:
+                ret = decimate(data, max_points)
+            elif len(data['time']):
+                ret = {'width': 0, 'time': data['time'].tolist(), 'n': [1]*len(data['time'])}
+                for f in FIELDS:
+                    values = [None if v != v else v for v in data[f].tolist()]
+                    ret[f + '_min'] = ret[f + '_max'] = ret[f + '_mean'] = values
+                    ret[f + '_std'] = [None]*len(values)
+        if ret:
+            ret['level'] = ret['width']
+        return ret
+
+    def start(self, interval: float = SAVE_INTERVAL) -> None:
+        """Save every `interval` s from a background thread."""
+        if self.__thread is not None or self.root is None:
+            return
+        self.__stop.clear()
+
+        def loop():
+            while not self.__stop.wait(interval):
+                self.save()
+        self.__thread = threading.Thread(target=loop, name='lock_rollups', daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """End the save thread and save a last time."""
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
+        self.save()
+
+    def save(self) -> None:
+        """Copy the rollups under the mutex, write them without it: `add` runs on the control thread."""
+        with self.save_mutex:
+            with self.mutex:
+                snapshots = [(ch, ch.snapshot()) for ch in self.channels.values() if ch.path is not None]
+            for ch, data in snapshots:
+                try:
+                    ch.write(data)
+                except OSError as e:
+                    print('Could not save rollups', ch.path, e)
+
+    def remove(self, name: str) -> None:
+        with self.mutex:
+            self.channels.pop(name, None)
+
+
+## AGENT_UPDATE
+# - Added `lock_rollups`: per channel 1 s / 10 s / 1 min / 10 min rollups (min, max, mean, std,
+#   in-lock fraction of input, error and output) kept in fixed-size NumPy rings, fed from
+#   pid_container at ingest time and persisted as rollup.npz next to the archive chunks.
+# - Reason: long-range views read a precomputed level instead of scanning raw samples.
+# - Serves /get/history too (replaces the archive's min/max pyramid), 1 h level added, open bins
+#   persisted, saved on its own timer.
+# - `save` copies the rings under the mutex and writes them without it.
+# - Reason: np.savez under the mutex stalled the control thread's `add` for the whole disk write.
+# - Raw ranges of more than max_points samples are min/max binned (`decimate`); imported samples
+#   are folded into the rollups in bulk (`lock_rollups.extend`, used by convert_csv).
+# - Reason: history of archived / imported data without rollups returned every raw sample.
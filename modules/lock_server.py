@@ -1,7 +1,9 @@
 import signal
 #import sys
 import os
-import json
+import time
+import gzip
+from http.cookies import SimpleCookie
 from threading import Thread
 from flask import Flask, render_template, request, Response, url_for, redirect
 from flask import stream_with_context
@@ -9,18 +11,27 @@ from flask import session, g
 import csv
 import datetime
 from waitress import serve, task, create_server
-from modules.wavelengthmeter import WavelengthMeter, WavemeterCalibration
+from modules.wavelengthmeter import WavelengthMeter
 
-from .lock_controller import Controller
+from .lock_controller import Controller, wait_command
 from .plotter import parse_data, plot_data, export_plot_svg
+from .lock_push import push_server
+from . import lock_json
+from .lock_calibration import calibration_slot, reference_slot, PERIOD
+from .lock_wlm import wlm_broker
+from .lock_health import health_sampler
+from .lock_profile import lock_profiler
+from .lock_metrics import lock_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 class endpoint_action(object):
     #'application/json'
     #'text/html'
     #'text/xml'
-    def __init__(self, action, mimetype='application/json', serve_json=True):
+    def __init__(self, action, mimetype='application/json', serve_json=True, cache_key=None):
         self.action = action
         self.mimetype = mimetype
         self.serve_json = serve_json
+        self.cache_key = cache_key ### returns the state version the response depends on, see web_lock.state_version
+        self.cache = {} ### request arguments -> (version, serialized response)
 
     def __call__(self, *args):
         #djsn = request.json
@@ -30,36 +41,80 @@ class endpoint_action(object):
         #data = request.data
         #form = request.form
         #coks = request.cookies
-        ret, data = self.action(djsn)
         if self.serve_json:
-            msg = json.dumps({'status':ret, 'data':data})
+            msg = self.__serialized(djsn)
+            if len(msg) >= GZIP_MIN_SIZE and 'gzip' in request.headers.get('Accept-Encoding', ''):
+                response = Response(gzip.compress(msg, GZIP_LEVEL), mimetype=self.mimetype)
+                response.headers['Content-Encoding'] = 'gzip'
+                response.headers['Vary'] = 'Accept-Encoding'
+                return response
         else:
-            msg = data
+            ret, msg = self.action(djsn)
         #Response(status_code=200, headers={}, status=msg)
         return Response(msg, mimetype=self.mimetype)
 
+    def __serialized(self, djsn):
+        if self.cache_key is None:
+            ret, data = self.action(djsn)
+            return lock_json.dumps({'status':ret, 'data':data})
+        ### read the version first: a change during the handler only makes the entry look older than it is
+        version = self.cache_key()
+        key = lock_json.dumps(djsn)
+        hit = self.cache.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        ret, data = self.action(djsn)
+        msg = lock_json.dumps({'status':ret, 'data':data})
+        if len(self.cache) >= CACHE_MAX_ENTRIES:
+            self.cache.clear()
+        self.cache[key] = (version, msg)
+        return msg
+
 
 
 
 USERNAME = 'bali'
 PASSWORD = 'balibali24'
+STREAM_PERIODS = {'values':0.01, 'piezo':0.1, 'digit':0.5} ### s between two events of the live streams
+GZIP_MIN_SIZE = 1400 ### bytes, JSON responses that do not fit one packet are compressed
+GZIP_LEVEL = 1 ### level 5+ costs 3x the CPU for ~10 % smaller traces
+CACHE_MAX_ENTRIES = 64 ### cached responses per endpoint (one per distinct request arguments)
+STATIC_MAX_AGE = 365*24*3600 ### s, static URLs carry the file version (?v=mtime), see flask_server.static_version
+PUBLIC_ENDPOINTS = ('login', 'static', 'metrics') ### served without login; /metrics is scraped by the monitoring (counts and timings only)
+NO_PROFILER = 'The control loops run in other processes (orchestrated workers), they cannot be profiled from here'
+NO_SCHEDULER = 'The controller has no scheduler slots (e.g. orchestrated workers), WLM calibration is not available'
 
 class flask_server(Flask):
     def __init__(self, name):
         self.debug_mode = True
+        self.handlers = {}
         super(flask_server, self).__init__(name) 
         self.add_url_rule('/login', 'login', self.login, methods=['GET', 'POST']) #### login
         self.config['SECRET_KEY'] = os.urandom(16)
         super().before_request(self.before_request)
+        self.url_defaults(self.static_version)
 
     def before_request(self): ######### new Password function
-        # Seite /login ist immer erlaubt
-        if request.endpoint == 'login':
+        # Seite /login und statische Dateien sind immer erlaubt
+        if request.endpoint in PUBLIC_ENDPOINTS:
             return
         # Falls kein Login in der Session, umleiten
         if not session.get('logged_in'):
             return redirect(url_for('login')) 
             
+    def static_version(self, endpoint, values):
+        ### url_for('static', ...) gets ?v=<mtime>, so the browser may cache the file until it changes
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            try:
+                values['v'] = int(os.path.getmtime(os.path.join(self.static_folder, values['filename'])))
+            except OSError:
+                pass
+
+    def get_send_file_max_age(self, filename):
+        if request.endpoint == 'static' and 'v' in request.args:
+            return STATIC_MAX_AGE
+        return super().get_send_file_max_age(filename) ### unversioned: revalidate with the ETag
+
     def login(self):  ################ define login
         if request.method == 'POST':
             username = request.form.get('username')
@@ -78,6 +133,8 @@ class flask_server(Flask):
 
         
     def add_endpoint(self, endpoint=None, endpoint_name=None, handler=None, methods=None, **kwargs):
+        if kwargs.get('serve_json', True):
+            self.handlers[endpoint.strip('/')] = handler ### JSON endpoints can also be called through /post/batch
         self.add_url_rule(rule=endpoint, 
                                 endpoint=endpoint_name,
                                 view_func=endpoint_action(handler, **kwargs),
@@ -115,11 +172,30 @@ class web_test(object):
         html = render_template("index.html", form_script=form_script)
         return True, html
         
+def numeric(value):
+    ### int / float (bool included) or None, keeps probes of foreign controllers out of the number traces
+    return value if isinstance(value, (int, float)) else None
+
 class web_lock(object):
-    def __init__(self, name=__name__, **kwargs):
-        self.cntrl = Controller(**kwargs)
-        self.wvm = WavelengthMeter()
+    def __init__(self, name=__name__, controller=None, **kwargs):
+        ### controller: e.g. modules.orchestrator.orchestrated_controller to serve several worker processes
+        self.cntrl = Controller(**kwargs) if (controller is None) else controller
+        self.scheduler = hasattr(self.cntrl, 'add_slot') ### False for orchestrated_controller: no slots, no calibration
+        self.wvm = None ### wlm_broker, all DLL access goes through here
+        self.calibration = None
+        if self.scheduler:
+            ### orchestrated workers own the WLM: the parent neither opens the DLL nor monitors it
+            self.wvm = wlm_broker(WavelengthMeter(), on_reading=self.__wm_reading)
+            ### WLM reference check / calibration, stepped by the controller between two channel slots
+            self.calibration = calibration_slot(self.wvm, on_result=self.__calibration_result)
+            self.cntrl.add_slot(self.calibration)
         self.flsk = flask_server(name)
+        self.push = None ### push_server of start_push
+        self.index_cache = (None, '') ### (channel list, push url), rendered index page
+        self.reference = None ### reference_slot of monitor_reference
+        self.health = None ### health_sampler of start_health
+        ### the profiler samples this process' control thread: none for orchestrated_controller, whose loops run in the workers
+        self.profiler = lock_profiler(self.cntrl, directory=os.path.join(self.cntrl.csv_dir, 'profiles')) if isinstance(self.cntrl, Controller) else None
         self.calibration_settings = {
     "wm_calibration_frequency": self.cntrl.get_global("wm_calibration_frequency"),
     "wm_calibration_interval": self.cntrl.get_global("wm_calibration_interval")
@@ -127,22 +203,27 @@ class web_lock(object):
         self.flsk.add_endpoint('/', endpoint_name='index', handler=self.index, mimetype='text/html', serve_json=False)
         self.flsk.add_endpoint('/stop', endpoint_name='stop', handler=self.stop, mimetype='text/html', serve_json=False)
         
-        self.flsk.add_endpoint('/get/list', endpoint_name='get_list', handler=self.get_list, methods=['GET'])
-        self.flsk.add_endpoint('/get/config', endpoint_name='get_config', handler=self.get_config, methods=['GET'])
+        self.flsk.add_endpoint('/get/list', endpoint_name='get_list', handler=self.get_list, methods=['GET'], cache_key=self.state_version)
+        self.flsk.add_endpoint('/get/config', endpoint_name='get_config', handler=self.get_config, methods=['GET'], cache_key=self.state_version)
         self.flsk.add_endpoint('/get/config/default', endpoint_name='get_default_config', handler=self.get_default_config, methods=['GET'])
         self.flsk.add_endpoint('/get/parameter', endpoint_name='get_parameter', handler=self.get_parameter, methods=['GET'])
-        self.flsk.add_endpoint('/get/status', endpoint_name='get_status', handler=self.get_status, methods=['GET'])
+        self.flsk.add_endpoint('/get/status', endpoint_name='get_status', handler=self.get_status, methods=['GET'], cache_key=self.status_version)
         self.flsk.add_endpoint('/get/trace/last', endpoint_name='get_trace_last', handler=self.get_trace_last, methods=['GET'])
         self.flsk.add_endpoint('/get/trace', endpoint_name='get_trace', handler=self.get_trace, methods=['GET'])
         self.flsk.add_endpoint('/get/graph', endpoint_name='get_graph', handler=self.get_plot, methods=['GET'])
         self.flsk.add_endpoint('/get/plot', endpoint_name='get_plot', handler=self.get_plot, methods=['GET'], mimetype='text/html', serve_json=False)
+        self.flsk.add_endpoint('/get/stats', endpoint_name='get_stats', handler=self.get_stats, methods=['GET'])
+        self.flsk.add_endpoint('/get/psd', endpoint_name='get_psd', handler=self.get_psd, methods=['GET'])
+        self.flsk.add_endpoint('/get/workers', endpoint_name='get_workers', handler=self.get_workers, methods=['GET'])
         self.flsk.add_endpoint('/get/calibration_settings', endpoint_name='get_calibration_settings', handler=self.get_calibration_settings, methods=['GET'])
         
         
         self.flsk.add_endpoint('/post/trace', endpoint_name='post_trace', handler=self.post_trace, methods=['POST'])
         self.flsk.add_endpoint('/post/trace/clear', endpoint_name='post_trace_clear', handler=self.post_trace_clear, methods=['POST'])
+        self.flsk.add_endpoint('/post/stats/reset', endpoint_name='post_stats_reset', handler=self.post_stats_reset, methods=['POST'])
         
         self.flsk.add_endpoint('/post/parameter', endpoint_name='set_parameter', handler=self.set_parameter, methods=['POST'])
+        self.flsk.add_endpoint('/post/batch', endpoint_name='post_batch', handler=self.post_batch, methods=['POST'])
         self.flsk.add_endpoint('/post/offset', endpoint_name='post_offset', handler=self.post_offset, methods=['POST'])
         self.flsk.add_endpoint('/post/setpoint', endpoint_name='post_setpoint', handler=self.post_setpoint, methods=['POST'])
         self.flsk.add_endpoint('/post/pid', endpoint_name='post_pid', handler=self.post_pid, methods=['POST'])
@@ -151,6 +232,7 @@ class web_lock(object):
         self.flsk.add_endpoint('/post/ramp_rate', endpoint_name='post_ramp_rate', handler=self.post_ramp_rate, methods=['POST'])
         self.flsk.add_endpoint('/post/range', endpoint_name='post_range', handler=self.post_range, methods=['POST'])
         self.flsk.add_endpoint('/post/reset', endpoint_name='post_reset', handler=self.post_reset, methods=['POST'])
+        self.flsk.add_endpoint('/post/engine', endpoint_name='post_engine', handler=self.post_engine, methods=['POST'])
         
         self.flsk.add_endpoint('/post/lock', endpoint_name='post_lock', handler=self.post_lock, methods=['POST'])
         self.flsk.add_endpoint('/post/unlock', endpoint_name='post_unlock', handler=self.post_unlock, methods=['POST'])
@@ -162,6 +244,13 @@ class web_lock(object):
         #self.flsk.add_endpoint('/post/wm_calibrate', endpoint_name='wm_calibrate', handler=self.post_wm_calibrate, methods=['POST'])
         self.flsk.add_endpoint('/post/wm_abort', endpoint_name='wm_abort', handler=self.post_wm_abort, methods=['POST'])
         self.flsk.add_endpoint('/post/wm_calibrate', endpoint_name='wm_calibrate', handler=self.post_wm_calibrate, methods=['POST'])
+        self.flsk.add_endpoint('/get/wm_calibration', endpoint_name='get_wm_calibration', handler=self.get_wm_calibration, methods=['GET'])
+        self.flsk.add_endpoint('/get/reference', endpoint_name='get_reference', handler=self.get_reference, methods=['GET'])
+        self.flsk.add_endpoint('/get/health', endpoint_name='get_health', handler=self.get_health, methods=['GET'])
+        self.flsk.add_endpoint('/post/health', endpoint_name='post_health', handler=self.post_health, methods=['POST'])
+        self.flsk.add_endpoint('/post/profile', endpoint_name='post_profile', handler=self.post_profile, methods=['POST'])
+        self.flsk.add_endpoint('/get/profile', endpoint_name='get_profile', handler=self.get_profile, methods=['GET'])
+        self.flsk.add_endpoint('/metrics', endpoint_name='metrics', handler=self.get_metrics, methods=['GET'], mimetype=METRICS_CONTENT_TYPE, serve_json=False)
 
         
         self.flsk.add_endpoint('/post/remove', endpoint_name='post_remove', handler=self.post_remove, methods=['POST'])
@@ -173,6 +262,10 @@ class web_lock(object):
         
         self.flsk.add_endpoint('/post/csv_logging', endpoint_name='post_csv_logging',
                        handler=self.post_csv_logging, methods=['POST'])
+        self.flsk.add_endpoint('/post/archive', endpoint_name='post_archive', handler=self.post_archive, methods=['POST'])
+        self.flsk.add_endpoint('/get/archive', endpoint_name='get_archive', handler=self.get_archive, methods=['GET'])
+        self.flsk.add_endpoint('/get/history', endpoint_name='get_history', handler=self.get_history, methods=['GET'])
+        self.flsk.add_endpoint('/get/rollup', endpoint_name='get_rollup', handler=self.get_rollup, methods=['GET'])
         self.flsk.add_url_rule(
     '/stream/values',
     'stream_values',
@@ -196,11 +289,22 @@ class web_lock(object):
     def __del__(self):
         try:
             self.cntrl.stop()
+            if self.wvm is not None:
+                self.wvm.stop_monitor()
+            if self.health is not None:
+                self.health.stop()
+            if self.push is not None:
+                self.push.stop()
             self.flsk.shutdown_server()
         except:
             pass
         
-    def run(self, host='127.0.0.1', port=8080, debug=True):
+    def run(self, host='127.0.0.1', port=8080, debug=True, push_port=None):
+        ### push_port: serve the live streams from the asyncio push server instead of waitress threads
+        if push_port is not None:
+            self.start_push(host=host, port=push_port)
+        if self.wvm is not None and self.wvm.wvm is not None:
+            self.wvm.monitor() ### replaces MonitorWavemeter, reads the WLM only while nobody else does
         #signal.signal(signal.SIGTERM, self.flsk.shutdown_server)
         #signal.signal(signal.SIGINT, self.flsk.shutdown_server)
         #signal.signal(signal.SIGHUP, signal.SIG_IGN)
@@ -219,6 +323,12 @@ class web_lock(object):
         #print(dirpath)
         
         _, lst = self.get_list([])
+        push_url = ''
+        if self.push is not None:
+            push_url = '//%s:%i'%(request.host.rsplit(':', 1)[0], self.push.port)
+        key = (tuple(lst), push_url)
+        if self.index_cache[0] == key: ### rendered again only when the channel set changes
+            return True, self.index_cache[1]
         form_select = ''
         form_indicate = ''
         for l in lst:
@@ -230,7 +340,8 @@ class web_lock(object):
                                 '<span class="stat_indicator" style="" id="res_%s_L"'%l + \
                                 'onclick="toggle_lock(%s%s%s)">L</span>'%("'",l,"'") + \
                                 '</div>'
-        html = render_template("index.html", form_select=form_select, form_indicate=form_indicate)
+        html = render_template("index.html", form_select=form_select, form_indicate=form_indicate, push_url=push_url)
+        self.index_cache = (key, html)
         return True, html
     
     def stop(self, req_data):
@@ -255,6 +366,14 @@ class web_lock(object):
     def get_config(self, req_data):
         return True, self.cntrl.get_config()
 
+    def state_version(self):
+        ### changes with the config and the channel list, keys the cached /get/list and /get/config
+        return self.cntrl.state_version
+
+    def status_version(self):
+        ### cycle and acquisition times in the status change with every PID sample
+        return self.cntrl.state_version, self.cntrl.slot_count
+
     def get_default_config(self, req_data):
         return True, self.cntrl.get_config_default()
     
@@ -272,41 +391,102 @@ class web_lock(object):
         return False, {}
     
     def set_parameter(self, req_data):
-        cfg = self.cntrl.get_config()
         print("LockServer set_parameter: ")
         if 'name' in req_data and 'data' in req_data:
             name = req_data['name']
             data = req_data['data']
-            if ('setpoint' in data):
-                self.cntrl.set_setpoint(name, data['setpoint'])
-            if ('offset' in data):
-                self.cntrl.set_offset(name, data['offset'])
-            if (('P' in data) and ('I' in data) and ('D' in data)):
-                self.cntrl.set_pid(name, data['P'], data['I'], data['D'])
-            if ('limits' in data):
-                self.cntrl.set_limits(name, data['limits'])
-            if ('ramp_rate' in data):
-                self.cntrl.set_ramp_rate(name, data['ramp_rate'])
-            if (('range_center' in data) and ('range_span' in data)):
-                self.cntrl.set_input_range(name, data['range_center'], data['range_span'])
-            if ('WM_Exposure' in data):
-                self.cntrl.set_wm_exposure(name, data['WM_Exposure'])
-                #print(name, " Debug Exposure Config:", data['WM_Exposure'])
-            if ('WM_Reading_State' in data):
-                self.cntrl.set(name, 'WM_Reading_State', data['WM_Reading_State'])
-            return True, {}
+            ### all parameters of one request are applied together at one slot boundary
+            future = self.cntrl.submit(self.__apply_parameter, name, data)
+            return self.__result(future)
             #if name in cfg:
             #    cfg[name] = data
             #    self.cntrl.set_config(cfg)
             #    return True, cfg
         return False, {}
     
+    def post_batch(self, req_data):
+        '''
+        Run several JSON endpoints in one request: {'ops':[{'path':'post/setpoint', 'data':{...}}, ...]}
+        All post/ ops are applied together at one slot boundary with a single config write,
+        get/ ops are answered afterwards, i.e. they see the state after the batch.
+        A batch with an unknown path is rejected as a whole.
+        '''
+        ops = req_data.get('ops')
+        if not isinstance(ops, list):
+            return False, {'error':'ops list expected'}
+        paths = [str(op.get('path', '')).strip('/') if isinstance(op, dict) else '' for op in ops]
+        unknown = [p for p in paths if p not in self.flsk.handlers or p == 'post/batch']
+        if unknown:
+            return False, [{'status':False, 'data':{'error':('unknown path '+p) if p in unknown else 'batch rejected'}}
+                           for p in paths]
+        results = [None]*len(ops)
+        writes = [i for i, p in enumerate(paths) if not p.startswith('get/')]
+        ret, info = self.__result(self.cntrl.submit(self.__run_ops, ops, paths, writes, results))
+        if ret is False:
+            return False, info
+        self.__run_ops(ops, paths, [i for i, p in enumerate(paths) if p.startswith('get/')], results)
+        return all(r['status'] is not False for r in results), results
+    
+    def __run_ops(self, ops, paths, indices, results):
+        for i in indices:
+            try:
+                ret, data = self.flsk.handlers[paths[i]](ops[i].get('data') or {})
+            except Exception as e:
+                ret, data = False, {'error':str(e)}
+            results[i] = {'status':ret, 'data':data}
+        return True
+    
+    def __apply_parameter(self, name, data):
+        if ('setpoint' in data):
+            self.cntrl.set_setpoint(name, data['setpoint'])
+        if ('offset' in data):
+            self.cntrl.set_offset(name, data['offset'])
+        if (('P' in data) and ('I' in data) and ('D' in data)):
+            self.cntrl.set_pid(name, data['P'], data['I'], data['D'])
+        if ('limits' in data):
+            self.cntrl.set_limits(name, data['limits'])
+        if ('ramp_rate' in data):
+            self.cntrl.set_ramp_rate(name, data['ramp_rate'])
+        if (('range_center' in data) and ('range_span' in data)):
+            self.cntrl.set_input_range(name, data['range_center'], data['range_span'])
+        if ('WM_Exposure' in data):
+            self.cntrl.set_wm_exposure(name, data['WM_Exposure'])
+            #print(name, " Debug Exposure Config:", data['WM_Exposure'])
+        if ('WM_Reading_State' in data):
+            self.cntrl.set(name, 'WM_Reading_State', data['WM_Reading_State'])
+        if ('engine' in data):
+            self.cntrl.set_engine(name, data['engine'])
+        return True
+    
+    def __command(self, method, *args):
+        return self.__result(self.cntrl.request(method, *args))
+    
+    def __result(self, future):
+        try:
+            ret, version = wait_command(future, self.cntrl.command_timeout)
+        except Exception as e:
+            return False, {'error':str(e)}
+        return ret, {'version':version}
+    
     def get_status(self, req_data):
         name = None
         if 'name' in req_data:
             name = req_data['name']
         return True, self.cntrl.get_status(name)
 
+    def get_stats(self, req_data):
+        name = req_data.get('name') if 'name' in req_data else None
+        return True, self.cntrl.get_stats(name)
+
+    def get_psd(self, req_data):
+        name = req_data.get('name') if 'name' in req_data else None
+        return True, self.cntrl.get_psd(name)
+
+    def get_workers(self, req_data):
+        if hasattr(type(self.cntrl), 'get_workers'):
+            return True, self.cntrl.get_workers()
+        return False, {}
+
     def get_trace_last(self, req_data):
         if 'name' in req_data:
             name = req_data['name']
@@ -354,7 +534,7 @@ class web_lock(object):
     def post_sampling(self, req_data):
         if 'data' in req_data:
             data = req_data['data']
-            return self.cntrl.set_sampling(data), {}
+            return self.__command('set_sampling', data)
         else:
             return False,{}
         
@@ -362,22 +542,26 @@ class web_lock(object):
         if 'name' in req_data and 'data' in req_data:
             name = req_data['name']
             data = req_data['data']
-            return self.cntrl.set_trace(name, data), {}
+            return self.__command('set_trace', name, data)
         else:
             return False,{}
         
     def post_trace_clear(self, req_data):
         if 'name' in req_data:
             name = req_data['name']
-            return self.cntrl.clear_trace(name), {}
+            return self.__command('clear_trace', name)
         else:
             return False,{}
 
+    def post_stats_reset(self, req_data):
+        name = req_data.get('name') if 'name' in req_data else None
+        return self.cntrl.reset_stats(name), {}
+
     def post_offset(self, req_data):
         if 'name' in req_data and 'data' in req_data:
             name = req_data['name']
             data = req_data['data']
-            return self.cntrl.set_offset(name, data), {}
+            return self.__command('set_offset', name, data)
         else:
             return False,{}
 
@@ -385,7 +569,7 @@ class web_lock(object):
         if 'name' in req_data and 'data' in req_data:
             name = req_data['name']
             data = req_data['data']
-            return self.cntrl.set_setpoint(name, data), {}
+            return self.__command('set_setpoint', name, data)
         else:
             return False,{}
 
@@ -393,7 +577,7 @@ class web_lock(object):
         if 'name' in req_data and 'data' in req_data:
             name = req_data['name']
             data = req_data['data']
-            return self.cntrl.set_pid_dict(name, data), {}
+            return self.__command('set_pid_dict', name, data)
         else:
             return False,{}
         
@@ -401,7 +585,7 @@ class web_lock(object):
         if 'name' in req_data and 'data' in req_data:
             name = req_data['name']
             data = req_data['data']
-            return self.cntrl.set_limits(name, data), {}
+            return self.__command('set_limits', name, data)
         else:
             return False,{}
             
@@ -409,49 +593,59 @@ class web_lock(object):
         if 'name' in req_data and 'data' in req_data:
             name = req_data['name']
             data = req_data['data']
-            return self.cntrl.set_ramp_rate(name, data), {}
+            return self.__command('set_ramp_rate', name, data)
         else:
             return False,{}        
     def post_range(self, req_data):
         if 'name' in req_data and 'data' in req_data:
             name = req_data['name']
             data = req_data['data']
-            return self.cntrl.set_input_range(name, *data), {}
+            return self.__command('set_input_range', name, *data)
         else:
             return False, {}
 
+    def post_engine(self, req_data):
+        if 'name' in req_data and 'data' in req_data:
+            name = req_data['name']
+            data = req_data['data']
+            ret, info = self.__command('set_engine', name, data)
+            info['engine'] = self.cntrl.get_engine(name)
+            return ret, info
+        else:
+            return False,{}
+
     def post_reset(self, req_data):
         if 'name' in req_data:
             name = req_data['name']
-            return self.cntrl.reset(name), {}
+            return self.__command('reset', name)
         else:
             return False,{}
 
     def post_lock(self, req_data):
         if 'name' in req_data:
             name = req_data['name']
-            return self.cntrl.lock(name,True), {}
+            return self.__command('lock', name,True)
         else:
             return False,{}
 
     def post_unlock(self, req_data):
         if 'name' in req_data:
             name = req_data['name']
-            return self.cntrl.lock(name,False), {}
+            return self.__command('lock', name,False)
         else:
             return False,{}
     
     def post_activate(self, req_data):
         if 'name' in req_data:
             name = req_data['name']
-            return self.cntrl.activate(name,True), {}
+            return self.__command('activate', name,True)
         else:
             return False,{}
     
     def post_deactivate(self, req_data):
         if 'name' in req_data:
             name = req_data['name']
-            return self.cntrl.activate(name,False), {}
+            return self.__command('activate', name,False)
         else:
             return False,{}
 
@@ -473,6 +667,8 @@ class web_lock(object):
         self.calibration_settings["wm_calibration_interval"] = interval
         self.cntrl.set_global("wm_calibration_frequency", wavelength)
         self.cntrl.set_global("wm_calibration_interval", interval)
+        if self.reference is not None and interval > 0:
+            self.reference.min_interval = interval ### s between two automatic calibrations on drift
     
         print(f"Updated calibration settings: reference frequency={wavelength}, time interval={interval}")
         return True, {}
@@ -480,6 +676,12 @@ class web_lock(object):
     def get_calibration_settings(self, req_data):
         return True, self.calibration_settings
 
+    def __calibration_result(self, result):
+        ### control thread: last reference reading for the digit display, as WavemeterCalibration.initialize did
+        if result['frequency'] is not None:
+            self.cntrl.LastWMValue = result['frequency']
+        print("WM reference check: %s (deviation %s THz)" % (result['result'], result['deviation']))
+
     def post_csv_logging(self, req_data):
         if "name" not in req_data or "enable" not in req_data:
             return False, {"error": "name und enable erwartet"}
@@ -487,6 +689,43 @@ class web_lock(object):
         enable = bool(req_data["enable"])
         self.cntrl.enable_csv_logging(name, enable)
         return True, {"logging": enable}
+
+    def post_archive(self, req_data):
+        if "name" not in req_data or "enable" not in req_data:
+            return False, {"error": "name und enable erwartet"}
+        enable = bool(req_data["enable"])
+        return self.cntrl.enable_archive(req_data["name"], enable), {"archive": enable}
+
+    def get_archive(self, req_data):
+        if 'name' not in req_data:
+            return False, {}
+        t0 = float(req_data['t0']) if req_data.get('t0') is not None else None
+        t1 = float(req_data['t1']) if req_data.get('t1') is not None else None
+        columns = req_data.get('columns')
+        if isinstance(columns, str):
+            columns = columns.split(',')
+        try:
+            return True, self.cntrl.get_archive(req_data['name'], t0, t1, columns)
+        except KeyError as e:
+            return False, {'error': 'unknown column '+str(e)}
+
+    def get_history(self, req_data):
+        if 'name' not in req_data:
+            return False, {}
+        t0 = float(req_data['t0']) if req_data.get('t0') is not None else None
+        t1 = float(req_data['t1']) if req_data.get('t1') is not None else None
+        max_points = int(req_data.get('max_points') or 1000)
+        return True, self.cntrl.get_history(req_data['name'], t0, t1, max_points)
+
+    def get_rollup(self, req_data):
+        if 'name' not in req_data:
+            return False, {}
+        level = float(req_data['level']) if req_data.get('level') is not None else None
+        t0 = float(req_data['t0']) if req_data.get('t0') is not None else None
+        t1 = float(req_data['t1']) if req_data.get('t1') is not None else None
+        max_points = int(req_data.get('max_points') or 1000)
+        ret = self.cntrl.get_rollup(req_data['name'], level, t0, t1, max_points)
+        return len(ret) > 0, ret
         
     #def sse_values(self, req_data=None):
      #   def generate():
@@ -497,51 +736,80 @@ class web_lock(object):
      #           yield f"data: {data}\n\n"
      #   return generate
 
+    def values_payload(self):
+        active_values = {k:v for k,v in self.cntrl.latest_values.items() if self.cntrl.get(k, 'active')}
+        return {
+            "active_values": active_values,
+            "piezo_values": self.cntrl.latest_piezo_values,
+            "reference_lock_state": getattr(self.cntrl, 'ReferenceLockState', False),
+            "freq_650_value": self.cntrl.latest_values.get("650 nm")
+        }
+
+    def digit_payload(self):
+        ### newest WLM reading from the broker cache (also while the controller is paused), no DLL call
+        reading = self.wvm.cached() if self.wvm is not None else None
+        if reading is not None:
+            return reading[0]
+        return getattr(self.cntrl, 'LastWMValue', None)
+
+    def __wm_reading(self, label, value, t):
+        self.cntrl.LastWMValue = value
+
+    def piezo_payload(self):
+        return self.cntrl.latest_piezo_values  # Dict mit Key:Reglername, Value:Piezo
+
+    def live_payload(self):
+        ### name -> fields for /stream/live, '.' holds the values that belong to no channel
+        values = self.cntrl.latest_values
+        piezo = self.cntrl.latest_piezo_values
+        ret = {}
+        for name in self.cntrl.get_list():
+            ret[name] = {'value':values.get(name), 'piezo':piezo.get(name), 'active':self.cntrl.get(name, 'active'),
+                         'lock':self.cntrl.get(name, 'lock'), 'setpoint':self.cntrl.get(name, 'setpoint')}
+        for name in values:
+            if name not in ret:
+                ret[name] = {'value':values[name], 'active':self.cntrl.get(name, 'active')}
+        ret['.'] = {'reference_lock_state':getattr(self.cntrl, 'ReferenceLockState', False),
+                    'wm_value':self.digit_payload()}
+        return ret
+
     def sse_values(self, req_data=None):
-        def generate():
-            while True:
-                import time, json
-                time.sleep(0.01)
-                active_values = {k:v for k,v in self.cntrl.latest_values.items() if self.cntrl.get(k, 'active')}
-                piezo_values = self.cntrl.latest_piezo_values
-                reference_lock_state = getattr(self.cntrl, 'ReferenceLockState', False)
-                freq_650_value = self.cntrl.latest_values.get("650 nm")
-                data = json.dumps({
-                    "active_values": active_values,
-                    "piezo_values": piezo_values,
-                    "reference_lock_state": reference_lock_state,
-                    "freq_650_value": freq_650_value 
-                })
-                yield f"data: {data}\n\n"
-        return generate
+        return self.__sse(self.values_payload, STREAM_PERIODS['values'])
 
     def sse_digit_display(self, req_data=None):
-        def generate():
-            while True:
-                import time, json
-                time.sleep(0.5)
-                
-                # Prüfen, ob der Controller pausiert ist
-                if getattr(self.cntrl, 'pause_event', None) and not self.cntrl.pause_event.is_set():
-                    wm_value = getattr(getattr(self, 'wm_calib', None), 'latest_wm_value', None)
-                else:
-                    # Controller läuft → Wert aus Controller verwenden
-                    wm_value = getattr(self.cntrl, 'LastWMValue', None)
-                
-                data = json.dumps(wm_value)
-                yield f"data: {data}\n\n"
-        return generate
-
+        return self.__sse(self.digit_payload, STREAM_PERIODS['digit'])
     
     def sse_piezo_values(self, req_data=None):
+        return self.__sse(self.piezo_payload, STREAM_PERIODS['piezo'])
+
+    def __sse(self, payload, period):
+        ### one waitress thread per client; start_push serves the same streams from one event loop
         def generate():
             while True:
-                import time, json
-                time.sleep(0.1)
-                piezo_values = self.cntrl.latest_piezo_values  # Dict mit Key:Reglername, Value:Piezo
-                yield f"data: {json.dumps(piezo_values)}\n\n"
+                time.sleep(period)
+                yield b'data: ' + lock_json.dumps(payload()) + b'\n\n'
         return generate
 
+    def start_push(self, host='127.0.0.1', port=8081):
+        '''Serve /stream/values, /stream/piezo, /stream/digit and /stream/live (SSE and WebSocket) from an asyncio thread.'''
+        self.push = push_server({'values':(STREAM_PERIODS['values'], self.values_payload),
+                                 'piezo':(STREAM_PERIODS['piezo'], self.piezo_payload),
+                                 'digit':(STREAM_PERIODS['digit'], self.digit_payload)},
+                                host=host, port=port, authorize=self.__push_authorized,
+                                live=(STREAM_PERIODS['values'], self.live_payload))
+        self.push.start()
+        return self.push
+
+    def __push_authorized(self, headers):
+        ### same login as the Flask app: the signed session cookie of /login
+        cookie = SimpleCookie(headers.get('cookie', '')).get(self.flsk.config['SESSION_COOKIE_NAME'])
+        if cookie is None:
+            return False
+        try:
+            return bool(self.flsk.session_interface.get_signing_serializer(self.flsk).loads(cookie.value).get('logged_in'))
+        except Exception:
+            return False
+
 
     def post_set_piezo(self, req_data):
         if 'name' in req_data and 'piezo_value' in req_data:
@@ -560,49 +828,165 @@ class web_lock(object):
             return False, {"error": "name and piezo_value required"}
                 
     def post_wm_abort(self, req_data):
-        try:
-            if hasattr(self, 'wm_calib') and self.wm_calib.initialized:
-                # Prüfen, ob die Kalibrierung gerade läuft
-                if getattr(self.wm_calib, 'running', False):  # neues Flag 'running'
-                    self.wm_calib.abort_calibration()
-                    self.wm_calib.running = False
-                    return True, {"status": "aborted"}
-                else:
-                    return False, {"error": "Calibration not running"}
-            return False, {"error": "Wavemeter not initialized"}
-        except Exception as e:
-            return False, {"error": str(e)}
+        if not self.scheduler:
+            return False, {"error": NO_SCHEDULER}
+        if self.calibration.abort():
+            return True, {"status": "aborted"}
+        return False, {"error": "Calibration not running"}
 
     def post_wm_initialize(self, req_data):
-        try:
-            if not hasattr(self, 'wm_calib'):
-                print("no attribute")
-                self.wm_calib = WavemeterCalibration(self.wvm, self.cntrl)
-    
-            self.wm_calib.initialize()
-            print("initializing")
-            # Kalibrierung läuft jetzt
-            self.wm_calib.running = True
-    
-            if self.wm_calib.initialized:
-                print("initialized")
-                return True, {"status": "initialized"}
-            else:
-                print("Initialization failed")
-                return False, {"error": "Initialization failed"}
-        except Exception as e:
-            print("Calibration INit exceptiopn")
-            return False, {"error": str(e)}
+        ### reference check on the scheduler: calibrates only if the reference deviates by more than the threshold
+        if not self.scheduler:
+            return False, {"error": NO_SCHEDULER}
+        if self.calibration.start():
+            return True, {"status": "started"}
+        return False, {"error": "Calibration already running"}
             
     def post_wm_calibrate(self, req_data):
+        if not self.scheduler:
+            return False, {"error": NO_SCHEDULER}
+        if self.calibration.start(force=True):
+            return True, {"status": "started"}
+        return False, {"error": "Calibration already running"}
+
+    def get_wm_calibration(self, req_data):
+        if not self.scheduler:
+            return False, {"error": NO_SCHEDULER}
+        return True, self.calibration.status()
+
+    def start_health(self, period=1., writer=None, **kwargs):
+        '''
+        Sample host load and control-loop timing in the background (lock_health.health_sampler),
+        served by /get/health and, with a lock_health.telemetry_writer, written out in batches.
+        '''
+        if self.health is not None:
+            self.health.stop()
+        ### the orchestrated_controller has no cycle_period / pid_dict / commands: those sources read None
+        sources = {'loop_period':lambda: numeric(getattr(self.cntrl, 'cycle_period', None)),
+                   'pid_time_max':self.__pid_time_max,
+                   'commands':lambda: self.cntrl.commands.qsize() if hasattr(self.cntrl, 'commands') else None,
+                   'wlm_calls':lambda: self.wvm.calls if self.wvm is not None else None,
+                   'wlm_wait':lambda: self.wvm.wait_time if self.wvm is not None else None}
+        sources.update(kwargs.pop('sources', {}))
+        self.health = health_sampler(period=period, writer=writer, sources=sources, **kwargs)
+        self.health.start()
+        return self.health
+
+    def __pid_time_max(self):
+        pid_dict = getattr(self.cntrl, 'pid_dict', None)
+        if pid_dict is not None:
+            times = [getattr(pid, 'cycle_time', None) for pid in list(pid_dict.values())]
+        else: ### orchestrated_controller: the workers publish their cycle times in the live table
+            times = [status.get('cycle_time') for status in self.cntrl.get_status().values()]
+        times = [t for t in times if numeric(t) is not None]
+        return max(times) if times else None
+
+    def get_health(self, req_data):
+        if self.health is None:
+            return False, {"error": "Health sampler not started"}
+        names = req_data.get('names')
+        if isinstance(names, str):
+            names = names.split(',')
+        last = req_data.get('last')
+        if last is None and names is None:
+            return True, self.health.latest()
+        return True, self.health.get_trace(names, int(last) if last is not None else None)
+
+    def post_health(self, req_data):
         try:
-            if not hasattr(self, 'wm_calib') or not self.wm_calib.initialized:
-                return False, {"error": "Wavemeter not initialized"}
-            self.wm_calib.calibrate()
-            return True, {"status": "calibration_done"}
-        except Exception as e:
+            period = float(req_data.get('period'))
+        except (TypeError, ValueError):
+            return False, {"error": "period (s) expected"}
+        if period <= 0:
+            return False, {"error": "period must be positive"}
+        if self.health is None:
+            self.start_health(period=period)
+        self.health.period = period
+        return True, {'period':period}
+
+    def post_profile(self, req_data):
+        ### {'mode': 'stack' | 'timing', 'seconds': N, 'interval': s} or {'stop': true}; the result is read from /get/profile
+        if self.profiler is None:
+            return False, {"error": NO_PROFILER}
+        if req_data.get('stop'):
+            self.profiler.stop()
+            return True, self.profiler.status()
+        try:
+            return True, self.profiler.start(mode=req_data.get('mode', 'stack'), seconds=req_data.get('seconds', 10),
+                                             interval=req_data.get('interval', 0.005))
+        except ValueError as e:
             return False, {"error": str(e)}
 
+    def get_profile(self, req_data):
+        if self.profiler is None:
+            return False, {"error": NO_PROFILER}
+        return True, self.profiler.status()
+
+    def get_metrics(self, req_data):
+        ### Prometheus text format; the counters are only read here, the control thread never waits for a scrape
+        metrics = getattr(self.cntrl, 'metrics', None)
+        if not isinstance(metrics, lock_metrics): ### e.g. orchestrated_controller: loop metrics live in the workers
+            metrics = lock_metrics()
+        return True, metrics.render(self.__metrics_extra())
+
+    def __metrics_extra(self):
+        cntrl = self.cntrl
+        pid_dict = getattr(cntrl, 'pid_dict', None)
+        pid_dict = pid_dict if hasattr(pid_dict, 'items') else {}
+        commands = getattr(cntrl, 'commands', None)
+        extra = [('loop_period_seconds', 'gauge', 'Duration of the last cycle over all channels.', (), getattr(cntrl, 'cycle_period', None)),
+                 ('command_queue_depth', 'gauge', 'Commands waiting for the next slot boundary.', (), commands.qsize() if hasattr(commands, 'qsize') else None)]
+        extra += [('channel_locked', 'gauge', 'Lock state per channel.', (('channel', name),), bool(pid.lock)) for name, pid in list(pid_dict.items())]
+        extra += [('sink_errors_total', 'counter', 'Failed ingest sink calls (journal, archive, ...) per channel.', (('channel', name),),
+                   getattr(pid, 'sink_errors', None)) for name, pid in list(pid_dict.items())]
+        reference = cntrl.ReferenceLockState
+        extra.append(('reference_in_lock', 'gauge', 'Reference laser inside its tolerance.', (), None if reference is None else bool(reference)))
+        if self.push is not None:
+            streams = [(name, stream.subscribers) for name, stream in self.push.streams.items()]
+            if self.push.live is not None:
+                streams.append(('live', self.push.live.subscribers))
+            extra += [('push_subscribers', 'gauge', 'Clients of the push server per stream.', (('stream', name),), len(subscribers))
+                      for name, subscribers in streams]
+        if self.health is not None and self.health.writer is not None:
+            writer = self.health.writer
+            extra += [('telemetry_queue_depth', 'gauge', 'Points waiting for the next telemetry batch.', (), len(writer.points)),
+                      ('telemetry_dropped_total', 'counter', 'Telemetry points dropped while the sink failed.', (), writer.dropped)]
+        if self.wvm is not None:
+            extra += [('wlm_calls_total', 'counter', 'Wavemeter DLL calls.', (), self.wvm.calls),
+                      ('wlm_wait_seconds_total', 'counter', 'Time callers waited for the wavemeter.', (), self.wvm.wait_time)]
+        ### only numbers reach the exposition, whatever a foreign controller returns for the probed attributes
+        return [metric for metric in extra if numeric(metric[4]) is not None]
+
+    def get_reference(self, req_data):
+        if self.reference is None:
+            return False, {"error": "Reference monitoring not enabled"}
+        ret = self.reference.status()
+        if req_data.get('trace'):
+            ret['trace'] = self.reference.get_trace()
+        return True, ret
+
+    def monitor_reference(self, period=PERIOD, on_sample=None, name='650 nm', **kwargs):
+        '''
+        Sample the reference laser in one controller slot every `period` seconds (instead of CheckReferenceLock);
+        max_duty (kwargs) bounds the fraction of the time the visits take, see lock_calibration.reference_slot.
+        Keeps ReferenceLockState and latest_values[name] up to date and starts the calibration when the reference drifts.
+        on_sample(sample) is called on the control thread for every reading, e.g. for logging.
+        '''
+        if not self.scheduler:
+            raise RuntimeError(NO_SCHEDULER)
+        interval = self.calibration_settings.get("wm_calibration_interval") or 0
+        kwargs.setdefault('min_interval', interval if interval > 0 else 600.)
+        def sample(data):
+            self.cntrl.ReferenceLockState = data['in_lock']
+            self.cntrl.latest_values[name] = data['frequency'] ### shown as the reference row of the channel table
+            if on_sample is not None:
+                on_sample(data)
+        if self.reference is not None:
+            self.cntrl.remove_slot(self.reference)
+        self.reference = reference_slot(self.calibration, period=period, on_sample=sample, **kwargs)
+        self.cntrl.add_slot(self.reference)
+        return self.reference
+
  #   def post_wm_calibrate(self, req_data):
  #       try:
  #           if not hasattr(self, 'wm_calib') or not self.wm_calib.initialized:
@@ -0,0 +1,175 @@
+"""
+Incremental lock-quality statistics per channel.
+
+Every new sample is folded into running statistics at O(1) cost, so the web
+server can serve them at any time without rescanning the trace:
+
+- mean / standard deviation of the lock error (Welford),
+- overlapping Allan deviation of the error at octave averaging times
+  (tau = 1, 2, 4, ... samples),
+- time spent inside the tolerance band (default +-5 MHz) while locked,
+- lock-loss events (leaving the band while locked, or being unlocked).
+
+Units follow the channel input (THz for the wavemeter channels).
+"""
+
+from __future__ import annotations
+
+import collections
+import math
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+TOLERANCE = 0.000005  # 5 MHz in THz, same band as the plots in lock_server
+OCTAVES = 12          # tau up to 2**11 samples
+
+
+class channel_stats(object):
+    """Running statistics of a single channel."""
+
+    def __init__(self, tolerance: float = TOLERANCE, octaves: int = OCTAVES,
+                 max_events: int = 100) -> None:
+        self.tolerance = tolerance
+        self.m_list = [2**k for k in range(octaves)]
+        self.events: collections.deque = collections.deque(maxlen=max_events)
+        self.reset()
+
+    def reset(self) -> None:
+        # Welford accumulators for the error
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.invalid = 0
+        # mean sample interval, used to convert m to tau in seconds
+        self.n_dt = 0
+        self.mean_dt = 0.
+        # phase ring buffer (cumulative sum of the error) for the overlapping ADEV
+        self.ring_len = 2*self.m_list[-1] + 1
+        self.ring: List[float] = [0.] * self.ring_len
+        self.head = -1
+        self.phase = 0.
+        self.avar_sum = [0.] * len(self.m_list)
+        self.avar_count = [0] * len(self.m_list)
+        # tolerance band / lock bookkeeping
+        self.locked_time = 0.
+        self.in_tol_time = 0.
+        self.last_time: Optional[float] = None
+        self.last_locked = False
+        self.last_in_tol = True
+        self.lock_losses = 0
+        self.events.clear()
+
+    def add(self, t: float, error: Optional[float], locked: bool, valid: bool = True) -> None:
+        """Fold in one sample taken at time t (s) with lock error `error`."""
+        if self.last_time is not None:
+            dt = t - self.last_time
+            if dt > 0:
+                self.n_dt += 1
+                self.mean_dt += (dt - self.mean_dt) / self.n_dt
+                if self.last_locked:
+                    self.locked_time += dt
+                    if self.last_in_tol:
+                        self.in_tol_time += dt
+        if self.last_locked and not locked:
+            self.lock_losses += 1
+            self.events.append({'time': t, 'kind': 'unlock', 'error': error})
+        self.last_time = t
+
+        if not valid or error is None:
+            self.invalid += 1
+            self.last_locked = bool(locked)
+            return
+
+        in_tol = abs(error) <= self.tolerance
+        if locked and self.last_locked and self.last_in_tol and not in_tol:
+            self.lock_losses += 1
+            self.events.append({'time': t, 'kind': 'tolerance', 'error': error})
+        self.last_locked = bool(locked)
+        self.last_in_tol = in_tol
+
+        self.n += 1
+        delta = error - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (error - self.mean)
+
+        self.phase += error
+        self.head = (self.head + 1) % self.ring_len
+        self.ring[self.head] = self.phase
+        for k, m in enumerate(self.m_list):
+            if self.n < 2*m + 1:
+                break
+            x0 = self.ring[(self.head - 2*m) % self.ring_len]
+            x1 = self.ring[(self.head - m) % self.ring_len]
+            d = self.phase - 2*x1 + x0
+            self.avar_sum[k] += d*d
+            self.avar_count[k] += 1
+
+    @property
+    def std(self) -> Optional[float]:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+    def adev(self) -> Dict[str, List[float]]:
+        """Overlapping Allan deviation at the octave taus with enough data."""
+        taus, devs = [], []
+        for k, m in enumerate(self.m_list):
+            if self.avar_count[k] == 0:
+                break
+            taus.append(m * self.mean_dt)
+            devs.append(math.sqrt(self.avar_sum[k] / (2. * m * m * self.avar_count[k])))
+        return {'tau': taus, 'adev': devs}
+
+    def get(self) -> Dict[str, Any]:
+        return {
+            'samples': self.n,
+            'invalid': self.invalid,
+            'mean': self.mean if self.n else None,
+            'std': self.std,
+            'sample_interval': self.mean_dt if self.n_dt else None,
+            'allan': self.adev(),
+            'tolerance': self.tolerance,
+            'locked_time': self.locked_time,
+            'in_tolerance_time': self.in_tol_time,
+            'in_tolerance_fraction': (self.in_tol_time / self.locked_time) if self.locked_time > 0 else None,
+            'lock_losses': self.lock_losses,
+            'events': list(self.events),
+        }
+
+
+class lock_analytics(object):
+    """`channel_stats` for every channel of a Controller."""
+
+    def __init__(self, tolerance: float = TOLERANCE, octaves: int = OCTAVES) -> None:
+        self.tolerance = tolerance
+        self.octaves = octaves
+        self.channels: Dict[str, channel_stats] = {}
+        self.mutex = Lock()
+
+    def add(self, name: str, t: float, value: Optional[float], error: Optional[float], locked: bool) -> None:
+        """Fold in one sample; non-positive inputs are WLM readout errors."""
+        stats = self.channels.get(name)
+        if stats is None:
+            stats = self.channels.setdefault(name, channel_stats(self.tolerance, self.octaves))
+        valid = value is not None and value > 0
+        with self.mutex:
+            stats.add(t, error, locked, valid)
+
+    def get(self, name: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        names = [name] if name in self.channels else list(self.channels)
+        with self.mutex:
+            return {n: self.channels[n].get() for n in names}
+
+    def reset(self, name: Optional[str] = None) -> bool:
+        names = [name] if name in self.channels else list(self.channels)
+        with self.mutex:
+            for n in names:
+                self.channels[n].reset()
+        return len(names) > 0
+
+    def remove(self, name: str) -> None:
+        self.channels.pop(name, None)
+
+
+## AGENT_UPDATE
+# - Added `lock_analytics` with O(1)-per-sample Welford mean/std, overlapping Allan deviation
+#   at octave taus, time-in-tolerance (+-5 MHz) and lock-loss events, fed by Controller.run.
+# - Reason: serve live lock quality from /get/stats without rescanning or re-plotting traces.
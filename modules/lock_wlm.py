@@ -0,0 +1,157 @@
+"""
+Single access point to the wavemeter DLL.
+
+Every caller used to hold its own view of the WLM: the lock channels read it
+under a mutex of the notebook, `MonitorWavemeter` polled `GetFrequency` every
+100 ms without that mutex, and the calibration switched ports in between.
+`wlm_broker` wraps one `WavelengthMeter` and
+
+- serialises every DLL call with one re-entrant lock; `session` holds it over
+  several calls (fiber switch + read, reference port visit),
+- caches the latest reading per label with its timestamp (the label of the
+  session, e.g. the channel name, otherwise 'active' or 'num<channel>'),
+- serves non-control readers (digit display, monitor) from that cache; `monitor`
+  only calls the DLL when the control loop has not read it for `max_age`.
+
+    wvm = wlm_broker(WavelengthMeter())
+    with wvm.session('WMCH2'):
+        switch.SendCommand('B')
+        freq = wvm.GetFrequency()      # cached as 'WMCH2'
+    wvm.cached('WMCH2')                # (freq, time) without a DLL call
+"""
+
+from __future__ import annotations
+
+import contextlib
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+READINGS = ('GetFrequency', 'GetFrequency2', 'GetWavelength', 'GetWavelength2')
+READINGS_NUM = ('GetFrequencyNum', 'GetWavelengthNum')
+MAX_AGE = 1.  # s, the monitor reads the WLM itself only when the cache is older than this
+
+
+class wlm_broker(object):
+    """Serialised, caching proxy of a WavelengthMeter."""
+
+    def __init__(self, wvm: Any, on_reading: Optional[Callable[[str, float, float], None]] = None) -> None:
+        """
+        :param wvm: WavelengthMeter (or any object with the same methods), None without a wavemeter
+        :param on_reading: called with (label, value, time) for every frequency / wavelength reading
+        """
+        self.wvm = wvm
+        self.on_reading = on_reading
+        self.mutex = threading.RLock()
+        self.readings: Dict[str, Tuple[float, float]] = {}  # label -> (value, time)
+        self.last: Optional[Tuple[str, float, float]] = None  # (label, value, time) of the newest reading
+        self.calls = 0          # DLL calls through the broker
+        self.wait_time = 0.     # s callers spent waiting for the lock
+        self.__label = threading.local()
+        self.__monitor: Optional[threading.Thread] = None
+        self.__monitor_stop = threading.Event()
+
+    # ------------------------------------------------------------------ DLL access
+    @contextlib.contextmanager
+    def session(self, label: Optional[str] = None) -> Iterator['wlm_broker']:
+        """Hold the WLM for several calls; readings inside are cached under label."""
+        self.__acquire()
+        previous = getattr(self.__label, 'value', None)
+        self.__label.value = label if label is not None else previous
+        try:
+            yield self
+        finally:
+            self.__label.value = previous
+            self.mutex.release()
+
+    def __getattr__(self, name: str) -> Any:
+        func = getattr(self.wvm, name)
+        if not callable(func):
+            return func
+
+        def call(*args, **kwargs):
+            self.__acquire()
+            try:
+                self.calls += 1
+                ret = func(*args, **kwargs)
+                if name in READINGS or name in READINGS_NUM:
+                    self.__store(name, args, kwargs, ret)
+                return ret
+            finally:
+                self.mutex.release()
+        call.__name__ = name
+        return call
+
+    def __acquire(self) -> None:
+        if self.mutex.acquire(blocking=False):
+            return
+        t0 = time.perf_counter()
+        self.mutex.acquire()
+        self.wait_time += time.perf_counter() - t0
+
+    def __store(self, name: str, args: tuple, kwargs: dict, value: float) -> None:
+        label = getattr(self.__label, 'value', None)
+        if label is None:
+            if name in READINGS_NUM:
+                label = 'num%d' % (args[0] if args else kwargs.get('channel', 1))
+            else:
+                label = 'active'
+        now = time.time()
+        self.readings[label] = (value, now)
+        if value > 0: ### <= 0 are WLM error codes (under- / overexposed, no signal)
+            self.last = (label, value, now)
+            if self.on_reading is not None:
+                self.on_reading(label, value, now)
+
+    # ------------------------------------------------------------------ cached readers
+    def cached(self, label: Optional[str] = None, max_age: Optional[float] = None) -> Optional[Tuple[float, float]]:
+        """(value, time) of the latest reading of label (the newest valid reading without label), never a DLL call."""
+        if label is None:
+            reading = self.last[1:] if self.last is not None else None
+        else:
+            reading = self.readings.get(label)
+        if reading is None or (max_age is not None and time.time() - reading[1] > max_age):
+            return None
+        return reading
+
+    def monitor(self, max_age: float = MAX_AGE, period: float = 0.1) -> None:
+        """
+        Keep the cache fresh while nobody else reads the WLM (e.g. the controller is paused):
+        every `period` s, read the active channel if the newest reading is older than max_age
+        and the WLM is not held by someone else.
+        """
+        if self.__monitor is not None:
+            return
+        self.__monitor_stop.clear()
+
+        def loop():
+            while not self.__monitor_stop.wait(period):
+                if self.wvm is None or self.cached(max_age=max_age) is not None:
+                    continue
+                if not self.mutex.acquire(blocking=False): ### busy: the lock loop or a calibration will refresh it
+                    continue
+                try:
+                    self.GetFrequency()
+                except Exception as e:
+                    print('WLM monitor failed: %s' % e)
+                finally:
+                    self.mutex.release()
+        self.__monitor = threading.Thread(target=loop, name='wlm_monitor', daemon=True)
+        self.__monitor.start()
+
+    def stop_monitor(self) -> None:
+        if self.__monitor is not None:
+            self.__monitor_stop.set()
+            self.__monitor.join()
+            self.__monitor = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {'calls': self.calls, 'wait_time': self.wait_time,
+                'readings': {label: {'value': value, 'age': now - t} for label, (value, t) in self.readings.items()}}
+
+
+## AGENT_UPDATE
+# - Added `wlm_broker`, one lock around every wavemeter DLL call and a per-label cache of the
+#   latest readings that the displays and the monitor read instead of the DLL.
+# - Reason: MonitorWavemeter polled the DLL every 100 ms, unsynchronised with the lock loop.
@@ -0,0 +1,458 @@
+"""
+Multi-process lock orchestration.
+
+Every wavemeter (or group of output devices) gets its own worker process with
+its own `Controller`, so the channels of one worker no longer share a GIL or a
+control loop with the others: a slow Toptica or DAQ call only delays the lasers
+of that worker.
+
+- Live values are published by each worker into a shared-memory table which the
+  parent reads without any IPC round trip.
+- Commands (setpoints, lock, traces, ...) travel over a `multiprocessing.Pipe`.
+- `orchestrated_controller` exposes the `Controller` surface used by
+  `modules.lock_server.web_lock`, routing each call to the worker owning the
+  channel, so the web server runs unchanged on top of several workers.
+
+Usage::
+
+    def setup_wlm1(cntrl):           # module level, must be picklable
+        wvm = WavelengthMeter()
+        cntrl.add('WMCH2', read_ch2, write_ch2, active=True, lock_type=1)
+
+    orch = orchestrator()
+    orch.add_worker('wlm1', setup_wlm1, sampling=.075)
+    orch.add_worker('wlm2', setup_wlm2, sampling=.1)
+    orch.start()
+    web_lock(controller=orchestrated_controller(orch)).run(host, port)
+"""
+
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+LIVE_FIELDS = ('time', 'value', 'error', 'output', 'piezo', 'active', 'lock', 'cycle_time', 'sink_errors', 'acquire_time')
+# keys of Controller.get() that are answered from shared memory instead of IPC
+LIVE_KEYS = ('active', 'lock')
+# Controller methods taking a channel name first, forwarded by orchestrated_controller to the owning worker
+CHANNEL_METHODS = frozenset((
+    'set', 'set_config_as_default', 'get_label', 'set_trace', 'clear_trace', 'get_trace', 'get_trace_setpoints',
+    'get_trace_last', 'lock', 'activate', 'reset', 'set_offset', 'set_pid', 'set_pid_dict', 'set_setpoint',
+    'set_limits', 'set_ramp_rate', 'set_input_range', 'set_engine', 'get_engine', 'set_wm_exposure',
+    'get_wm_exposure', 'set_wm_reading_state', 'get_wm_reading_state', 'get_acquire_time', 'get_journal',
+    'set_last_piezo_output', 'set_piezo_manual', 'enable_csv_logging', 'enable_archive', 'get_archive',
+    'get_history', 'get_rollup'))
+
+
+class live_table(object):
+    """
+    Fixed-size table of doubles in shared memory, one row per channel.
+
+    Each row starts with a sequence counter (seqlock): the single writer makes it
+    odd while updating and even afterwards, readers retry on a torn row and get
+    None if every retry saw one. Missing values are stored as NaN.
+    """
+
+    def __init__(self, max_channels: int = 16, name: Optional[str] = None) -> None:
+        self.max_channels = max_channels
+        self.row_len = 1 + len(LIVE_FIELDS)
+        size = 8 * self.row_len * max_channels
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.data = self.shm.buf.cast('d')
+        if self.owner:
+            for i in range(len(self.data)):
+                self.data[i] = math.nan
+            for row in range(max_channels):
+                self.data[row * self.row_len] = 0.
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, row: int, values: Dict[str, Any]) -> None:
+        base = row * self.row_len
+        seq = self.data[base]
+        self.data[base] = seq + 1
+        for i, field in enumerate(LIVE_FIELDS):
+            val = values.get(field)
+            self.data[base + 1 + i] = math.nan if val is None else float(val)
+        self.data[base] = seq + 2
+
+    def read(self, row: int, retries: int = 100) -> Optional[Dict[str, Any]]:
+        base = row * self.row_len
+        for _ in range(retries):
+            seq = self.data[base]
+            vals = [self.data[base + 1 + i] for i in range(len(LIVE_FIELDS))]
+            if seq == self.data[base] and int(seq) % 2 == 0:
+                return {f: (None if math.isnan(v) else v) for f, v in zip(LIVE_FIELDS, vals)}
+        return None ### still torn (e.g. the writer died mid-update): never hand out a mixed row
+
+    def close(self) -> None:
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(conn, table_name: str, max_channels: int, setup: Callable,
+                 controller_kwargs: Dict[str, Any], publish_interval: float) -> None:
+    """Entry point of a worker process: build the Controller, run it, serve commands."""
+    from .lock_controller import Controller
+
+    table = live_table(max_channels, name=table_name)
+    cntrl = Controller(**controller_kwargs)
+    try:
+        setup(cntrl)
+    except Exception as e:
+        conn.send(('error', repr(e)))
+        table.close()
+        return
+    names = cntrl.get_list()[:max_channels]
+    conn.send(('ready', names))
+
+    control = threading.Thread(target=cntrl.run, daemon=True)
+    control.start()
+
+    running = True
+
+    def publish():
+        while running:
+            for row, name in enumerate(names):
+                pid = cntrl.pid_dict.get(name)
+                if pid is None:
+                    continue
+                t, y, e, o = pid.get_trace_last()
+                table.write(row, {'time': t, 'value': y, 'error': e, 'output': o,
+                                  'piezo': cntrl.latest_piezo_values.get(name),
+                                  'active': bool(cntrl.get(name, 'active')),
+                                  'lock': bool(cntrl.get(name, 'lock')),
+                                  'cycle_time': pid.cycle_time, 'sink_errors': pid.sink_errors,
+                                  'acquire_time': cntrl.acquire.get(name, {}).get('time')})
+            time.sleep(publish_interval)
+
+    publisher = threading.Thread(target=publish, daemon=True)
+    publisher.start()
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        seq, method, args = message
+        if method == '__stop__':
+            break
+        try:
+            ret = getattr(cntrl, method)(*args)
+            conn.send((seq, True, ret, cntrl.version))
+        except Exception as e:
+            conn.send((seq, False, repr(e), cntrl.version))
+
+    running = False
+    cntrl.stop()
+    control.join(timeout=5.)
+    publisher.join(timeout=1.)
+    table.close()
+    conn.close()
+
+
+class orchestrator(object):
+    """Starts one worker process per wavemeter / device group and talks to them."""
+
+    def __init__(self, max_channels: int = 16, publish_interval: float = .05,
+                 rpc_timeout: float = 10.) -> None:
+        self.max_channels = max_channels
+        self.publish_interval = publish_interval
+        self.rpc_timeout = rpc_timeout
+        self.ctx = multiprocessing.get_context('spawn')
+        self.specs: Dict[str, Tuple[Callable, Dict[str, Any]]] = {}
+        self.workers: Dict[str, Dict[str, Any]] = {}
+        self.channels: Dict[str, Tuple[str, int]] = {}
+
+    def add_worker(self, name: str, setup: Callable, **controller_kwargs) -> None:
+        """
+        Register a worker. `setup(cntrl)` runs inside the worker process and adds
+        its channels; it must be picklable (a module-level function). Each worker
+        gets its own config file unless `file_config` is given.
+        """
+        controller_kwargs.setdefault('file_config', 'config_%s.json' % name)
+        self.specs[name] = (setup, controller_kwargs)
+
+    def start(self, timeout: float = 60.) -> None:
+        for name, (setup, kwargs) in self.specs.items():
+            if name in self.workers:
+                continue
+            table = live_table(self.max_channels)
+            parent_conn, child_conn = self.ctx.Pipe()
+            proc = self.ctx.Process(target=_worker_main, name='lock-worker-%s' % name, daemon=True,
+                                    args=(child_conn, table.name, self.max_channels, setup,
+                                          kwargs, self.publish_interval))
+            proc.start()
+            child_conn.close()
+            if not parent_conn.poll(timeout):
+                proc.terminate()
+                table.close()
+                raise TimeoutError('Worker %s did not start within %.0f s' % (name, timeout))
+            state, data = parent_conn.recv()
+            if state != 'ready':
+                proc.join(timeout=1.)
+                table.close()
+                raise RuntimeError('Worker %s failed during setup: %s' % (name, data))
+            self.workers[name] = {'process': proc, 'conn': parent_conn, 'table': table,
+                                  'mutex': threading.Lock(), 'channels': data, 'seq': 0}
+            for row, channel in enumerate(data):
+                if channel in self.channels:
+                    print('Warning: channel %s is served by more than one worker' % channel)
+                self.channels[channel] = (name, row)
+
+    def stop(self) -> None:
+        for name, w in list(self.workers.items()):
+            try:
+                with w['mutex']:
+                    w['conn'].send((0, '__stop__', ()))
+            except (OSError, BrokenPipeError):
+                pass
+            w['process'].join(timeout=10.)
+            if w['process'].is_alive():
+                w['process'].terminate()
+            w['conn'].close()
+            w['table'].close()
+        self.workers = {}
+        self.channels = {}
+
+    def call(self, worker: str, method: str, *args) -> Tuple[Any, int]:
+        """Run `Controller.<method>(*args)` in a worker, returning (result, version)."""
+        w = self.workers[worker]
+        with w['mutex']:
+            w['seq'] += 1
+            seq = w['seq']
+            w['conn'].send((seq, method, args))
+            deadline = time.monotonic() + self.rpc_timeout
+            while True:
+                if not w['conn'].poll(max(0., deadline - time.monotonic())):
+                    raise TimeoutError('Worker %s did not answer %s' % (worker, method))
+                reply, ok, ret, version = w['conn'].recv()
+                if reply == seq: ### older replies belong to calls that timed out, drop them
+                    break
+        if not ok:
+            raise RuntimeError('Worker %s: %s failed: %s' % (worker, method, ret))
+        return ret, version
+
+    def call_all(self, method: str, *args) -> Dict[str, Any]:
+        return {worker: self.call(worker, method, *args)[0] for worker in self.workers}
+
+    def owner(self, channel: str) -> Optional[str]:
+        return self.channels[channel][0] if channel in self.channels else None
+
+    def live(self, channel: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Latest values of all (or one) channels, read from shared memory; rows that stay torn are left out."""
+        names = [channel] if channel in self.channels else list(self.channels)
+        ret = {}
+        for name in names:
+            worker, row = self.channels[name]
+            values = self.workers[worker]['table'].read(row)
+            if values is not None:
+                ret[name] = values
+        return ret
+
+    def status(self) -> Dict[str, Any]:
+        """Aggregated view over all workers and their channels."""
+        workers = {}
+        for name, w in self.workers.items():
+            workers[name] = {'pid': w['process'].pid,
+                             'alive': w['process'].is_alive(),
+                             'exitcode': w['process'].exitcode,
+                             'channels': list(w['channels'])}
+        return {'host_pid': os.getpid(), 'workers': workers, 'channels': self.live()}
+
+
+class orchestrated_controller(object):
+    """
+    `Controller` facade for `web_lock(controller=...)`.
+
+    Calls whose first argument is a channel name are forwarded to the owning
+    worker, list/status/config calls are merged over all workers, and the live
+    values used by the SSE streams come from shared memory.
+    """
+
+    def __init__(self, orch: orchestrator) -> None:
+        self.orch = orch
+        self.command_timeout = orch.rpc_timeout
+        self.version = 0
+        self.runit = False
+        self._stopped = threading.Event()
+        # plain attributes read by web_lock's SSE streams
+        self.pause_event = None
+        self.LastWMValue = None
+        self.ReferenceLockState = None
+        self.slot_count = 0
+        self.__uncached = 0
+
+    def __getattr__(self, method: str):
+        ### only channel methods are forwarded, so hasattr / getattr(..., default) probes see the real surface
+        if method not in CHANNEL_METHODS:
+            raise AttributeError(method)
+
+        def forward(name=None, *args):
+            worker = self.orch.owner(name)
+            if worker is None:
+                return False
+            ret, self.version = self.orch.call(worker, method, name, *args)
+            return ret
+        return forward
+
+    # ------------------------------------------------------------------ commands
+    def request(self, method: str, *args) -> Future:
+        future = Future()
+        try:
+            ret = getattr(self, method)(*args)
+            future.set_result((ret, self.version))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, func: Callable, *args) -> Future:
+        future = Future()
+        try:
+            future.set_result((func(*args), self.version))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    # ------------------------------------------------------------------ aggregated views
+    @property
+    def state_version(self) -> int:
+        # the config lives in the workers: a new key every time, web_lock never serves it from its cache
+        self.__uncached += 1
+        return self.__uncached
+
+    def get(self, name, key):
+        if key in LIVE_KEYS and name in self.orch.channels:
+            live = self.orch.live(name)
+            if name in live: ### otherwise the row is being rewritten: ask the worker
+                return live[name][key]
+        worker = self.orch.owner(name)
+        if worker is None:
+            return 0
+        return self.orch.call(worker, 'get', name, key)[0]
+
+    def get_list(self) -> List[str]:
+        return list(self.orch.channels)
+
+    def count(self) -> int:
+        return sum(1 for v in self.orch.live().values() if v['active'])
+
+    def get_config(self) -> Dict[str, Any]:
+        cfg = {}
+        for worker_cfg in self.orch.call_all('get_config').values():
+            cfg.update(worker_cfg)
+        return cfg
+
+    def get_config_default(self) -> Dict[str, Any]:
+        cfg = {}
+        for worker_cfg in self.orch.call_all('get_config_default').values():
+            cfg.update(worker_cfg)
+        return cfg
+
+    def get_status(self, name=None) -> Dict[str, Any]:
+        live = self.orch.live(name)
+        ### same fields as Controller.get_status, from shared memory (engine needs IPC: get_engine)
+        return {n: {'active': bool(v['active']), 'lock': bool(v['lock']),
+                    'engine': None, 'cycle_time': v['cycle_time'],
+                    'sink_errors': None if v['sink_errors'] is None else int(v['sink_errors']),
+                    'acquire_time': v['acquire_time'],
+                    'worker': self.orch.owner(n)} for n, v in live.items()}
+
+    def get_stats(self, name=None) -> Dict[str, Any]:
+        worker = self.orch.owner(name)
+        if worker is not None:
+            return self.orch.call(worker, 'get_stats', name)[0]
+        stats = {}
+        for worker_stats in self.orch.call_all('get_stats').values():
+            stats.update(worker_stats)
+        return stats
+
+    def get_psd(self, name=None) -> Dict[str, Any]:
+        worker = self.orch.owner(name)
+        if worker is not None:
+            return self.orch.call(worker, 'get_psd', name)[0]
+        spectra = {}
+        for worker_spectra in self.orch.call_all('get_psd').values():
+            spectra.update(worker_spectra)
+        return spectra
+
+    def reset_stats(self, name=None) -> bool:
+        worker = self.orch.owner(name)
+        if worker is not None:
+            return self.orch.call(worker, 'reset_stats', name)[0]
+        return all(self.orch.call_all('reset_stats').values())
+
+    def get_workers(self) -> Dict[str, Any]:
+        return self.orch.status()
+
+    def get_global(self, key):
+        for worker in self.orch.workers:
+            return self.orch.call(worker, 'get_global', key)[0]
+        return 0
+
+    def set_global(self, key, value):
+        self.orch.call_all('set_global', key, value)
+
+    def set_sampling(self, sampling):
+        return all(self.orch.call_all('set_sampling', sampling).values())
+
+    @property
+    def latest_values(self) -> Dict[str, float]:
+        return {n: v['value'] for n, v in self.orch.live().items() if v['value'] is not None}
+
+    @property
+    def latest_piezo_values(self) -> Dict[str, float]:
+        return {n: v['piezo'] for n, v in self.orch.live().items() if v['piezo'] is not None}
+
+    # ------------------------------------------------------------------ lifecycle
+    def add(self, *args, **kwargs):
+        print('Channels of an orchestrated controller are added by the worker setup functions')
+        return False
+
+    def remove(self, name):
+        print('Channels of an orchestrated controller are removed by the worker setup functions')
+        return False
+
+    def pause(self):
+        self.orch.call_all('pause')
+
+    def resume(self):
+        self.orch.call_all('resume')
+
+    def run(self):
+        # web_lock runs the controller in a thread; the workers run on their own
+        self.runit = True
+        if not self.orch.workers:
+            self.orch.start()
+        self._stopped.wait()
+
+    def stop(self):
+        self.runit = False
+        self.orch.stop()
+        self._stopped.set()
+
+
+## AGENT_UPDATE
+# - Added `orchestrator` (one spawned worker process per WLM / device group, commands over a
+#   Pipe, live values in a seqlock-protected shared-memory table) and `orchestrated_controller`,
+#   a Controller facade so `web_lock(controller=...)` serves several workers unchanged.
+# - Reason: channels of different wavemeters no longer share one GIL / control loop.
+# - `live_table.read` returns None instead of a torn row once its retries are used up;
+#   `orchestrator.live` leaves such channels out.
+# - The workers publish sink_errors and acquire_time in the live table, so the facade's
+#   get_status has the fields of Controller.get_status.
@@ -1,7 +1,5 @@
 import psutil
 import time
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
 
 class PC_health:
     def __init__(self, adr=0, **kwargs):
@@ -10,7 +8,7 @@ class PC_health:
         self.prev_time = time.time()
 
     def get_cpu(self):
-        return psutil.cpu_percent(interval=1)
+        return psutil.cpu_percent(interval=None) ### since the previous call, interval=1 blocked the caller for 1 s
 
     def get_ram(self):
         return psutil.virtual_memory().percent
@@ -40,26 +38,18 @@ class PC_health:
         self.prev_time = current_time
         return download_speed
 
-def data2db(paras, data):
-    bucket = "server"
-    client = InfluxDBClient(url="http://10.5.78.176:8086", token="dZhmHd0XDDsWPNwZDPe17vZYBZrHy2hkivLdUfcYXP1G8FaNR2oLDQCaDgruFmCsTTvC3sgJC6K-JlF637azuA==", org="BaLi")
-    write_api = client.write_api(write_options=SYNCHRONOUS)
-    query_api = client.query_api()
-    p = Point("server_status").tag("server", "hf_wavemeter_server").field(paras, data)
-    write_api.write(bucket=bucket, record=p)
-    client.close()
-    
-    
-run = True
-dev = PC_health()
-
-while run:
+if __name__ == '__main__': ### importing the module no longer starts the loop
+    try:
+        from modules.lock_health import health_sampler, telemetry_writer, influx_sink
+    except ImportError: ### started as modules/pc_health.py
+        from lock_health import health_sampler, telemetry_writer, influx_sink
+    writer = telemetry_writer(influx_sink(url="http://10.5.78.176:8086", token="dZhmHd0XDDsWPNwZDPe17vZYBZrHy2hkivLdUfcYXP1G8FaNR2oLDQCaDgruFmCsTTvC3sgJC6K-JlF637azuA==",
+                                          org="BaLi", bucket="server", tags={"server": "hf_wavemeter_server"}))
+    ### every sample goes to the writer (one request per batch), a failed sample is reported and skipped
+    sampler = health_sampler(period=1., writer=writer)
+    sampler.start()
     try:
-        data2db("cpu", dev.get_cpu())
-        data2db("ram", dev.get_ram())
-        data2db("disk", dev.get_disk())
-        data2db("upload", dev.get_upload_speed())
-        data2db("download", dev.get_download_speed())
-        time.sleep(1)
-    except:
-        pass
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        sampler.stop()
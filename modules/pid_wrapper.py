@@ -4,6 +4,7 @@
 from .PID import PID
 import collections
 import time
+from threading import Lock
 
 class logger(object):
     def __init__(self, tracelen):
@@ -38,6 +39,8 @@ class pid_container(object):
         self.last_out = None
         self.lock = lock
         self.unlock_set_offset = unlock_set_offset
+        # per-channel lock: guards PID state and traces, never held during hardware I/O
+        self.mutex = Lock()
         
         self.pid = PID(Kp=P, Ki=I, Kd=D, 
                        setpoint=setpoint, 
@@ -61,55 +64,95 @@ class pid_container(object):
         self._last_ramp_time = None
         self._last_ramp_output = None
         ##############################
+
+        ########## readout engines, switchable at runtime
+        self.readers = {'legacy': func_read}
+        self.engine = 'legacy'
+        self.cycle_time = None
+        self.write_time = None ### s spent in func_write during the last __call__, None without a write
+        ##############################
+
+        ########## ingest sinks, called with (time, input, error, output, lock) after every sample
+        self.sinks = ()
+        self.sink_errors = 0 ### failed sink calls, a failing sink never stops the lock
+        self.resumed = False ### PID state restored from the journal, used by the next set_lock(True)
+        ##############################
         
     def reset(self):
-        self.pid._integral = 0
+        with self.mutex:
+            self.pid._integral = 0
         
     def clear_trace(self):
-        self.times.clear()
-        self.trace.clear()
-        self.error.clear()
-        self.outpt.clear()
-        self.setpoints.clear()
+        with self.mutex:
+            self.times.clear()
+            self.trace.clear()
+            self.error.clear()
+            self.outpt.clear()
+            self.setpoints.clear()
         
     def set_trace(self, tracelen):
-        self.times.setup(tracelen)
-        self.trace.setup(tracelen)
-        self.error.setup(tracelen)
-        self.outpt.setup(tracelen)
-        self.setpoints.setup(tracelen)
+        with self.mutex:
+            self.times.setup(tracelen)
+            self.trace.setup(tracelen)
+            self.error.setup(tracelen)
+            self.outpt.setup(tracelen)
+            self.setpoints.setup(tracelen)
         
     def set_offset(self, offset):
-        self.pid.offset = offset
+        with self.mutex:
+            self.pid.offset = offset
 
     def get_offset(self):
         return self.pid.offset
         
     def set_setpoint(self, sp):
-        self.pid.setpoint = sp
+        with self.mutex:
+            self.pid.setpoint = sp
         
     def set_limits(self, limits):
-        return self.pid.set_limits(limits)
+        with self.mutex:
+            return self.pid.set_limits(limits)
 
     def set_ramp_rate(self, ramp_rate):
-        self.ramp_rate = None if (ramp_rate is None or ramp_rate == 0) else float(ramp_rate)
+        with self.mutex:
+            self.ramp_rate = None if (ramp_rate is None or ramp_rate == 0) else float(ramp_rate)
         return self.ramp_rate
         
+    def add_engine(self, engine, func_read):
+        self.readers[engine] = func_read
+
+    def set_engine(self, engine):
+        if engine not in self.readers:
+            return False
+        self.func_read = self.readers[engine]
+        self.engine = engine
+        return True
+
+    def add_sink(self, func):
+        self.sinks = self.sinks + (func,) ### copy-on-write, __call__ iterates without the lock
+
+    def remove_sink(self, func):
+        self.sinks = tuple(f for f in self.sinks if f is not func)
+
     def set_pid(self, kp, ki, kd):
-        self.pid.tunings = (kp,ki,kd)
+        with self.mutex:
+            self.pid.tunings = (kp,ki,kd)
     
     def get_trace(self):
-        return self.times.get(), self.trace.get(), self.error.get(), self.outpt.get()
+        with self.mutex:
+            return self.times.get(), self.trace.get(), self.error.get(), self.outpt.get()
     def get_trace_setpoints(self):
-        return self.times.get(), self.setpoints.get()
+        with self.mutex:
+            return self.times.get(), self.setpoints.get()
         
     def get_trace_last(self):
         t = None; y = None; e = None; o = None;
-        if self.times.size()>0:
-            t = self.times.get_item(-1)
-            y = self.trace.get_item(-1)
-            e = self.error.get_item(-1)
-            o = self.outpt.get_item(-1)
+        with self.mutex:
+            if self.times.size()>0:
+                t = self.times.get_item(-1)
+                y = self.trace.get_item(-1)
+                e = self.error.get_item(-1)
+                o = self.outpt.get_item(-1)
         return t,y,e,o
         
     def set_lock(self, state):
@@ -118,7 +161,20 @@ class pid_container(object):
             if self.last_out is not None:
                 self.set_offset(self.last_out)
         '''
-        self.lock = state
+        with self.mutex:
+            if state and not self.lock and self.resumed:
+                ### integrator / last input restored from the journal: restart the clock, keep the state
+                integral, last_input = self.pid._integral, self.pid._last_input
+                self.pid.auto_mode = False
+                self.pid.set_auto_mode(True, integral)
+                self.pid._last_input = last_input
+            elif state and not self.lock and self.last_out is not None:
+                ### bumpless: seed the integrator so the first output continues from the current one
+                self.pid.auto_mode = False
+                self.pid.set_auto_mode(True, self.last_out - (self.pid.offset or 0))
+            if state:
+                self.resumed = False
+            self.lock = state
     
     def __measure(self):
         val = self.func_read()
@@ -127,7 +183,9 @@ class pid_container(object):
     
     def __output(self, value): ################## communication with output device        
         if callable(self.func_write):
+            t_start = time.perf_counter()
             self.last_out = self.func_write(value, self.last_out)
+            self.write_time = time.perf_counter() - t_start
 
     def __apply_ramp(self, target_value):
         if self.ramp_rate is None:
@@ -157,27 +215,42 @@ class pid_container(object):
         return new_output
     
     def __call__(self):
+        t_start = time.perf_counter()
+        self.write_time = None
         now, value_in = self.__measure()
         ########################################### if locked, give output to the laser controller
-        if self.lock:
-            if value_in > 0: ### if under/overexposed Wm gives out negative values
-                value_pid = self.pid(value_in)
-                #print("Output Without Ramp:  ", value_pid)
-                value_pid = self.__apply_ramp(value_pid)
-                #print("Output With Ramp:  ", value_pid)
-                self.__output(value_pid)
-                #print("locked", "ValuePID Output:", value_pid)
-        ############################################# if unlocked
-        elif self.unlock_set_offset:
-            self.__output(self.get_offset())
-            #print("unlocked")
-        value_out = self.last_out
-        value_err = value_in-self.pid.setpoint
-        self.times.append(now)
-        self.trace.append(value_in)
-        self.error.append(value_err)
-        self.outpt.append(value_out)
-        self.setpoints.append(self.pid.setpoint)
+        value_pid = None
+        with self.mutex:
+            if self.lock:
+                if value_in > 0: ### if under/overexposed Wm gives out negative values
+                    value_pid = self.pid(value_in)
+                    #print("Output Without Ramp:  ", value_pid)
+                    value_pid = self.__apply_ramp(value_pid)
+                    #print("Output With Ramp:  ", value_pid)
+            ############################################# if unlocked
+            elif self.unlock_set_offset:
+                value_pid = self.pid.offset
+        if value_pid is not None:
+            self.__output(value_pid) ### hardware I/O outside of the channel lock
+            #print("locked", "ValuePID Output:", value_pid)
+        with self.mutex:
+            value_out = self.last_out
+            setpoint = self.pid.setpoint
+            value_err = value_in-setpoint
+            self.times.append(now)
+            self.trace.append(value_in)
+            self.error.append(value_err)
+            self.outpt.append(value_out)
+            self.setpoints.append(setpoint)
+            locked = self.lock
+        for sink in self.sinks:
+            try:
+                sink(now, value_in, value_err, value_out, locked)
+            except Exception as e:
+                self.sink_errors += 1
+                if self.sink_errors == 1:
+                    print("Sink", sink, "failed:", e)
+        self.cycle_time = time.perf_counter() - t_start
         ##### test pid output
         #value_pid = self.pid(value_in)
         #print("Value PID: (Output):   ",value_pid)
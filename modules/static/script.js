@@ -227,6 +227,7 @@ function update_selection() {
             set_doc("par_upper", response.data.limits[1]);
             set_doc("WM_Exposure", response.data.WM_Exposure);
             set_doc_text("WM_Reading_State", response.data.WM_Reading_State)
+            document.getElementById("par_engine").value = response.data.engine || "legacy";
             update_element_indicators(true, name, response.data.active, response.data.lock);
         });
 }
@@ -239,6 +240,9 @@ function update_indicator() {
             for (const key in response.data) {
                 const value = response.data[key];
                 update_element_indicators((key==name), key, value.active, value.lock);
+                if (key==name) {
+                    set_doc_text("cycle_time", (value.cycle_time != null) ? (value.cycle_time*1e3).toFixed(1)+" ms" : "");
+                }
             }
         });
 }
@@ -280,6 +284,18 @@ function write_parameter() {
         });
 }
 
+function set_engine() {
+    var name = elem_select.value;
+    var engine = document.getElementById("par_engine").value;
+    ajax_request("POST", "/post/engine", {"name":name, "data":engine},
+        function(response){
+            set_status(response.status);
+            if (response.data.engine) {
+                document.getElementById("par_engine").value = response.data.engine;
+            }
+        });
+}
+
 function manual_set_piezo() {
     const name = elem_select.value;  // aktuell ausgewählter Kanal
     const value = parseFloat(document.getElementById("Set_Piezo").value);
@@ -315,11 +331,12 @@ let wmInitialized = false;  // Status-Flag
 
 function wmToggle() {
     if (!wmInitialized) {
-        // Initialize
+        // Initialize: reference check, runs on the controller scheduler
         $.post('/post/wm_initialize', {}, function(response) {
             if (response.status) {
                 wmInitialized = true;
                 $('#wm_button').text('Abort Calibration');
+                wmWatch();
             } else {
                 alert('Initialization failed: ' + JSON.stringify(response.data));
             }
@@ -337,10 +354,40 @@ function wmToggle() {
     }
 }
 
+function wmWatch() {
+    // the check finishes on its own, poll until the scheduler is done with it
+    ajax_request("GET", "/get/wm_calibration", null, function(response) {
+        if (!response.status) { // no scheduler, nothing will ever finish
+            wmInitialized = false;
+            $('#wm_button').text('WM Initialize Calibration');
+            alert('WM reference check: ' + JSON.stringify(response.data));
+            return;
+        }
+        if (response.data.state != 'idle') {
+            setTimeout(wmWatch, 500);
+            return;
+        }
+        wmInitialized = false;
+        $('#wm_button').text('WM Initialize Calibration');
+        var result = response.data.last_result;
+        if (result && result.result != 'aborted') {
+            alert('WM reference check: ' + result.result + (response.data.error ? ' (' + response.data.error + ')' : ''));
+        }
+    });
+}
+
 function wmCalibrate() {
     fetch('/post/wm_calibrate', { method: 'POST' })
         .then(resp => resp.json())
-        .then(data => alert(JSON.stringify(data)));
+        .then(function(data) {
+            if (!data.status) {
+                alert(JSON.stringify(data));
+                return;
+            }
+            wmInitialized = true;
+            $('#wm_button').text('Abort Calibration');
+            wmWatch();
+        });
 }
 
 
@@ -370,6 +417,43 @@ function plot_timer(){
     }
 }
 
+// One multiplexed stream from the push server; messages only carry the fields that changed
+var liveState = {};
+function startLiveSSE() {
+    var source = new EventSource(streamUrl("/stream/live?fields=value,piezo,active,reference_lock_state&rate=20"),
+                                 {withCredentials: true});
+    source.onopen = function() {
+        liveState = {};  // every (re)connect starts with the full state
+    };
+    source.onmessage = function(event) {
+        try {
+            const delta = JSON.parse(event.data);
+            for (const [name, fields] of Object.entries(delta)) {
+                if (fields === null) {
+                    delete liveState[name];
+                } else {
+                    liveState[name] = Object.assign(liveState[name] || {}, fields);
+                }
+            }
+            const data = {active_values: {}, piezo_values: {}};
+            for (const [name, row] of Object.entries(liveState)) {
+                if (name === ".") continue;
+                if (row.active && row.value !== undefined) data.active_values[name] = row.value;
+                if (row.piezo !== undefined && row.piezo !== null) data.piezo_values[name] = row.piezo;
+            }
+            data.reference_lock_state = (liveState["."] || {}).reference_lock_state;
+            data.freq_650_value = (liveState["650 nm"] || {}).value;
+            updateChannelTable(data);
+            updateReferenceLockState(data.reference_lock_state);
+        } catch (err) {
+            console.error("Fehler beim Parsen der Live-Daten:", err, event.data);
+        }
+    };
+    source.onerror = function(err) {
+        console.error("Live-SSE-Connection Error:", err);
+    };
+}
+
 function updateChannelTable(data) {
     const tbody = document.querySelector("#channel_table tbody");
     tbody.innerHTML = ""; // alte Zeilen löschen
@@ -447,9 +531,18 @@ function toggle_logging() {
     });
 }
 
+// Live streams come from the push server when the page was given its address
+function streamUrl(path) {
+    return (window.PUSH_URL || "") + path;
+}
+
 function startSSE() {
+    if (window.PUSH_URL) {
+        startLiveSSE();
+        return;
+    }
     if (!!window.EventSource) {
-        var source = new EventSource("/stream/values");
+        var source = new EventSource(streamUrl("/stream/values"), {withCredentials: !!window.PUSH_URL});
         source.onmessage = function(event) {
             try {
                 const data = JSON.parse(event.data);
@@ -530,7 +623,7 @@ function updateDigitDisplay(value){
 // Startet SSE-Stream und aktualisiert das DigitDisplay
 function startDigitSSE() {
     if (!!window.EventSource) {
-        var source = new EventSource("/stream/digit");
+        var source = new EventSource(streamUrl("/stream/digit"), {withCredentials: !!window.PUSH_URL});
         source.onmessage = function(event) {
             try {
                 const data = JSON.parse(event.data); // Erwartet Zahl
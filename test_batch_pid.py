@@ -0,0 +1,119 @@
+"""
+Equivalence tests for `modules.batch_pid.BatchPID` against the scalar `modules.PID.PID`.
+
+Both controllers are driven with the same inputs and the same (fake) clock;
+the batch engine must reproduce the scalar outputs bit for bit.
+"""
+
+from __future__ import annotations
+
+import random
+from unittest import mock
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modules.PID import PID
+from modules.batch_pid import BatchPID
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+CHANNELS = [
+    dict(Kp=0.5, Ki=2.0, Kd=0.01, setpoint=461.3, offset=1.0, output_limits=(0.0, 5.0)),
+    dict(Kp=-3.0, Ki=-40.0, Kd=0.0, setpoint=607.4, offset=None, output_limits=(None, 2.0)),
+    dict(Kp=1.0, Ki=0.5, Kd=0.2, setpoint=0.0, offset=0.0, output_limits=(None, None),
+         proportional_on_measurement=True),
+    dict(Kp=10.0, Ki=100.0, Kd=0.0, setpoint=1.0, offset=0.5, output_limits=(-1.0, 1.0)),
+]
+
+
+def _make(clock, sample_time=None):
+    with mock.patch("modules.PID._current_time", clock):
+        scalars = [PID(sample_time=sample_time, **cfg) for cfg in CHANNELS]
+    batch = BatchPID(sample_time=sample_time)
+    for cfg in CHANNELS:
+        batch.add(now=clock.now, **cfg)
+    return scalars, batch
+
+
+def test_batch_matches_scalar_pid_over_random_sequence():
+    """Every step of BatchPID must equal the scalar PID for all channels."""
+    rng = random.Random(4)
+    clock = FakeClock()
+    scalars, batch = _make(clock)
+
+    with mock.patch("modules.PID._current_time", clock):
+        for step in range(200):
+            clock.now += rng.choice([0.0, 0.01, 0.075, 0.3])
+            inputs = [cfg["setpoint"] + rng.gauss(0.0, 0.05) for cfg in CHANNELS]
+            expected = [pid(x) for pid, x in zip(scalars, inputs)]
+            got = batch(inputs, now=clock.now)
+            assert list(got) == expected
+            for i, pid in enumerate(scalars):
+                assert batch.components(i) == pid.components
+
+
+def test_batch_updates_only_selected_channels_and_respects_manual_mode():
+    """Subsets update independently; channels in manual mode keep their last output."""
+    clock = FakeClock()
+    scalars, batch = _make(clock)
+
+    with mock.patch("modules.PID._current_time", clock):
+        scalars[1].set_auto_mode(False)
+        batch.set_auto_mode(1, False)
+        for step in range(20):
+            clock.now += 0.05
+            subset = [0, 1] if step % 2 else [1, 3]
+            inputs = [CHANNELS[i]["setpoint"] + 0.01 * step for i in subset]
+            expected = [scalars[i](x) for i, x in zip(subset, inputs)]
+            got = batch(inputs, index=subset, now=clock.now)
+            assert [None if np.isnan(v) else v for v in got] == expected
+
+        scalars[1].set_auto_mode(True, last_output=1.5)
+        batch.set_auto_mode(1, True, last_output=1.5, now=clock.now)
+        clock.now += 0.05
+        assert batch(607.0, index=1, now=clock.now)[0] == scalars[1](607.0)
+
+
+def test_batch_limits_and_sample_time_gating():
+    """set_limits clamps the integrator like PID.set_limits; sample_time holds outputs."""
+    clock = FakeClock()
+    scalars, batch = _make(clock, sample_time=0.1)
+
+    with mock.patch("modules.PID._current_time", clock):
+        for dt in [0.2, 0.05, 0.05, 0.2, 0.01]:
+            clock.now += dt
+            inputs = [cfg["setpoint"] - 0.3 for cfg in CHANNELS]
+            assert list(batch(inputs, now=clock.now)) == [p(x) for p, x in zip(scalars, inputs)]
+
+        assert batch.set_limits(0, (5.0, 1.0)) is False
+        assert scalars[0].set_limits((0.0, 0.1)) is True
+        assert batch.set_limits(0, (0.0, 0.1)) is True
+        assert batch.components(0) == scalars[0].components
+
+
+def test_apply_ramp_limits_slew_rate():
+    """The ramp stage moves at most ramp_rate * dt towards the target."""
+    batch = BatchPID()
+    batch.add(ramp_rate=2.0, now=0.0)
+    batch.add(now=0.0)  # no ramp
+
+    assert list(batch.apply_ramp([1.0, 1.0], now=0.0)) == [1.0, 1.0]
+    out = batch.apply_ramp([3.0, 3.0], now=0.5)
+    assert list(out) == [2.0, 3.0]
+    # Zero time step holds the previous ramp output.
+    assert list(batch.apply_ramp([0.0, 0.0], now=0.5)) == [2.0, 0.0]
+    assert list(batch.apply_ramp([2.5, 0.0], now=1.0)) == [2.5, 0.0]
+
+
+## AGENT_UPDATE
+# - Added equivalence tests pinning `BatchPID` to the scalar `PID` (anti-windup, offset,
+#   proportional-on-measurement, manual mode, sample_time) and to the pid_container ramp.
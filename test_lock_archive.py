@@ -0,0 +1,94 @@
+"""
+Tests for the chunked trace archive in `modules.lock_archive`.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modules.lock_archive import COLUMNS, convert_csv, lock_archive
+
+
+def _rows(t):
+    return np.column_stack([t] + [np.full_like(t, i) for i in range(1, len(COLUMNS) - 1)] + [np.sin(t)])
+
+
+def test_range_query_reads_only_overlapping_chunks(tmp_path, monkeypatch):
+    archive = lock_archive(str(tmp_path), chunk_seconds=100)
+    t = np.arange(0, 1000, 0.5)
+    archive.extend("WMCH2", _rows(t[:1000]))
+    for row in _rows(t[1000:]):
+        archive.append("WMCH2", row)
+    archive.close()
+
+    with open(tmp_path / "WMCH2" / "index.json") as f:
+        assert len(json.load(f)["chunks"]) == 10
+
+    opened = []
+    real_load = np.load
+    monkeypatch.setattr(np, "load", lambda f, *a, **k: opened.append(os.path.basename(f)) or real_load(f, *a, **k))
+    data = lock_archive(str(tmp_path)).read("WMCH2", 250.0, 420.0, ["output"])
+    assert len(opened) == 3
+    assert data["time"][0] == 250.0 and data["time"][-1] == 420.0
+    assert np.allclose(data["output"], np.sin(data["time"]))
+
+
+def test_reopened_chunk_is_merged_and_unflushed_samples_are_readable(tmp_path):
+    archive = lock_archive(str(tmp_path))
+    archive.extend("WMCH2", _rows(np.array([7200.0, 7201.0])))
+    archive.close()
+
+    archive = lock_archive(str(tmp_path))
+    archive.append("WMCH2", _rows(np.array([7202.0]))[0])
+    assert archive.read("WMCH2")["time"].tolist() == [7200.0, 7201.0, 7202.0]
+    archive.close()
+    assert lock_archive(str(tmp_path)).read("WMCH2", columns=["time"])["time"].tolist() == [7200.0, 7201.0, 7202.0]
+
+
+def test_convert_csv(tmp_path):
+    csv_file = tmp_path / "data_WMCH3.csv"
+    csv_file.write_text(
+        "datetime,time_trace_last,setpoint,P,I,D,WM_Exposure,PID Input,Error,PID Output\n"
+        "2025-03-01 14:00:00,1740837600.1,461.3,10,100,0,2,461.30001,1e-05,0.5\n"
+        "2025-03-01 14:00:00,1740837600.2,461.3,10,100,0,2,-3,-461.3,None\n"
+    )
+    assert convert_csv(str(csv_file), str(tmp_path / "archive")) == 2
+    data = lock_archive(str(tmp_path / "archive")).read("WMCH3")
+    assert data["input"].tolist() == [461.30001, -3.0]
+    assert np.isnan(data["output"][1])
+
+
+def test_parameters_and_error_roundtrip_and_flushes_only_append(tmp_path):
+    archive = lock_archive(str(tmp_path), chunk_seconds=100)
+    t = np.arange(0, 10, 0.5)
+    rows = _rows(t)
+    rows[:, COLUMNS.index("setpoint")] = np.where(t < 5, 461.3, 461.4)
+    rows[:, COLUMNS.index("input")] = 461.3 + 1e-6*np.cos(t)
+    rows[:, COLUMNS.index("error")] = rows[:, COLUMNS.index("input")] - rows[:, COLUMNS.index("setpoint")]
+    rows[3, COLUMNS.index("error")] = 0.125  # not input - setpoint: kept as it is
+    archive.extend("WMCH2", rows[:10])
+    archive.flush()
+    first = sorted(os.listdir(tmp_path / "WMCH2"))
+    mtimes = {f: os.path.getmtime(tmp_path / "WMCH2" / f) for f in first if f.endswith(".npz")}
+    archive.extend("WMCH2", rows[10:])
+    archive.flush()
+    assert all(os.path.getmtime(tmp_path / "WMCH2" / f) == m for f, m in mtimes.items())  # not rewritten
+    assert len([f for f in os.listdir(tmp_path / "WMCH2") if f.endswith(".npz")]) == 2
+    archive.close()
+    assert len([f for f in os.listdir(tmp_path / "WMCH2") if f.endswith(".npz")]) == 1  # merged
+    data = lock_archive(str(tmp_path)).read("WMCH2")
+    for i, c in enumerate(COLUMNS):
+        if c == "output":
+            assert np.allclose(data[c], rows[:, i])
+        else:
+            assert data[c].tolist() == rows[:, i].tolist()
+
+
+## AGENT_UPDATE
+# - Added tests for chunked range reads, reopening an hour chunk after a restart and the CSV converter.
+# - Added a round-trip test of the compact layout and of append-only flushes.
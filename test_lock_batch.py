@@ -0,0 +1,54 @@
+"""
+Tests for `/post/batch` of `modules.lock_server.web_lock`.
+
+The wavemeter DLL is replaced by a stub and the Flask test client is used,
+so no lab hardware or network server is needed.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+
+@pytest.fixture
+def server(make_server):
+    return make_server(channels=('A', 'B'))
+
+
+def test_batch_applies_writes_together_with_one_save(server, monkeypatch):
+    lck, tc = server
+    saves = []
+    save_config = lck.cntrl.save_config
+    monkeypatch.setattr(lck.cntrl, 'save_config', lambda *args: saves.append(1) or save_config(*args))
+    ops = [{'path': 'get/parameter', 'data': {'name': 'A'}},
+           {'path': 'post/setpoint', 'data': {'name': 'A', 'data': 461.1}},
+           {'path': 'post/setpoint', 'data': {'name': 'B', 'data': 461.2}},
+           {'path': 'post/pid', 'data': {'name': 'B', 'data': {'P': 1, 'I': 2, 'D': 0}}},
+           {'path': 'post/limits', 'data': {'name': 'C', 'data': [0, 1]}}]
+    ret = tc.post('/post/batch', json={'ops': ops}).get_json()
+    param, set_a, set_b, pid_b, missing = ret['data']
+    assert ret['status'] is False  # channel C does not exist
+    assert missing['status'] is False
+    assert set_a['status'] and set_b['status'] and pid_b['status']
+    assert set_a['data']['version'] == set_b['data']['version'] == pid_b['data']['version']
+    assert param['data']['setpoint'] == 461.1  # reads see the state after the batch
+    assert lck.cntrl.get('B', 'setpoint') == 461.2 and lck.cntrl.get('B', 'I') == 2
+    assert len(saves) == 1
+
+
+def test_batch_with_unknown_path_is_rejected(server):
+    lck, tc = server
+    ops = [{'path': 'post/setpoint', 'data': {'name': 'A', 'data': 461.1}},
+           {'path': '/post/batch', 'data': {'ops': []}},
+           {'path': 'get/nope', 'data': {}}]
+    ret = tc.post('/post/batch', json={'ops': ops}).get_json()
+    assert ret['status'] is False
+    assert [r['status'] for r in ret['data']] == [False, False, False]
+    assert 'unknown path' in ret['data'][2]['data']['error']
+    assert lck.cntrl.get('A', 'setpoint') == 0
+
+
+def test_batch_rejects_missing_ops(server):
+    _, tc = server
+    ret = tc.post('/post/batch', json={}).get_json()
+    assert ret['status'] is False
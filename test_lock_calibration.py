@@ -0,0 +1,169 @@
+"""
+Tests for the WLM reference check / calibration slot in `modules.lock_calibration`.
+
+A fake wavemeter stands in for the DLL, the slot is stepped by hand or by the
+controller thread.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from modules.lock_calibration import calibration_slot, reference_slot
+from modules.lock_controller import Controller
+
+REFERENCE = 461.312470
+
+
+class fake_wvm(object):
+    def __init__(self, reference=REFERENCE):
+        self.reference = reference
+        self.port = (1, 1)
+        self.calibrations = 0
+        self.log = []
+        self.stuck = False  # ignores the switch back to the lock port
+
+    def SetActiveChannel(self, channel=1, port=1):
+        if not (self.stuck and (channel, port) == (1, 1)):
+            self.port = (channel, port)
+        self.log.append((channel, port))
+
+    def GetActiveChannel(self):
+        return self.port
+
+    def SetExposureMode(self, b):
+        pass
+
+    def GetFrequency2(self):
+        return self.reference if self.port == (2, 1) else 0.
+
+    def Calibration(self, Type, unit, value, channel):
+        self.calibrations += 1
+        self.reference = value
+
+
+def _slot(wvm, **kwargs):
+    return calibration_slot(wvm, reference_frequency=REFERENCE, settle=0., timeout=0.05, poll=0.001, **kwargs)
+
+
+def test_calibrates_only_on_deviation():
+    wvm = fake_wvm()
+    slot = _slot(wvm)
+    assert slot.start()
+    slot.step()
+    assert not slot.pending() and slot.last_result['result'] == 'in_lock'
+    assert wvm.calibrations == 0 and wvm.port == (1, 1)
+
+    wvm.reference = REFERENCE + 1e-5
+    slot.start()
+    states = []
+    while slot.pending():
+        slot.step()
+        states.append(slot.state)
+        assert wvm.port == (1, 1)  # every step returns the WLM to the lock port
+    assert states == ['calibrate', 'verify', 'idle']
+    assert wvm.calibrations == 1 and slot.last_result['result'] == 'calibrated'
+
+
+def test_gives_up_without_reference_light():
+    wvm = fake_wvm(reference=-3.)  # underexposed
+    results = []
+    slot = _slot(wvm, retries=2, on_result=results.append)
+    slot.start(force=True)
+    for _ in range(3):
+        slot.step()
+    assert [r['result'] for r in results] == ['failed']
+    assert slot.start(force=True)
+    assert slot.abort() and not slot.pending()
+    assert [r['result'] for r in results] == ['failed', 'aborted']
+
+
+def test_step_fails_when_the_wlm_stays_on_the_reference_port():
+    wvm = fake_wvm()
+    wvm.stuck = True
+    slot = _slot(wvm, retries=0)
+    slot.start()
+    slot.step()
+    assert slot.last_result['result'] == 'failed' and 'lock port' in slot.error
+    wvm.stuck = False
+    slot.start()
+    slot.step()
+    assert slot.last_result['result'] == 'in_lock' and wvm.port == (1, 1)
+
+
+def test_calibration_endpoints_fail_without_a_scheduler(facade_server):
+    lck, tc = facade_server
+    for method, path in (('post', '/post/wm_initialize'), ('post', '/post/wm_calibrate'),
+                         ('post', '/post/wm_abort'), ('get', '/get/wm_calibration')):
+        data = getattr(tc, method)(path).get_json()
+        assert data['status'] is False and 'scheduler' in data['data']['error']
+    assert lck.calibration is None  # no calibration slot without a wavemeter in this process
+
+
+def test_reference_is_sampled_every_period_and_calibrated_on_drift():
+    wvm = fake_wvm()
+    cal = _slot(wvm)
+    clock = [0.]
+    states = []
+    ref = reference_slot(cal, period=10., max_duty=1., drift_samples=2, clock=lambda: clock[0],
+                         on_sample=lambda s: states.append(s['in_lock']))
+
+    def cycle():  # what Controller.run does once per cycle, 2.5 s apart
+        for slot in (cal, ref):
+            if slot.pending():
+                slot.step()
+        clock[0] += 2.5
+    for _ in range(8):
+        cycle()
+    assert states == [True, True]
+    wvm.reference = REFERENCE + 1e-5
+    for _ in range(5):
+        cycle()
+    assert states == [True, True, False, False]
+    assert cal.running() and ref.drift == 0
+    for _ in range(3):  # calibrate and verify, the monitor waits meanwhile
+        cycle()
+    assert wvm.calibrations == 1 and cal.last_result['result'] == 'calibrated'
+    assert ref.get_trace()['in_lock'] == [True, True, False, False]
+
+
+def test_reference_visits_keep_below_the_duty_cycle():
+    clock = [0.]
+
+    class slow_wvm(fake_wvm):
+        def GetFrequency2(self):  # a visit takes 0.25 s
+            clock[0] += 0.25
+            return super().GetFrequency2()
+    ref = reference_slot(_slot(slow_wvm()), period=1., max_duty=0.05, clock=lambda: clock[0])
+    samples = 0
+    for _ in range(100):  # 100 s of 1 s cycles
+        if ref.pending():
+            ref.step()
+            samples += 1
+        clock[0] += 1.
+    assert samples == 20  # 0.25 s / 0.05 stretches the 1 s period to 5 s
+    assert ref.status()['duty'] <= 0.05 and ref.status()['last_cost'] == 0.25
+
+
+def test_steps_interleave_with_the_channels(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cntrl = Controller(sampling=0.02, file_config=str(tmp_path / 'config.json'))
+    wvm = fake_wvm(reference=REFERENCE + 1e-5)
+    reads = []
+    cntrl.add('A', lambda: reads.append(wvm.port) or 461.3, lambda v, l: v, active=True, lock_type=1, tracelen=10)
+    slot = _slot(wvm)
+    cntrl.add_slot(slot)
+    thread = threading.Thread(target=cntrl.run, daemon=True)
+    thread.start()
+    try:
+        slot.start()
+        t_end = time.time() + 5.
+        while slot.pending() and time.time() < t_end:
+            time.sleep(0.01)
+        assert slot.last_result['result'] == 'calibrated'
+        assert (2, 1) not in reads  # channels never read the reference port
+        assert len(reads) >= 3      # one channel sample between the steps
+    finally:
+        cntrl.stop()
+        thread.join()
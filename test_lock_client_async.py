@@ -0,0 +1,52 @@
+"""
+Tests for `modules.lock_client_async.async_lock_client` against a local waitress server.
+
+The wavemeter DLL is replaced by a stub; the channel is simulated.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+from waitress import create_server
+
+import modules.lock_server as lock_server
+from modules.lock_client_async import async_lock_client
+
+
+@pytest.fixture
+def port(make_server):
+    lck, _ = make_server(channels=('A', 'B'), sampling=0.01)
+    server = create_server(lck.flsk, host='127.0.0.1', port=0, threads=4)
+    threading.Thread(target=server.run, daemon=True).start()
+    return int(server.effective_port)
+
+
+def test_gather_set_get_and_stream(port):
+    async def run():
+        async with async_lock_client(port=port, password=lock_server.PASSWORD, pool_size=2) as c:
+            ret = await c.set_channels('setpoint', {'A': 461.1, 'B': 461.2})
+            assert all(stat for stat, _ in ret.values())
+            params = await c.get_channels('parameter', ['A', 'B'])
+            assert params['A'][1]['setpoint'] == 461.1 and params['B'][1]['setpoint'] == 461.2
+            assert (await c.get_status('A'))[0] is True
+            stream = c.sse_piezo_values()
+            event = await asyncio.wait_for(stream.__anext__(), 5.)
+            await stream.aclose()
+            assert isinstance(event, dict)
+            return len(c.pool.idle)
+
+    assert asyncio.run(run()) <= 2
+
+
+def test_requests_without_login_fail(port):
+    async def run():
+        c = async_lock_client(port=port)
+        try:
+            return await c.get_status('A')
+        finally:
+            await c.close()
+
+    assert asyncio.run(run()) == (False, {})
@@ -0,0 +1,58 @@
+"""
+Tests for the command queue of `modules.lock_controller.Controller`.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import pytest
+
+from modules.lock_controller import Controller
+
+
+@pytest.fixture
+def cntrl(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return Controller(sampling=0.01, file_config=str(tmp_path / 'config.json'))
+
+
+def test_commands_apply_directly_after_the_control_thread_died(cntrl):
+    def read():
+        raise OSError('readout failed')
+    cntrl.add('A', read, lambda v, l: v, active=True, lock_type=1, tracelen=10)
+    errors = []
+
+    def run():
+        try:
+            cntrl.run()
+        except OSError as e:
+            errors.append(e)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(2.)
+    assert errors and not thread.is_alive() and cntrl.control_thread_id is None
+    t0 = time.time()
+    assert cntrl.set_setpoint('A', 461.1) is True
+    assert time.time() - t0 < 1. and cntrl.get('A', 'setpoint') == 461.1
+
+
+def test_timed_out_command_is_not_applied_later(cntrl):
+    release = threading.Event()
+    cntrl.add('A', lambda: release.wait(2.) and 461.3, lambda v, l: v, active=True, lock_type=1, tracelen=10)
+    cntrl.command_timeout = 0.05
+    thread = threading.Thread(target=cntrl.run, daemon=True)
+    thread.start()
+    try:
+        time.sleep(0.05)  # the control thread is now blocked in the readout
+        with pytest.raises(FutureTimeout):
+            cntrl.set_setpoint('A', 461.1)
+        release.set()
+        time.sleep(0.1)
+        assert cntrl.get('A', 'setpoint') != 461.1
+    finally:
+        release.set()
+        cntrl.stop()
+        thread.join()
@@ -0,0 +1,86 @@
+"""
+Tests for the background health sampler and the batched telemetry writer in `modules.lock_health`.
+"""
+
+from __future__ import annotations
+
+import gc
+import time
+
+from modules.lock_health import health_sampler, telemetry_writer
+from modules.orchestrator import LIVE_FIELDS
+
+
+def test_sample_does_not_block_and_traces_line_up():
+    sampler = health_sampler(sources={'loop': lambda: 0.1})
+    sampler.gc(phase='start', info={})
+    sampler.gc(phase='stop', info={})
+    t0 = time.perf_counter()
+    first = sampler.sample()
+    assert time.perf_counter() - t0 < 0.5
+    assert first['net_sent'] is None and first['gc_count'] == 1 and first['loop'] == 0.1
+    sampler.sources['late'] = lambda: 1.
+    second = sampler.sample()
+    assert second['net_recv'] >= 0 and second['gc_count'] == 0 and second['rss'] > 0
+    trace = sampler.get_trace(['cpu', 'late', 'nope'])
+    assert len(trace['time']) == len(trace['cpu']) == 2
+    assert trace['late'] == [None, 1.] and 'nope' not in trace
+    assert sampler.get_trace(last=1)['loop'] == [0.1]
+
+
+def test_sampler_thread_times_gc_pauses():
+    sampler = health_sampler(period=0.02)
+    sampler.start()
+    try:
+        gc.collect()
+        time.sleep(0.1)
+    finally:
+        sampler.stop()
+    trace = sampler.get_trace(['gc_count', 'gc_pause_max'])
+    assert sum(trace['gc_count']) >= 1 and max(trace['gc_pause_max']) > 0
+    assert sampler.gc not in gc.callbacks
+
+
+def test_writer_batches_and_keeps_points_while_the_sink_fails():
+    batches = []
+    fail = [True]
+
+    def sink(points):
+        if fail[0]:
+            raise IOError('unreachable')
+        batches.append(points)
+    writer = telemetry_writer(sink, max_points=3)
+    for i in range(2):
+        writer.write('server_status', {'cpu': i})
+    assert writer.flush() == 0 and writer.errors == 1
+    writer.write('server_status', {'cpu': 2})
+    writer.write('server_status', {'cpu': 3})
+    fail[0] = False
+    assert writer.flush() == 3
+    assert [p[1]['cpu'] for p in batches[0]] == [1, 2, 3] and writer.dropped == 1
+
+
+def test_health_endpoint(make_server):
+    lck, tc = make_server(channels=(), run=False)
+    try:
+        assert tc.get('/get/health').get_json()['status'] is False
+        assert tc.post('/post/health', json={'period': 0.01}).get_json()['status'] is True
+        time.sleep(0.1)
+        latest = tc.get('/get/health').get_json()['data']
+        assert 'cpu' in latest and 'loop_period' in latest and 'wlm_calls' in latest
+        trace = tc.get('/get/health?names=cpu,rss&last=2').get_json()['data']
+        assert sorted(trace) == ['cpu', 'rss', 'time'] and len(trace['time']) == 2
+    finally:
+        lck.health.stop()
+
+
+def test_health_sources_on_the_orchestrated_controller(facade_server):
+    lck, _ = facade_server
+    health = lck.start_health(period=10.)
+    try:
+        sample = health.sample()
+        assert sample['loop_period'] is None and sample['pid_time_max'] is None and sample['commands'] is None
+        lck.cntrl.orch.live = lambda name=None: {'A': dict.fromkeys(LIVE_FIELDS) | {'active': 1, 'lock': 1, 'cycle_time': 0.004}}
+        assert health.sample()['pid_time_max'] == 0.004
+    finally:
+        health.stop()
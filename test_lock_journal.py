@@ -0,0 +1,129 @@
+"""
+Tests for the state journal in `modules.lock_journal`.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+
+from modules.lock_journal import MAGIC, record_size, state_journal
+from modules.pid_wrapper import pid_container
+
+
+def test_recovery_keeps_newest_state_and_drops_torn_tail(tmp_path):
+    path = str(tmp_path / "config.journal")
+    journal = state_journal(path)
+    for i in range(5):
+        journal.append("WMCH2", 100.0 + i, 0.1 * i, 0.01 * i, 461.3)
+    journal.append("WMCH3", 104.5, None, 0.2, None)
+    journal.close()
+
+    with open(path, "ab") as f:  # a crash in the middle of a write
+        f.write(b"\x01" * (record_size("WMCH2") // 2))
+
+    journal = state_journal(path)
+    assert journal.get("WMCH2") == {"time": 104.0, "output": 0.4, "integral": 0.04, "last_input": 461.3, "locked": None}
+    assert journal.get("WMCH3")["output"] is None
+    assert journal.get("WMCH4") is None
+    assert os.path.getsize(path) == len(MAGIC) + 6 * record_size("WMCH2")
+
+
+def test_compaction_keeps_one_record_per_channel(tmp_path):
+    path = str(tmp_path / "config.journal")
+    journal = state_journal(path, compact_records=50)
+    for i in range(120):
+        journal.append("WMCH%d" % (i % 3), float(i), float(i))
+    t_end = time.time() + 2.
+    while os.path.getsize(path) >= 50 * record_size("WMCH0") and time.time() < t_end:
+        time.sleep(0.01)  # compacted by the background thread
+    assert os.path.getsize(path) < 50 * record_size("WMCH0")
+    journal.close()
+    journal = state_journal(path)
+    assert [journal.get("WMCH%d" % k)["output"] for k in range(3)] == [117.0, 118.0, 119.0]
+
+
+def test_records_appended_during_compaction_are_kept(tmp_path):
+    path = str(tmp_path / "config.journal")
+    journal = state_journal(path)
+    done = threading.Event()
+
+    def compact():
+        while not done.is_set():
+            journal.compact()
+    thread = threading.Thread(target=compact)
+    thread.start()
+    for i in range(3000):
+        journal.append("WMCH%d" % (i % 7), float(i), float(i))
+    done.set()
+    thread.join()
+    journal.close()
+    journal = state_journal(path)
+    assert [journal.get("WMCH%d" % k)["output"] for k in range(7)] == [float(max(range(k, 3000, 7))) for k in range(7)]
+
+
+def test_channels_sharing_a_long_prefix_keep_their_own_state(tmp_path):
+    path = str(tmp_path / "config.journal")
+    journal = state_journal(path)
+    journal.append("Toptica_DLpro_397nm_A", 1.0, 0.1)
+    journal.append("Toptica_DLpro_397nm_B", 2.0, 0.2)
+    journal.close()
+    journal = state_journal(path)
+    assert journal.get("Toptica_DLpro_397nm_A")["output"] == 0.1
+    assert journal.get("Toptica_DLpro_397nm_B")["output"] == 0.2
+
+
+def test_fixed_size_journal_is_converted(tmp_path):
+    path = str(tmp_path / "config.journal")
+    legacy = struct.Struct("<16sdddd")
+    rec = legacy.pack(b"WMCH2", 100.0, 0.4, 0.04, float("nan"))
+    with open(path, "wb") as f:
+        f.write(rec + struct.pack("<I", zlib.crc32(rec)))
+    journal = state_journal(path)
+    assert journal.get("WMCH2") == {"time": 100.0, "output": 0.4, "integral": 0.04, "last_input": None, "locked": None}
+    journal.append("WMCH2", 101.0, 0.5)
+    journal.close()
+    assert state_journal(path).get("WMCH2")["output"] == 0.5
+
+
+def test_journal_without_lock_state_is_converted(tmp_path):
+    path = str(tmp_path / "config.journal")
+    rec = struct.pack("<H", 5) + b"WMCH2" + struct.pack("<dddd", 100.0, 0.4, 0.04, 461.3)
+    with open(path, "wb") as f:
+        f.write(b"WMJ2" + rec + struct.pack("<I", zlib.crc32(rec)))
+    journal = state_journal(path)
+    assert journal.get("WMCH2")["output"] == 0.4 and journal.get("WMCH2")["locked"] is None
+    journal.append("WMCH2", 101.0, 0.5, 0.05, 461.3, True)
+    journal.close()
+    assert state_journal(path).get("WMCH2")["locked"] is True
+
+
+def test_locking_continues_from_the_last_output():
+    pid = pid_container(lambda: 461.3, lambda new, last: new, False, 0.5, -100, -1000, 0, 461.3, [-10, 10], 10)
+    pid.last_out = 3.2  # e.g. restored from the journal
+    pid.set_lock(True)
+    _, _, out = pid()
+    assert out == pytest.approx(3.2)
+
+
+def test_failing_sink_does_not_stop_locking():
+    pid = pid_container(lambda: 461.3, lambda new, last: new, False, 0.5, -100, -1000, 0, 461.3, [-10, 10], 10)
+    seen = []
+
+    def broken(*sample):
+        raise OSError("disk full")
+    pid.sinks = (broken, lambda *sample: seen.append(sample))
+    pid.set_lock(True)
+    for _ in range(3):
+        pid()
+    assert pid.sink_errors == 3 and len(seen) == 3
+
+
+## AGENT_UPDATE
+# - Added tests for torn-tail recovery and compaction of the state journal.
+# - Added tests for the bumpless lock seeding.
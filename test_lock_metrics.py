@@ -0,0 +1,75 @@
+"""
+Tests for the control-loop metrics (`modules.lock_metrics`, /metrics).
+"""
+
+from __future__ import annotations
+
+import itertools
+import time
+
+import pytest
+
+from modules.lock_metrics import histogram, lock_metrics, readout_state
+
+
+def test_histogram_renders_cumulative_buckets():
+    metrics = lock_metrics(cycle_buckets=(0.01, 0.1))
+    for value, dt in ((461.3, 0.005), (-3., 0.05), (-4., 0.5), (None, 0.05)):
+        metrics.sample('A "1"', value, dt, None)
+    metrics.transition('A "1"', True)
+    metrics.error('command')
+    text = metrics.render([('queue_depth', 'gauge', 'Queue.', (), 2), ('skipped', 'gauge', 'Left out.', (), None)])
+    lines = text.splitlines()
+    assert 'wavemeter_cycle_seconds_bucket{channel="A \\"1\\"",le="0.01"} 1' in lines
+    assert 'wavemeter_cycle_seconds_bucket{channel="A \\"1\\"",le="0.1"} 3' in lines
+    assert 'wavemeter_cycle_seconds_bucket{channel="A \\"1\\"",le="+Inf"} 4' in lines
+    assert 'wavemeter_cycle_seconds_count{channel="A \\"1\\""} 4' in lines
+    assert 'wavemeter_readout_total{channel="A \\"1\\"",state="overexposed"} 1' in lines
+    assert 'wavemeter_readout_total{channel="A \\"1\\"",state="error"} 1' in lines
+    assert 'wavemeter_lock_transitions_total{channel="A \\"1\\"",direction="lock"} 1' in lines
+    assert 'wavemeter_errors_total{kind="command"} 1' in lines
+    assert '# TYPE wavemeter_queue_depth gauge' in lines and 'wavemeter_queue_depth 2' in lines
+    assert 'skipped' not in text
+    assert [readout_state(v) for v in (1., 0., -1., -3., -4., -5., float('nan'))] == \
+        ['ok', 'underexposed', 'underexposed', 'underexposed', 'overexposed', 'error', 'error']
+    hist = histogram((1.,))
+    hist.observe(1.)  # upper bounds are inclusive
+    assert hist.counts == [1, 0]
+
+
+@pytest.fixture
+def server(make_server):
+    readings = itertools.cycle((461.3, -3., -4., 461.3))
+    return make_server(read=lambda: next(readings), sampling=0.01)[0]
+
+
+def test_metrics_endpoint_is_scraped_without_login(server):
+    lck = server
+    lck.cntrl.lock('A', True)
+    time.sleep(0.1)
+    lck.cntrl.lock('A', False)
+    lck.cntrl.lock('A', False)  # no transition
+    response = lck.flsk.test_client().get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    values = {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1]) for line in lines if not line.startswith('#')}
+    assert values['wavemeter_cycle_seconds_count{channel="A"}'] >= 4
+    for state in ('ok', 'underexposed', 'overexposed'):
+        assert values['wavemeter_readout_total{channel="A",state="%s"}' % state] >= 1
+    assert values['wavemeter_lock_transitions_total{channel="A",direction="lock"}'] == 1
+    assert values['wavemeter_lock_transitions_total{channel="A",direction="unlock"}'] == 1
+    assert values['wavemeter_write_seconds_count{channel="A"}'] >= 1  # written while locked
+    assert values['wavemeter_command_queue_depth'] == 0
+    assert values['wavemeter_channel_locked{channel="A"}'] == 0
+    assert values['wavemeter_sink_errors_total{channel="A"}'] == 0
+    assert lck.flsk.test_client().get('/get/status').status_code == 302  # everything else still needs the login
+
+
+def test_metrics_keep_only_numbers(facade_server):
+    lck, tc = facade_server
+    lck.cntrl.ReferenceLockState = 'unknown'  # not a bool
+    lck.cntrl.cycle_period = '12'
+    text = tc.get('/metrics').get_data(as_text=True)
+    assert 'wavemeter_reference_in_lock' in text  # bool('unknown') is still a number
+    assert 'wavemeter_loop_period_seconds' not in text
+    assert 'wavemeter_wlm_' not in text  # the workers own the wavemeter
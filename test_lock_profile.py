@@ -0,0 +1,101 @@
+"""
+Tests for the runtime profiler of the control loop (`modules.lock_profile`, /post/profile).
+"""
+
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from modules.pid_wrapper import pid_container
+
+
+def slow_read():
+    time.sleep(0.002)
+    return 461.3
+
+
+@pytest.fixture
+def server(make_server):
+    return make_server(read=slow_read, sampling=0.01)
+
+
+def _wait_result(tc):
+    t_end = time.time() + 5.
+    while time.time() < t_end:
+        status = tc.get('/get/profile').get_json()['data']
+        if status['running'] is None and status['result'] is not None:
+            return status['result']
+        time.sleep(0.02)
+    raise AssertionError('profile did not finish')
+
+
+def test_stack_profile_writes_collapsed_stacks(server):
+    lck, tc = server
+    ret = tc.post('/post/profile', json={'mode': 'stack', 'seconds': 0.3, 'interval': 0.001}).get_json()
+    assert ret['status'] is True
+    assert tc.post('/post/profile', json={'mode': 'stack', 'seconds': 1}).get_json()['status'] is False  # one at a time
+    result = _wait_result(tc)
+    assert result['samples'] > 10 and 0 <= result['overhead'] < 1
+    assert any('slow_read (test_lock_profile.py' in s['stack'] for s in result['top_stacks'])
+    with open(result['file']) as f:
+        lines = f.readlines()
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in lines) == result['samples']
+    assert all(';run (lock_controller.py:' in line for line in lines)
+
+
+def test_timing_profile_times_the_channel_calls(server):
+    lck, tc = server
+    call = pid_container.__call__
+    read = lck.cntrl.pid_dict['A'].func_read
+    assert tc.post('/post/profile', json={'mode': 'timing', 'seconds': 0.3}).get_json()['status'] is True
+    time.sleep(0.1)
+    assert pid_container.__call__ is call  # only the profiled instance is wrapped
+    assert type(lck.cntrl.pid_dict['A']) is not pid_container
+    result = _wait_result(tc)
+    assert result['uninstalled'] is True
+    timing = result['channels']['A']
+    assert timing['func_read']['count'] > 3 and timing['func_read']['mean'] >= 0.002
+    assert timing['__call__']['count'] == timing['func_read']['count']
+    assert timing['__call__']['mean'] >= timing['func_read']['mean']
+    assert timing['func_write']['count'] == 0  # channel is not locked
+    assert pid_container.__call__ is call and lck.cntrl.pid_dict['A'].func_read is read
+    assert result['overhead'] < 0.1
+
+
+def test_timing_profile_reports_a_failed_uninstall(server, monkeypatch):
+    import modules.lock_profile as lock_profile
+
+    lck, tc = server
+    waits = []
+
+    def wait_command(future, timeout):  # the uninstall times out
+        waits.append(future)
+        if len(waits) == 2:
+            raise TimeoutError('uninstall timed out')
+        return future.result(timeout)
+
+    monkeypatch.setattr(lock_profile, 'wait_command', wait_command)
+    assert tc.post('/post/profile', json={'mode': 'timing', 'seconds': 0.1}).get_json()['status'] is True
+    result = _wait_result(tc)
+    assert result['uninstalled'] is False and result['uninstall_error'] == 'uninstall timed out'
+    assert result['channels']['A']['func_read']['count'] > 0
+    t_end = time.time() + 2.
+    while type(lck.cntrl.pid_dict['A']) is not pid_container:  # the queued removal runs later
+        assert time.time() < t_end
+        time.sleep(0.01)
+
+
+def test_profile_rejects_bad_arguments(server):
+    _, tc = server
+    assert tc.post('/post/profile', json={'mode': 'nope'}).get_json()['status'] is False
+    assert tc.post('/post/profile', json={'seconds': 'x'}).get_json()['status'] is False
+
+
+def test_web_lock_on_the_orchestrated_controller_has_no_profiler(facade_server):
+    lck, tc = facade_server
+    assert lck.profiler is None
+    assert tc.post('/post/profile', json={'mode': 'stack'}).get_json()['status'] is False
+    assert tc.get('/get/profile').get_json()['status'] is False
+    assert tc.get('/get/status').get_json() == {'status': True, 'data': {}}
@@ -0,0 +1,56 @@
+"""
+Tests for the streaming Welch PSD in `modules.lock_psd`.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+np = pytest.importorskip("numpy")
+signal = pytest.importorskip("scipy.signal")
+
+from modules.lock_psd import lock_spectra, welch_psd
+
+
+def test_mean_average_matches_scipy_welch_on_uniform_samples():
+    rng = np.random.default_rng(0)
+    dt = 0.1
+    x = rng.normal(0.0, 1e-6, 4000) + 2e-6 * np.sin(2 * np.pi * 1.3 * dt * np.arange(4000))
+
+    psd = welch_psd(dt, nperseg=256, alpha=None)
+    for i, v in enumerate(x):
+        psd.add(i * dt, v)
+
+    n_seg = (len(x) - 256) // 128 + 1
+    # the streaming estimate has seen exactly the complete segments
+    f, ref = signal.welch(x[: 256 + 128 * (n_seg - 1)], fs=1 / dt, nperseg=256, noverlap=128,
+                          window="hann", detrend="constant")
+    res = psd.get()
+    assert res["segments"] == n_seg
+    assert np.allclose(res["freq"], f)
+    assert np.allclose(res["psd"], ref, rtol=1e-9, atol=0)
+
+
+def test_jittered_samples_are_resampled_and_readout_errors_skipped():
+    rng = np.random.default_rng(1)
+    dt = 0.05
+    spectra = lock_spectra(nperseg=128, alpha=0.2)
+    t = 0.0
+    for i in range(3000):
+        t += dt * (1 + 0.1 * rng.uniform(-1, 1))
+        error = 1e-6 * np.sin(2 * np.pi * 5.0 * t)
+        value = -3 if i % 50 == 7 else 461.3  # occasional underexposure
+        spectra.add("WMCH2", t, value, error, dt)
+
+    res = spectra.get("WMCH2")["WMCH2"]
+    assert res["segments"] > 10
+    peak = res["freq"][int(np.argmax(res["psd"]))]
+    assert peak == pytest.approx(5.0, abs=1 / (128 * dt))
+
+    assert spectra.reset() is True
+    assert spectra.get("WMCH2")["WMCH2"]["segments"] == 0
+
+
+## AGENT_UPDATE
+# - Added tests checking the streaming Welch PSD against scipy.signal.welch and its resampling of
+#   jittered scheduler times.
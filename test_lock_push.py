@@ -0,0 +1,114 @@
+"""
+Tests for the asyncio SSE / WebSocket push server in `modules.lock_push`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import os
+import time
+
+from modules.lock_push import push_server, read_ws_frame, ws_accept
+
+
+def _server(**kwargs) -> push_server:
+    counter = {'n': 0}
+
+    def payload():
+        counter['n'] += 1
+        return {'n': counter['n']}
+    server = push_server({'values': (0.01, payload), 'big': (0.01, lambda: [time.time(), 'x'*100000])}, port=0, **kwargs)
+    server.start()
+    return server
+
+
+async def _open(server, path, headers=''):
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    writer.write(('GET %s HTTP/1.1\r\nHost: 127.0.0.1:%i\r\n%s\r\n' % (path, server.port, headers)).encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    return reader, writer, head.decode()
+
+
+def test_sse_and_websocket_receive_the_same_stream():
+    server = _server()
+
+    async def run():
+        reader, writer, head = await _open(server, '/stream/values')
+        assert head.startswith('HTTP/1.1 200') and 'text/event-stream' in head
+        line = await asyncio.wait_for(reader.readline(), 2.)
+        assert json.loads(line[len(b'data: '):])['n'] >= 1
+        writer.close()
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        reader, writer, head = await _open(server, '/stream/values',
+                                           'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                                           'Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n' % key)
+        assert head.startswith('HTTP/1.1 101') and ws_accept(key) in head
+        opcode, data = await asyncio.wait_for(read_ws_frame(reader), 2.)
+        assert opcode == 0x1 and 'n' in json.loads(data)
+        writer.close()
+
+        _, writer, head = await _open(server, '/stream/nope')
+        assert head.startswith('HTTP/1.1 404')
+        writer.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.stop()
+
+
+def test_unauthorized_and_slow_subscribers():
+    server = _server(authorize=lambda headers: headers.get('cookie') == 'session=ok', max_buffer=64*1024)
+
+    async def run():
+        _, writer, head = await _open(server, '/stream/values')
+        assert head.startswith('HTTP/1.1 403')
+        writer.close()
+
+        # a subscriber that never reads fills its send buffer and is dropped
+        reader, writer, head = await _open(server, '/stream/big', 'Cookie: session=ok\r\n')
+        writer.transport.pause_reading()
+        t_end = time.time() + 5.
+        while server.dropped == 0 and time.time() < t_end:
+            await asyncio.sleep(0.05)
+        writer.close()
+
+    try:
+        asyncio.run(run())
+        assert server.dropped == 1
+        assert server.subscribers() == {'values': 0, 'big': 0}
+    finally:
+        server.stop()
+
+
+def test_live_stream_sends_subscribed_deltas():
+    state = {'A': {'value': 1., 'lock': True}, 'B': {'value': 2., 'lock': False}}
+    server = push_server({}, port=0, live=(0.01, lambda: {k: dict(v) for k, v in state.items()}))
+    server.start()
+
+    async def next_event(reader):
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 2.)
+            if line.startswith(b'data: '):
+                return json.loads(line[len(b'data: '):])
+
+    async def run():
+        reader, writer, head = await _open(server, '/stream/live?channels=A,C&fields=value&rate=50')
+        assert head.startswith('HTTP/1.1 200')
+        assert await next_event(reader) == {'A': {'value': 1.}}  # full subscribed state first
+        state['A']['value'] = 1.5
+        state['A']['lock'] = False  # not subscribed
+        state['B']['value'] = 2.5   # not subscribed
+        assert await next_event(reader) == {'A': {'value': 1.5}}
+        del state['A']
+        state['C'] = {'value': 3.}
+        assert await next_event(reader) == {'A': None, 'C': {'value': 3.}}
+        writer.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.stop()
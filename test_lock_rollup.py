@@ -0,0 +1,157 @@
+"""
+Tests for the ingest-time rollups in `modules.lock_rollup`.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modules.lock_archive import convert_csv, lock_archive
+from modules.lock_rollup import channel_rollup, decimate, lock_rollups
+from modules.pid_wrapper import pid_container
+
+
+def test_cascaded_levels_match_brute_force_statistics(tmp_path):
+    rng = np.random.default_rng(0)
+    t = 1e6 + np.cumsum(rng.uniform(0.05, 0.15, 30000))
+    x = 461.3 + rng.normal(0, 1e-6, len(t))
+    locked = rng.uniform(size=len(t)) > 0.2
+
+    levels = ((1, 4000), (10, 400), (60, 100))
+    ch = channel_rollup(levels, str(tmp_path / "rollup.npz"))
+    for ti, xi, li in zip(t, x, locked):
+        ch.add(ti, (xi, xi - 461.3, None), li)
+    ch.save()
+    ch = channel_rollup(levels, str(tmp_path / "rollup.npz"))  # reload the persisted rings
+
+    res = ch.get(2)
+    keys = np.floor(t / 60) * 60
+    assert res["width"] == 60
+    assert res["time"] == np.unique(keys)[: len(res["time"])].tolist()
+    for i, start in enumerate(res["time"]):
+        sel = keys == start
+        assert res["n"][i] == sel.sum()
+        assert res["lock_fraction"][i] == pytest.approx(locked[sel].mean())
+        assert res["input_min"][i] == x[sel].min() and res["input_max"][i] == x[sel].max()
+        assert res["input_mean"][i] == pytest.approx(x[sel].mean(), rel=1e-15)
+        assert res["error_std"][i] == pytest.approx(np.std(x[sel] - 461.3, ddof=1), rel=1e-6)
+        assert res["output_mean"][i] is None
+
+
+def test_ring_keeps_the_newest_bins():
+    ch = channel_rollup(((1, 5),))
+    for s in range(20):
+        ch.add(float(s), (1.0, 0.0, 0.0), True)
+    assert ch.get(0)["time"] == [14.0, 15.0, 16.0, 17.0, 18.0, 19.0]  # 5 completed + the open bin
+
+
+def test_pid_container_feeds_rollups_at_ingest():
+    rollups = lock_rollups()
+    readings = iter([461.3, -3, 461.3000001])
+    pid = pid_container(lambda: next(readings), None, False, 0, 1, 0, 0, 461.3, [-1, 1], 10)
+    pid.add_sink(lambda *args: rollups.add("WMCH2", *args))
+    for _ in range(3):
+        pid()
+
+    res = rollups.get("WMCH2", level=1)
+    assert sum(res["n"]) == 3
+    assert res["lock_fraction"] == [0.0] * len(res["time"])
+    assert min(v for v in res["input_min"] if v is not None) == 461.3
+
+
+def test_open_bins_survive_a_restart(tmp_path):
+    path = str(tmp_path / "rollup.npz")
+    levels = ((1, 100), (10, 100))
+    ch = channel_rollup(levels, path)
+    for t in np.arange(0, 15, 0.25):
+        ch.add(t, (461.3 + t, 0.0, 0.0), True)
+    ch.save()
+    ch = channel_rollup(levels, path)
+    for t in np.arange(15, 25, 0.25):
+        ch.add(t, (461.3 + t, 0.0, 0.0), True)
+    res = ch.get(1)
+    assert res["time"] == [0.0, 10.0, 20.0] and res["n"] == [40, 40, 20]
+    assert res["input_min"][1] == 471.3 and res["input_max"][1] == 461.3 + 19.75
+
+
+def test_save_writes_without_holding_the_ingest_mutex(tmp_path, monkeypatch):
+    import modules.lock_rollup as lock_rollup
+
+    rollups = lock_rollups(str(tmp_path))
+    rollups.add("WMCH2", 1.7e9, 461.3, 0.0, 1.0, True)
+    held = []
+    savez = np.savez
+    monkeypatch.setattr(lock_rollup.np, "savez", lambda *a, **k: held.append(rollups.mutex.locked()) or savez(*a, **k))
+    rollups.save()
+    assert held == [False]
+    assert channel_rollup(path=str(tmp_path / "WMCH2" / "rollup.npz")).get(0)["n"] == [1]
+
+
+def test_history_picks_level_and_falls_back_to_raw_samples():
+    rollups = lock_rollups()
+    t = 1.7e9 + np.arange(0, 7 * 86400, 10.0)  # one week at 0.1 Hz
+    for ti in t:
+        rollups.add("WMCH2", ti, 461.3, 0.0, 1.0, True)
+    raw = lambda t0, t1: {f: np.arange(3.0) for f in ("time", "input", "error", "output")}
+
+    week = rollups.history("WMCH2", t[0], t[-1], max_points=1000, raw=raw)
+    assert week["level"] == 3600
+    assert len(week["time"]) <= 1000 and sum(week["n"]) == len(t)
+
+    short = rollups.history("WMCH2", t[100], t[150], max_points=1000, raw=raw)
+    assert short["level"] == 0 and short["time"] == [0.0, 1.0, 2.0]
+    assert short["input_min"] == short["input_max"]
+    assert rollups.history("WMCH2", t[100], t[150], max_points=1000)["level"] == 1
+
+
+def _imported(tmp_path, n=20000):
+    """Archive root with n samples of WMCH3 at 10 Hz converted from a CSV log."""
+    t = 1.74e9 + np.arange(n) / 10.0
+    inp = 461.3 + 1e-5 * np.sin(t / 7.0)
+    inp[1234] = -3.0  # WLM readout error
+    lines = ["datetime,time_trace_last,setpoint,P,I,D,WM_Exposure,PID Input,Error,PID Output"]
+    lines += [f"x,{a!r},461.3,10,100,0,2,{b!r},{b - 461.3!r},{i % 97}" for i, (a, b) in enumerate(zip(t.tolist(), inp.tolist()))]
+    csv_file = tmp_path / "data_WMCH3.csv"
+    csv_file.write_text("\n".join(lines) + "\n")
+    root = str(tmp_path / "archive")
+    assert convert_csv(str(csv_file), root, chunksize=3000) == n
+    return root, t
+
+
+def test_imported_data_respects_max_points(tmp_path):
+    root, t = _imported(tmp_path)
+    archive = lock_archive(root)
+    raw = lambda t0, t1: archive.read("WMCH3", t0, t1, ["time", "input", "error", "output"])
+
+    rollups = lock_rollups(root)  # rollups written by convert_csv
+    ret = rollups.history("WMCH3", t[0], t[-1], max_points=1000, raw=raw)
+    assert 0 < len(ret["time"]) <= 1000 and ret["level"] == 10
+    assert sum(ret["n"]) == len(t)
+    assert max(ret["output_max"]) == 96 and min(ret["output_min"]) == 0
+    assert min(ret["input_min"]) > 461  # readout error kept out of the envelope
+
+    short = rollups.history("WMCH3", t[0], t[50], max_points=1000, raw=raw)
+    assert short["level"] == 0 and len(short["time"]) == 51
+
+
+def test_raw_fallback_is_decimated_to_max_points(tmp_path):
+    root, t = _imported(tmp_path)
+    archive = lock_archive(root)
+    data = archive.read("WMCH3")
+    raw = lambda t0, t1: archive.read("WMCH3", t0, t1, ["time", "input", "error", "output"])
+
+    ret = lock_rollups().history("WMCH3", t[0], t[-1], max_points=1000, raw=raw)
+    assert 0 < len(ret["time"]) <= 1000 and sum(ret["n"]) == len(t)
+    assert ret["level"] == pytest.approx((t[-1] - t[0]) / 1000)
+    assert min(ret["input_min"]) == data["input"].min() == -3.0
+    assert max(ret["input_max"]) == data["input"].max()
+    assert ret == decimate(data, 1000) | {"level": ret["width"]}
+
+
+## AGENT_UPDATE
+# - Added tests checking the cascaded rollup levels against brute-force statistics, ring
+#   wrap-around and persistence, and the pid_container ingest sink.
+# - Added tests for persisted open bins and the /get/history level selection with raw fallback.
+# - Added tests that imported / raw-only history respects max_points.
@@ -0,0 +1,85 @@
+"""
+Tests for the index cache, the static file caching and the JSON gzip of `modules.lock_server`.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import re
+
+import pytest
+
+import modules.lock_server as lock_server
+
+
+@pytest.fixture
+def server(make_server):
+    return make_server(run=False)
+
+
+def test_index_is_rendered_again_only_for_new_channels(server, monkeypatch):
+    lck, tc = server
+    renders = []
+    render_template = lock_server.render_template
+    monkeypatch.setattr(lock_server, 'render_template', lambda *args, **kwargs: renders.append(1) or render_template(*args, **kwargs))
+    assert 'res_A_L' in tc.get('/').get_data(as_text=True)
+    assert 'res_A_L' in tc.get('/').get_data(as_text=True)
+    assert len(renders) == 1
+    lck.cntrl.add('B', lambda: 461.3, lambda v, l: v, active=True, lock_type=1, tracelen=10)
+    assert 'res_B_L' in tc.get('/').get_data(as_text=True)
+    assert len(renders) == 2
+
+
+def test_static_files_are_versioned_and_cached(server):
+    lck, tc = server
+    page = tc.get('/').get_data(as_text=True)
+    url = re.search(r'src="(/static/script.js\?v=\d+)"', page).group(1)
+    response = tc.get(url)
+    assert response.status_code == 200
+    assert 'max-age=%d' % lock_server.STATIC_MAX_AGE in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+    assert tc.get('/static/script.js', headers={'If-None-Match': etag}).status_code == 304
+    # static files need no login
+    assert lck.flsk.test_client().get(url).status_code == 200
+
+
+def test_large_json_is_gzipped(server):
+    lck, tc = server
+    small = tc.get('/get/list', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    lck.cntrl.set_trace('A', 1000)
+    for i in range(200):
+        lck.cntrl.pid_dict['A']()
+    large = tc.get('/get/trace', json={'name': 'A'}, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert large.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(large.get_data()))['status'] is True
+    assert 'Content-Encoding' not in tc.get('/get/trace', json={'name': 'A'}).headers
+
+
+def test_read_only_responses_are_cached_until_the_state_changes(server, monkeypatch):
+    lck, tc = server
+    calls = []
+    get_config = lck.cntrl.get_config
+    monkeypatch.setattr(lck.cntrl, 'get_config', lambda: calls.append(1) or get_config())
+    first = tc.get('/get/config').get_json()
+    assert tc.get('/get/config').get_json() == first
+    assert len(calls) == 1
+    lck.cntrl.set('A', 'WM_Exposure', lck.cntrl.get('A', 'WM_Exposure'))  # same value, still cached
+    tc.get('/get/config')
+    assert len(calls) == 1
+    lck.cntrl.set('A', 'setpoint', 461.2)
+    assert tc.get('/get/config').get_json()['data']['A']['setpoint'] == 461.2
+    assert len(calls) == 2
+    lck.cntrl.add('B', lambda: 461.3, lambda v, l: v, active=True, lock_type=1, tracelen=10)
+    assert tc.get('/get/list').get_json()['data'] == ['A', 'B']
+    assert list(tc.get('/get/status', json={'name': 'B'}).get_json()['data']) == ['B']
+    assert list(tc.get('/get/status').get_json()['data']) == ['A', 'B']
+
+
+def test_numpy_values_are_serialised():
+    np = pytest.importorskip('numpy')
+    from modules import lock_json
+    payload = {'x': np.arange(3, dtype=np.float32), 'n': np.int64(2), 'ok': np.bool_(True), 1: 'key'}
+    for name, dumps in lock_json.BACKENDS.items():
+        assert json.loads(dumps(payload)) == {'x': [0., 1., 2.], 'n': 2, 'ok': True, '1': 'key'}, name
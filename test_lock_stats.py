@@ -0,0 +1,82 @@
+"""
+Tests for the incremental lock statistics in `modules.lock_stats`.
+
+The running estimators are compared against direct (batch) formulas on
+synthetic error traces.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+import statistics
+
+import pytest
+
+from modules.lock_stats import channel_stats, lock_analytics
+
+
+def _overlapping_adev(y, m):
+    """Reference overlapping Allan deviation from frequency data y at averaging factor m."""
+    x = [0.0]
+    for v in y:
+        x.append(x[-1] + v)
+    x = x[1:]
+    terms = [(x[i + 2 * m] - 2 * x[i + m] + x[i]) ** 2 for i in range(len(x) - 2 * m)]
+    return math.sqrt(sum(terms) / (2.0 * m * m * len(terms)))
+
+
+def test_welford_and_allan_deviation_match_batch_formulas():
+    rng = random.Random(1)
+    y = [rng.gauss(0.0, 1e-6) + 1e-7 * math.sin(i / 5.0) for i in range(3000)]
+    stats = channel_stats(octaves=8)
+    for i, e in enumerate(y):
+        stats.add(0.1 * i, e, locked=True)
+
+    res = stats.get()
+    assert res["samples"] == len(y)
+    assert res["mean"] == pytest.approx(statistics.fmean(y), rel=1e-9, abs=1e-18)
+    assert res["std"] == pytest.approx(statistics.stdev(y), rel=1e-9)
+    assert res["sample_interval"] == pytest.approx(0.1)
+
+    allan = res["allan"]
+    assert len(allan["tau"]) == 8
+    for tau, dev in zip(allan["tau"], allan["adev"]):
+        m = round(tau / 0.1)
+        assert dev == pytest.approx(_overlapping_adev(y, m), rel=1e-6)
+
+
+def test_tolerance_time_and_lock_loss_events():
+    stats = channel_stats(tolerance=5e-6)
+    errors = [0.0, 1e-6, 8e-6, 9e-6, 1e-6, 2e-6]
+    for i, e in enumerate(errors):
+        stats.add(float(i), e, locked=True)
+    stats.add(6.0, 1e-6, locked=False)
+
+    res = stats.get()
+    # Intervals are attributed to the state at their start: 0-1, 1-2, 4-5, 5-6 in band.
+    assert res["locked_time"] == pytest.approx(6.0)
+    assert res["in_tolerance_time"] == pytest.approx(4.0)
+    assert res["in_tolerance_fraction"] == pytest.approx(4.0 / 6.0)
+    assert res["lock_losses"] == 2
+    assert [ev["kind"] for ev in res["events"]] == ["tolerance", "unlock"]
+
+
+def test_analytics_skips_readout_errors_and_resets():
+    analytics = lock_analytics()
+    analytics.add("WMCH2", 0.0, 461.3, 1e-6, True)
+    analytics.add("WMCH2", 0.1, -3, -461.3, True)  # underexposed readout
+    analytics.add("WMCH2", 0.2, 461.3, 2e-6, True)
+
+    res = analytics.get("WMCH2")["WMCH2"]
+    assert res["samples"] == 2
+    assert res["invalid"] == 1
+    assert res["mean"] == pytest.approx(1.5e-6)
+
+    assert analytics.reset("WMCH2") is True
+    assert analytics.get()["WMCH2"]["samples"] == 0
+
+
+## AGENT_UPDATE
+# - Added tests comparing the O(1) running estimators of `modules.lock_stats` against batch
+#   mean/std and overlapping Allan deviation, plus tolerance-band and lock-loss bookkeeping.
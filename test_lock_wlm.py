@@ -0,0 +1,73 @@
+"""
+Tests for the serialising, caching wavemeter broker in `modules.lock_wlm`.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from modules.lock_wlm import wlm_broker
+
+
+class fake_wvm(object):
+    def __init__(self):
+        self.inside = 0
+        self.overlaps = 0
+        self.calls = 0
+        self.freq = 461.3
+
+    def GetFrequency(self):
+        self.inside += 1
+        self.overlaps += self.inside > 1
+        time.sleep(0.001)
+        self.inside -= 1
+        self.calls += 1
+        return self.freq
+
+    def GetFrequencyNum(self, channel=1):
+        return self.freq + channel
+
+
+def test_calls_are_serialised_and_cached_per_label():
+    wvm = fake_wvm()
+    readings = []
+    broker = wlm_broker(wvm, on_reading=lambda label, value, t: readings.append((label, value)))
+    threads = [threading.Thread(target=lambda: [broker.GetFrequency() for _ in range(20)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert wvm.overlaps == 0 and broker.calls == 80
+
+    with broker.session('WMCH2'):
+        wvm.freq = 541.4
+        broker.GetFrequency()
+    broker.GetFrequencyNum(3)
+    assert broker.cached('WMCH2')[0] == 541.4
+    assert broker.cached('num3')[0] == 544.4
+    assert broker.cached()[0] == 544.4  # newest valid reading
+    assert broker.cached('WMCH2', max_age=-1) is None
+    wvm.freq = -3.  # underexposed: cached for its label, but not the newest valid reading
+    broker.GetFrequency()
+    assert broker.cached('active')[0] == -3. and broker.cached()[0] == 544.4
+    assert readings[-1] == ('num3', 544.4)
+
+
+def test_monitor_reads_only_when_stale_and_free():
+    wvm = fake_wvm()
+    broker = wlm_broker(wvm)
+    broker.monitor(max_age=0.2, period=0.01)
+    try:
+        time.sleep(0.1)
+        assert broker.cached(max_age=0.2) is not None
+        with broker.session('WMCH2'):  # e.g. a channel readout holding the WLM
+            calls = wvm.calls
+            time.sleep(0.1)
+            assert wvm.calls == calls
+        broker.GetFrequency()
+        calls = wvm.calls
+        time.sleep(0.05)  # the fresh reading above keeps the monitor quiet
+        assert wvm.calls == calls
+    finally:
+        broker.stop_monitor()
@@ -0,0 +1,137 @@
+"""
+Tests for `modules.orchestrator`: the shared-memory live table, the command
+round trip to a worker process and the `orchestrated_controller` facade.
+
+The worker runs a real Controller on a stubbed readout, no lab hardware needed.
+"""
+
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from modules.orchestrator import LIVE_FIELDS, live_table, orchestrated_controller, orchestrator
+
+
+def _read():
+    return 461.3
+
+
+def _write(value, last):
+    return value
+
+
+def _setup(cntrl):  # runs in the worker process
+    cntrl.add('A', _read, _write, active=True, lock_type=1, tracelen=10)
+    cntrl.slow = lambda seconds: time.sleep(seconds) or seconds
+
+
+def test_live_table_roundtrip_between_handles():
+    """Values written through one handle are visible through a second handle on the same block."""
+    owner = live_table(max_channels=4)
+    try:
+        reader = live_table(max_channels=4, name=owner.name)
+        try:
+            owner.write(2, {'time': 1.5, 'value': 461.31247, 'lock': True})
+            row = reader.read(2)
+            assert row['time'] == 1.5
+            assert row['value'] == 461.31247
+            assert row['lock'] == 1.0
+            # Fields not written are reported as missing.
+            assert row['output'] is None
+            assert set(row) == set(LIVE_FIELDS)
+            # Untouched rows stay empty.
+            assert all(v is None for v in reader.read(0).values())
+        finally:
+            reader.close()
+    finally:
+        owner.close()
+
+
+def test_live_table_sequence_counter_is_even_after_write():
+    """The seqlock counter must be even (stable) after every completed write."""
+    table = live_table(max_channels=1)
+    try:
+        for i in range(3):
+            table.write(0, {'value': float(i)})
+            assert int(table.data[0]) % 2 == 0
+        assert table.read(0)['value'] == 2.0
+    finally:
+        table.close()
+
+
+def test_live_table_never_returns_a_torn_row():
+    table = live_table(max_channels=1)
+    try:
+        table.write(0, {'value': 1.0})
+        table.data[0] += 1  # writer stopped in the middle of an update
+        assert table.read(0, retries=5) is None
+        table.data[0] += 1
+        assert table.read(0)['value'] == 1.0
+    finally:
+        table.close()
+
+
+@pytest.fixture
+def orch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the spawned worker starts in the same directory
+    orch = orchestrator(max_channels=2, rpc_timeout=5.)
+    orch.add_worker('w1', _setup, sampling=0.05)
+    orch.start()
+    yield orch
+    orch.stop()
+
+
+def test_worker_calls_drop_replies_of_timed_out_calls(orch):
+    assert orch.call('w1', 'set_setpoint', 'A', 461.2)[0] is True
+    orch.rpc_timeout = 0.2
+    with pytest.raises(TimeoutError):
+        orch.call('w1', 'slow', 0.5)
+    orch.rpc_timeout = 5.
+    assert orch.call('w1', 'get_list')[0] == ['A']  # not the late 0.5 of the call above
+    assert orch.call('w1', 'get', 'A', 'setpoint')[0] == 461.2
+
+
+def test_facade_forwards_only_channel_methods(orch):
+    cntrl = orchestrated_controller(orch)
+    assert cntrl.set_setpoint('A', 461.4) is True
+    assert cntrl.get('A', 'setpoint') == 461.4
+    assert cntrl.set_setpoint('missing', 1.) is False
+    for name in ('add_slot', 'cycle_period', 'csv_dir', 'commands', 'pid_dict', 'metrics'):
+        assert not hasattr(cntrl, name)
+    assert cntrl.state_version != cntrl.state_version  # config is never served from web_lock's cache
+
+
+def test_web_lock_on_the_facade_leaves_the_wavemeter_to_the_workers(facade_server):
+    from conftest import wlm_spy
+
+    lck, tc = facade_server
+    assert lck.wvm is None and lck.calibration is None
+    assert tc.get('/get/status').status_code == 200
+    assert tc.get('/metrics').status_code == 200
+    assert lck.digit_payload() is None
+    lck.start_health(period=0.05).stop()
+    lck.__del__()
+    assert wlm_spy.calls == []
+
+
+def test_facade_status_has_the_controller_fields(orch):
+    cntrl = orchestrated_controller(orch)
+    assert cntrl.set_setpoint('A', 461.3) is True and cntrl.lock('A', True) is True
+    deadline = time.monotonic() + 5.
+    while cntrl.get_status('A').get('A', {}).get('acquire_time') is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    status = cntrl.get_status('A')['A']
+    assert set(orch.call('w1', 'get_status', 'A')[0]['A']) <= set(status)
+    assert status['sink_errors'] == 0 and status['acquire_time'] >= 0 and status['worker'] == 'w1'
+
+
+## AGENT_UPDATE
+# - Added tests for `live_table`, the seqlock-protected shared-memory table through which
+#   orchestrator worker processes publish live values.
+# - Added worker round-trip and facade tests (stale replies, forwarded surface).
+# - Added a test that web_lock on the facade never opens or calls the wavemeter DLL.
+# - Added a test that a row torn for every retry is not returned.
+# - Added a test that the facade's get_status has the fields of Controller.get_status.
@@ -175,6 +175,41 @@ def test_dac_output_is_clamped_to_limits():
     assert v == written_v
 
 
+def test_read_frequency_does_not_touch_pid_or_dac():
+    """read_frequency should perform the readout steps only, leaving PID and DAC untouched."""
+    lock, fake_wlm, event_adapter, dac_calls = _make_single_channel_lock(
+        pid_voltage=1.0,
+        dac_limits=(0.0, 5.0),
+    )
+
+    freq = lock.read_frequency(1)
+    assert freq == pytest.approx(384.23e12)
+    assert fake_wlm.switcher_channel_calls == [1]
+    assert event_adapter.trigger_count == 2
+    assert lock._pid.calls == []
+    assert dac_calls == []
+
+    assert lock.write_voltage(1, -3.0) == 0.0
+    assert dac_calls == [(1, 0.0)]
+
+
+def test_channels_can_be_added_and_removed_at_runtime():
+    """Channels registered via add_channel become readable; removed ones raise KeyError."""
+    lock, fake_wlm, _event_adapter, _dac_calls = _make_single_channel_lock(
+        pid_voltage=0.0,
+        dac_limits=(0.0, 5.0),
+    )
+    fake_wlm._frequency_by_channel[2] = 461.31e12
+
+    lock.add_channel(ChannelConfig(logical_id=7, wlm_channel=2, dac_limits=(0.0, 5.0)))
+    assert lock.read_frequency(7) == pytest.approx(461.31e12)
+
+    assert lock.remove_channel(7) is True
+    assert lock.remove_channel(7) is False
+    with pytest.raises(KeyError):
+        lock.read_frequency(7)
+
+
 def test_event_adapter_uses_waitforwlmevent_when_available():
     """_EventAdapter should use WaitForWLMEvent and treat a matching event as ready."""
 